@@ -0,0 +1,36 @@
+# _env.py
+"""Environment of the benchmarks: a throwaway config & AI_DIR, with `src` importable."""
+import os
+import pathlib
+import sys
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def setup() -> pathlib.Path:
+    """Writes a config based on `config-example.py` into a temp AI_DIR & returns the dir."""
+    ai_dir = pathlib.Path(tempfile.mkdtemp(prefix="friday-bench-"))
+    config = (ROOT / "config-example.py").read_text()
+    config = config.replace(
+        'GOOGLE_API = "Your-Google-API-Gose-Here"', 'GOOGLE_API = "bench"'
+    )
+    config = config.replace(
+        'AI_DIR = "~/friday/"', f"AI_DIR = pathlib.Path({str(ai_dir)!r})"
+    )
+    path = ai_dir / "config.py"
+    path.write_text("import pathlib\n" + config)
+    os.environ["APP_CONFIG_PATH"] = str(path)
+    # main.py only starts the reloader without it
+    os.environ["WERKZEUG_RUN_MAIN"] = "true"
+    sys.path.insert(0, str(ROOT / "src"))
+    return ai_dir
+
+
+def percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    if not ordered:
+        return "n=0"
+    p50 = ordered[(len(ordered) - 1) * 50 // 100]
+    p95 = ordered[(len(ordered) - 1) * 95 // 100]
+    return f"n={len(ordered)} p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms"
@@ -0,0 +1,195 @@
+# chat_throughput.py
+"""
+Throughput of concurrent chat turns on the asyncio pipeline vs a thread per turn.
+
+A stub Gemini server (in a subprocess) streams every response as `CHUNKS` parts
+`CHUNK_DELAY` seconds apart. `CHATS` chats each take a turn at once:
+
+    async: `complete_chat` on the chat workers of the event loop, as `send_message` runs it.
+    threads: a thread per turn doing the same history work with the blocking client &
+        streaming loop, as the Socket.IO handler threads did before the event loop.
+
+The rate limiter is off (no RPM limits), the CPU time is the benchmark process' (not the
+server's) & the printed threads are the peak number alive.
+
+    python bench/chat_throughput.py
+"""
+import _env
+
+_env.setup()
+
+import asyncio
+import contextlib
+import io
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+CHATS = (10, 50, 200)
+CHUNKS = 20
+CHUNK_DELAY = 0.025
+MODEL = "Medium20"
+
+
+async def _serve_one(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    headers = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in headers.decode().split("\r\n"):
+        name, _, value = line.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n"
+    )
+    for idx in range(CHUNKS):
+        await asyncio.sleep(CHUNK_DELAY)
+        candidate: dict = {
+            "content": {"parts": [{"text": f"word {idx} "}], "role": "model"},
+            "index": 0,
+        }
+        if idx == CHUNKS - 1:
+            candidate["finishReason"] = "STOP"
+        writer.write(f"data: {json.dumps({'candidates': [candidate]})}\r\n\r\n".encode())
+        await writer.drain()
+    writer.close()
+
+
+def serve(sock: socket.socket):
+    """Runs the stub server on the listening socket `sock` forever."""
+
+    async def main():
+        server = await asyncio.start_server(_serve_one, sock=sock, backlog=1024)
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--serve"]:
+    serve(socket.socket(fileno=int(sys.argv[2])))
+    sys.exit()
+
+import config
+
+config.model_RPM_map.clear()
+
+from google import genai
+from google.genai import types
+
+import aioloop
+import main
+import ratelimit
+import session
+from main import Chat, Content, Message
+
+
+def threaded_turn(chat_id: str):
+    main.chat_history.append(Message([Content("hi")], "user", chat_id))
+    msg = Message([], "model", chat_id, processing=True)
+    main.chat_history.append(msg)
+    contents = main.chat_history.for_ai(msg, True, False, chat_id)
+    for chunk in main.client.models.generate_content_stream(
+        model=config.Models[MODEL].value,
+        contents=contents,  # type: ignore
+        config=types.GenerateContentConfig(temperature=config.CHAT_AI_TEMP),
+    ):
+        if chunk.text:
+            if msg.content and msg.content[-1].text is not None:
+                msg.content[-1].text += chunk.text
+            else:
+                msg.content.append(Content(chunk.text))
+            main.emit_msg_update(msg)
+    msg.processing = False
+    main.chat_history.setMsg(msg.id, msg)
+
+
+async def async_turns(chat_ids: list[str]):
+    await asyncio.gather(
+        *(
+            session.chat_workers.run(
+                session.GenerationContext(
+                    chat_id, None, session.Settings(MODEL, [], None)
+                ),
+                main.complete_chat("hi", chat_id),
+            )
+            for chat_id in chat_ids
+        )
+    )
+
+
+def run(mode: str, chats: int) -> tuple[float, float, int]:
+    """Wall & CPU time of `chats` concurrent turns & the peak number of threads."""
+    chat_ids = []
+    for _ in range(chats):
+        chat = Chat(f"{mode} {chats}")
+        main.chat_history.add_chat(chat)
+        chat_ids.append(chat.id)
+    peak = threading.active_count()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.01):
+            peak = max(peak, threading.active_count())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start, cpu = time.monotonic(), time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):  # the per turn model & tool logs
+        if mode == "async":
+            aioloop.run(async_turns(chat_ids))
+        else:
+            threads = [
+                threading.Thread(target=threaded_turn, args=(chat_id,))
+                for chat_id in chat_ids
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    elapsed, cpu = time.monotonic() - start, time.process_time() - cpu
+    done.set()
+    sampler.join()
+    failed = [
+        chat_id
+        for chat_id in chat_ids
+        if not any(
+            msg.role == "model" and msg.content and msg.content[-1].text == "".join(
+                f"word {idx} " for idx in range(CHUNKS)
+            )
+            for msg in main.chat_history.chat_messages(chat_id)
+        )
+    ]
+    if failed:
+        raise RuntimeError(f"{len(failed)} {mode} turns did not complete")
+    return elapsed, cpu, peak - 1  # without the sampler
+
+
+if __name__ == "__main__":
+    listener = socket.create_server(("127.0.0.1", 0), backlog=1024)
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(listener.fileno())],
+        pass_fds=[listener.fileno()],
+    )
+    try:
+        main.client = genai.Client(
+            api_key="bench",
+            http_options=types.HttpOptions(
+                base_url=f"http://127.0.0.1:{listener.getsockname()[1]}"
+            ),
+        )
+        ratelimit.limiter.install(main.client)
+        ideal = CHUNKS * CHUNK_DELAY
+        print(f"one response streams for {ideal:.2f}s")
+        for chats in CHATS:
+            for mode in ("threads", "async"):
+                elapsed, cpu, threads = run(mode, chats)
+                print(
+                    f"{chats:>4} chats {mode:>7}: {elapsed:.2f}s ({cpu:.2f}s CPU), "
+                    f"{chats / elapsed:.1f} turns/s, {threads} threads"
+                )
+    finally:
+        server.terminate()
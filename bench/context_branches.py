@@ -0,0 +1,94 @@
+# context_branches.py
+"""
+Time to build the AI context of one chat as the history grows more branches.
+
+Every branch (a chat under a random earlier chat) holds `BRANCH_MESSAGES` messages, the
+measured chat is a leaf with `CHAT_MESSAGES` of its own. `ChatHistory.for_ai` is timed
+with the whole chat fitting the token budget, & compared with selecting the messages by
+scanning the history with the recursive membership check it used before the per-chat
+index (slow, so only timed on the smaller histories).
+
+    python bench/context_branches.py
+"""
+import _env
+
+_env.setup()
+
+import random
+import time
+
+import config
+
+config.CONTEXT_TOKEN_BUDGET = 10**9  # everything verbatim, no summaries
+
+from main import Chat, ChatHistory, Content, Message
+
+BRANCHES = (100, 1_000, 5_000, 20_000)
+BRANCH_MESSAGES = 3
+CHAT_MESSAGES = (50, 200)
+REPEAT = 20
+
+
+def is_member(msg: Message, chat: Chat, chats: dict[str, Chat]) -> bool:
+    """Membership check as before the per-chat index."""
+    if msg.chat_id == chat.id:
+        return True
+    for child in chats.values():
+        if child.parent_id == chat.id and is_member(msg, child, chats):
+            return True
+    return False
+
+
+def build(branches: int, chat_messages: int) -> ChatHistory:
+    rnd = random.Random(branches)
+    chats = {"main": Chat("Main Chat", "main")}
+    ids = ["main"]
+    for i in range(branches):
+        chat = Chat(f"branch {i}", f"b{i}", rnd.choice(ids))
+        chats[chat.id] = chat
+        ids.append(chat.id)
+    chats["chat"] = Chat("measured", "chat", rnd.choice(ids))
+    owners = [chat_id for chat_id in ids for _ in range(BRANCH_MESSAGES)]
+    owners += ["chat"] * chat_messages
+    rnd.shuffle(owners)
+    history = ChatHistory()
+    history._chats = chats
+    history._messages = {}
+    for i, chat_id in enumerate(owners):
+        msg = Message([Content(f"message {i} " * 20)], rnd.choice(["user", "model"]), chat_id)
+        history._messages[msg.id] = msg
+    history._reindex()
+    return history
+
+
+def timed(fn) -> float:
+    fn()  # warm the per message caches
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT
+
+
+if __name__ == "__main__":
+    ai_msg = Message([], "model", "chat")
+    print(f"{'branches':>8} {'messages':>8} {'chat':>5} {'for_ai':>10} {'scan (before)':>14}")
+    for chat_messages in CHAT_MESSAGES:
+        for branches in BRANCHES:
+            history = build(branches, chat_messages)
+            current = timed(lambda: history.for_ai(ai_msg, True, False, "chat"))
+            scan = ""
+            if branches <= 1_000:
+                chats, chat = history._chats, history._chats["chat"]
+                before = timed(
+                    lambda: [
+                        content
+                        for msg in history._messages.values()
+                        if is_member(msg, chat, chats)
+                        for content in msg.for_ai(True, False, ai_msg)
+                    ]
+                )
+                scan = f"{before * 1000:.1f}ms"
+            print(
+                f"{branches:>8} {len(history._messages):>8} {chat_messages:>5} "
+                f"{current * 1000:>8.2f}ms {scan:>14}"
+            )
@@ -0,0 +1,107 @@
+# history_lookups.py
+"""
+Per call time of the ChatHistory lookups on a synthetic history of `MESSAGES` messages.
+
+Every 10th message has an attachment & every 10th (others) a function response with
+an inline image, like the Imagen tool's. `getImage` is timed with the Files API upload
+stubbed out, the scans are the linear lookups used before the id & attachment indexes.
+`setMsg` & `delete_message` also send their (unwatched) socket updates.
+
+    python bench/history_lookups.py
+"""
+import _env
+
+_env.setup()
+
+import random
+import time
+
+from google.genai import types
+
+from main import ChatHistory, Content, File, FunctionResponce, Message
+
+MESSAGES = 100_000
+CALLS = 1_000
+SCAN_CALLS = 20
+
+# no Files API: an image is sent by its id
+File.for_ai = lambda self, *args: types.Part(text=self.id)
+
+
+def build() -> tuple[ChatHistory, list[str], list[str]]:
+    history = ChatHistory()
+    history._messages = {}
+    msg_ids, file_ids = [], []
+    for i in range(MESSAGES):
+        content = [Content(f"message {i}")]
+        if i % 10 in (3, 7):
+            file = File(None, "image/png", f"{i}.png", hash="0" * 64, size=1024)
+            file_ids.append(file.id)
+            if i % 10 == 3:
+                content.append(Content(attachment=file))
+            else:
+                content.append(
+                    Content(
+                        function_response=FunctionResponce(
+                            name="Imagen", inline_data=[Content(attachment=file)]
+                        )
+                    )
+                )
+        msg = Message(content, "user" if i % 2 else "model", "main")
+        history._messages[msg.id] = msg
+        msg_ids.append(msg.id)
+    history._reindex()
+    return history, msg_ids, file_ids
+
+
+def scan_msg(history: ChatHistory, msg_id: str) -> Message:
+    for msg in history._messages.values():
+        if msg.id == msg_id:
+            return msg
+    raise ValueError(msg_id)
+
+
+def scan_image(history: ChatHistory, file_id: str) -> types.Part:
+    for msg in history._messages.values():
+        for item in msg.content:
+            if item.attachment and item.attachment.id == file_id:
+                return item.attachment.for_ai(True)
+            if item.function_response:
+                for inline in item.function_response.inline_data:
+                    if inline.attachment and inline.attachment.id == file_id:
+                        return inline.attachment.for_ai(True)
+    raise ValueError(file_id)
+
+
+def timed(name: str, fn, args: list) -> None:
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    per_call = (time.perf_counter() - start) / len(args)
+    print(f"{name:>22}: {per_call * 1e6:>10.1f}us/call")
+
+
+if __name__ == "__main__":
+    rnd = random.Random(0)
+    start = time.perf_counter()
+    history, msg_ids, file_ids = build()
+    print(
+        f"{len(history)} messages, {len(file_ids)} files, "
+        f"built & indexed in {time.perf_counter() - start:.1f}s"
+    )
+
+    timed("getMsg", history.getMsg, rnd.choices(msg_ids, k=CALLS))
+    timed("getMsg (scan)", lambda id: scan_msg(history, id), rnd.choices(msg_ids, k=SCAN_CALLS))
+    timed("getImage", history.getImage, rnd.choices(file_ids, k=CALLS))
+    timed(
+        "getImage (scan)",
+        lambda id: scan_image(history, id),
+        rnd.choices(file_ids, k=SCAN_CALLS),
+    )
+    timed(
+        "setMsg",
+        lambda id: history.setMsg(id, Message([Content("edited")], "user", "main", id=id)),
+        rnd.sample(msg_ids, CALLS),
+    )
+    timed("delete_message", history.delete_message, rnd.sample(msg_ids, CALLS))
+    print(f"{len(history)} messages left")
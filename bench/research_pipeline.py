@@ -0,0 +1,108 @@
+# research_pipeline.py
+"""
+Wall time of a DeepResearch with a fixed topic budget, pipelined vs in lockstep phases.
+
+Stub backends: generating a topic's queries takes 0.2s, a search 0.3s & returns 4 urls, a
+page fetch takes 0.2-3s with a long tail like real pages, counting the tree's tokens
+takes 0.3s & the planner thinks for 1s then adds a topic every 0.5s (3 per plan).
+`lockstep` is the research loop from before the pipeline: fetch every unresearched topic,
+wait for the slowest page, count the tokens, plan, repeat. The pipeline runs with the
+configured `RESEARCH_PLANNER_MAX_STALENESS` & with 1s.
+
+    python bench/research_pipeline.py
+"""
+import _env
+
+_env.setup()
+
+import concurrent.futures
+import random
+import threading
+import time
+
+import config
+from tools.deepresearch import DeepResearcher, Topic
+
+MAX_TOPICS = 5
+SEEDS = 3
+
+
+class StubResearcher(DeepResearcher):
+    def __init__(self, seed: int):
+        super().__init__("root", max_topics=MAX_TOPICS)
+        self.rnd = random.Random(seed)
+        self.rnd_lock = threading.Lock()
+
+    def _generate_queries(self, topic: str) -> list[str]:
+        time.sleep(0.2)
+        return [f"{topic} q{idx}" for idx in range(self.max_search_queries)]
+
+    def _search_online(self, query: str) -> list[str]:
+        time.sleep(0.3)
+        return [f"https://example.com/{query.replace(' ', '_')}/{idx}" for idx in range(4)]
+
+    def fetch_url(self, url: str, wait_for: int = 4000):
+        with self.rnd_lock:
+            delay = 0.2 + 2.8 * self.rnd.random() ** 3
+        time.sleep(delay)
+        return {"markdown": "x" * 2000, "links": [], "url_display_info": {"url": url}}
+
+    def analyse_add_topic(self, use_thinking: bool, thinking_id: str) -> None:
+        time.sleep(1.0)
+        for _ in range(3):
+            time.sleep(0.5)
+            self.topic.add_topic(self.topic.id, Topic(f"t{len(self.topic.sub_topics)}"))
+
+    def _generate_report(self):
+        return []
+
+
+class LockstepResearcher(StubResearcher):
+    def research(self):
+        """`DeepResearcher.research` as before the pipeline."""
+        visited_urls: set[str] = set()
+        failed_urls: set[str] = set()
+        depth = 0
+        while unresearched := self.topic.get_unresearched_topic():
+            with concurrent.futures.ThreadPoolExecutor(min(6, len(unresearched))) as executor:
+                for future in [
+                    executor.submit(self._search_and_fetch, topic, visited_urls, failed_urls)
+                    for topic in unresearched
+                ]:
+                    future.result()
+            depth += 1
+            if depth >= (self.max_topics or float("inf")):
+                break
+            time.sleep(0.3)  # count_tokens of the whole tree
+            self.analyse_add_topic(True, "")
+        return self._generate_report()
+
+
+def topics(topic: Topic) -> int:
+    return 1 + sum(topics(sub) for sub in topic.sub_topics)
+
+
+def pages(topic: Topic) -> int:
+    return len(topic.fetched_content or []) + sum(pages(sub) for sub in topic.sub_topics)
+
+
+def run(name: str, cls: type[StubResearcher]):
+    times = []
+    for seed in range(SEEDS):
+        researcher = cls(seed)
+        start = time.monotonic()
+        researcher.research()
+        times.append(time.monotonic() - start)
+        print(
+            f"{name:>22} seed={seed}: {times[-1]:.1f}s, "
+            f"{topics(researcher.topic)} topics, {pages(researcher.topic)} pages"
+        )
+    print(f"{name:>22} mean: {sum(times) / len(times):.1f}s")
+
+
+if __name__ == "__main__":
+    print(f"max_topics={MAX_TOPICS}")
+    run("lockstep", LockstepResearcher)
+    for staleness in (config.RESEARCH_PLANNER_MAX_STALENESS, 1.0):
+        config.RESEARCH_PLANNER_MAX_STALENESS = staleness
+        run(f"pipelined, staleness={staleness:g}s", StubResearcher)
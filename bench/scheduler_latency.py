@@ -0,0 +1,140 @@
+# scheduler_latency.py
+"""
+p50/p95 latency of chat turns while deep research runs, on plain thread pools (as before
+the scheduler) & on the scheduler.
+
+Stub backends: a search sleeps 0.3s, a page fetch sleeps 0.1-0.6s & parses for 10ms of
+CPU, a Gemini request waits for the rate limiter & sleeps 0.25s. A chat turn assembles
+its context (5ms of CPU) & makes 2 requests at interactive priority (as since the rate
+limiter) every `TURN_INTERVAL` seconds while `RESEARCHES` researches run with the
+lanes of `DeepResearcher` (6 topics, 32 fetches & 10 summaries at once each). The last
+run turns off holding back background jobs, leaving only the worker cap & queue order.
+
+    python bench/scheduler_latency.py
+"""
+import _env
+
+_env.setup()
+
+import concurrent.futures
+import contextlib
+import random
+import threading
+import time
+
+import config
+
+MODEL = "bench-model"
+config.model_RPM_map[MODEL] = 240
+
+import ratelimit
+from ratelimit import Priority
+from scheduler import scheduler
+
+RESEARCHES = 3
+TURNS = 40
+TURN_INTERVAL = 1.0
+
+
+def cpu(ms: float):
+    """Holds the GIL for `ms` milliseconds of this thread's CPU time."""
+    end = time.thread_time() + ms / 1000
+    while time.thread_time() < end:
+        pass
+
+
+class Run:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.limiter = ratelimit.RateLimiter()
+        self.stop = threading.Event()
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def executor(self, workers: int) -> concurrent.futures.Executor:
+        if self.mode == "threads":
+            return concurrent.futures.ThreadPoolExecutor(workers)
+        return scheduler.executor(workers)
+
+    def waiting(self):
+        if self.mode == "threads":
+            return contextlib.nullcontext()
+        return scheduler.waiting()
+
+    def generate(self):
+        self.limiter.acquire(MODEL)
+        time.sleep(0.25)
+
+    def fetch(self, rnd: random.Random):
+        time.sleep(0.1 + 0.5 * rnd.random())
+        cpu(10)
+        with self.lock:
+            self.pages += 1
+
+    def topic(self, seed: int):
+        rnd = random.Random(seed)
+        with self.waiting(), self.executor(32) as fetches:
+            searches = []
+            for _ in range(2):
+                time.sleep(0.3)
+                searches.extend(fetches.submit(self.fetch, rnd) for _ in range(4))
+            concurrent.futures.wait(searches)
+
+    def research(self, origin: str):
+        with ratelimit.priority(Priority.BACKGROUND, origin=origin):
+            with self.executor(6) as topics, self.executor(10) as summaries:
+                seed = 0
+                running = set()
+                while not self.stop.is_set():
+                    while len(running) < 6:
+                        seed += 1
+                        running.add(topics.submit(self.topic, seed))
+                    done, running = concurrent.futures.wait(
+                        running, timeout=0.1, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for _ in done:
+                        summaries.submit(self.generate)
+
+    def turn(self, origin: str) -> float:
+        start = time.monotonic()
+        with ratelimit.priority(Priority.INTERACTIVE, origin=origin):
+            cpu(5)
+            self.generate()
+            self.generate()
+        return time.monotonic() - start
+
+    def run(self, researches: int) -> tuple[list[float], float]:
+        threads = [
+            threading.Thread(target=self.research, args=(f"research-{i}",), daemon=True)
+            for i in range(researches)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(2 if researches else 0)  # let the research ramp up
+        pages, start = self.pages, time.monotonic()
+        latencies = []
+        for i in range(TURNS):
+            latencies.append(self.turn(f"chat-{i % 3}"))
+            time.sleep(max(0.0, TURN_INTERVAL - latencies[-1]))
+        rate = (self.pages - pages) / (time.monotonic() - start)
+        self.stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, rate
+
+
+if __name__ == "__main__":
+    print(
+        f"{TURNS} chat turns, {RESEARCHES} researches, max_workers={scheduler.max_workers}, "
+        f"max_defer={scheduler.max_defer}s"
+    )
+    max_defer = scheduler.max_defer
+    for name, mode, researches, defer in (
+        ("idle", "threads", 0, max_defer),
+        ("threads", "threads", RESEARCHES, max_defer),
+        ("scheduler", "scheduler", RESEARCHES, max_defer),
+        ("scheduler, max_defer=0", "scheduler", RESEARCHES, 0),
+    ):
+        scheduler.max_defer = defer
+        latencies, rate = Run(mode).run(researches)
+        print(f"{name:>22}: turn {_env.percentiles(latencies)}, research {rate:.1f} pages/s")
@@ -0,0 +1,97 @@
+# topic_render.py
+"""
+Cost of rendering a DeepResearch topic tree per research iteration as it grows.
+
+Every iteration adds a subtopic with `PAGES_PER_TOPIC` fetched pages (~`PAGE_CHARS`
+characters of markdown & 40 links each) under a random topic, & marks another topic
+researched, like a planner step & a fetch round. The tree is then rendered like
+`DeepResearcher.research` does: `for_ai()` for the planner & `char_count()` for the
+token estimate. It is compared with the recursive `+=` rendering from before the cache.
+
+    python bench/topic_render.py
+"""
+import _env
+
+_env.setup()
+
+import random
+import time
+
+from tools.deepresearch import Topic
+
+TOPICS = 100
+PAGES_PER_TOPIC = 8
+PAGE_CHARS = 5_000
+REPORT_EVERY = 20
+
+
+def render_before(topic: Topic, depth: int = 0, include_details: bool = True) -> str:
+    """`Topic.for_ai` as before the cache."""
+    header = "#" * (depth + 1)
+    details = f"{header} {topic.topic}\n\n"
+    if include_details:
+        details += f"{"This is the main Topic/Question Searched by user." if not depth else ""}\n"
+        details += f"**ID:** {topic.id}\n"
+        details += f"**Researched:** {'Yes' if topic.researched else 'No'}  \n\n"
+    if include_details and topic.queries:
+        details += f"#{header} Queries Searched online: \n"
+        for query in topic.queries:
+            details += f"- {query}\n"
+        details += "\n"
+    if topic.sumarized_fetched_content:
+        details += f"#{header} Sumarized Fetched Content:\n"
+    if topic.fetched_content:
+        details += f"#{header} {"Additional" if topic.sumarized_fetched_content else ""} Fetched Content:\n"
+        for url, markdown, links, link_info in topic.fetched_content:
+            details += f"- {url}:\n```md\n{markdown}\nExtracted Linkes in Webpage:\n{"\n".join(links)}```\n\n"
+    if include_details and topic.sub_topics:
+        details += f"#{header} Subtopics:\n"
+        for sub in topic.sub_topics:
+            details += render_before(sub, depth + 1) + "\n"
+    return details
+
+
+def page(rnd: random.Random, idx: int) -> tuple[str, str, list[str], dict]:
+    words = " ".join(
+        rnd.choice(("lorem", "ipsum", "dolor", "sit", "amet")) for _ in range(PAGE_CHARS // 6)
+    )
+    links = [f"https://example.com/{idx}/{link}" for link in range(40)]
+    return (f"https://example.com/{idx}", words, links, {})
+
+
+if __name__ == "__main__":
+    rnd = random.Random(0)
+    root = Topic("What is the meaning of lorem ipsum?", queries=["lorem ipsum meaning"])
+    topics = [root]
+    pages = 0
+    render_time = count_time = before_time = 0.0
+    print(
+        f"{'pages':>6} {'chars':>10} {'for_ai':>10} {'char_count':>10} {'before':>10}"
+        "   (per iteration)"
+    )
+    for iteration in range(1, TOPICS + 1):
+        topic = Topic(f"subtopic {iteration}", queries=[f"query {iteration}"])
+        root.add_topic(rnd.choice(topics).id, topic)
+        topic.fetched_content = [page(rnd, pages + idx) for idx in range(PAGES_PER_TOPIC)]
+        pages += PAGES_PER_TOPIC
+        topics.append(topic)
+        rnd.choice(topics).researched = True
+
+        start = time.perf_counter()
+        chars = root.char_count()
+        count_time += time.perf_counter() - start
+        start = time.perf_counter()
+        rendered = root.for_ai()
+        render_time += time.perf_counter() - start
+        start = time.perf_counter()
+        before = render_before(root)
+        before_time += time.perf_counter() - start
+        assert rendered == before and chars == len(before)
+
+        if iteration % REPORT_EVERY == 0:
+            print(
+                f"{pages:>6} {chars:>10} {render_time / REPORT_EVERY * 1000:>8.2f}ms "
+                f"{count_time / REPORT_EVERY * 1000:>8.3f}ms "
+                f"{before_time / REPORT_EVERY * 1000:>8.2f}ms"
+            )
+            render_time = count_time = before_time = 0.0
@@ -50,6 +50,21 @@ model_RPM_map = {
     "gemini-1.5-flash-002": 15,
     "gemini-1.5-flash-8b-001": 15,
 }
+# RPM of models missing from `model_RPM_map` (None for not any limit), aliases without the
+# version suffix (e.g. gemini-2.0-flash for gemini-2.0-flash-001) share their listed model's limit
+DEFAULT_RPM = None
+# Requests per day limit, models missing here have no daily limit
+model_RPD_map = {
+    "gemini-2.5-pro-exp-03-25": 50,
+    "gemini-2.5-flash-preview-04-17": 500,
+    "gemini-2.0-pro-exp-02-05": 50,
+    "gemini-2.0-flash-001": 1500,
+    "gemini-2.0-flash-thinking-exp-01-21": 1500,
+    "gemini-2.0-flash-lite-001": 1500,
+    "gemini-1.5-pro-002": 50,
+    "gemini-1.5-flash-002": 1500,
+    "gemini-1.5-flash-8b-001": 1500,
+}
 
 SearchGroundingSuportedModels = [
     Models.Large25.name,
@@ -133,5 +148,71 @@ ABOUT_MODELS = """\
 
 CHAT_AI_TEMP: float = 0.2
 
+# Chat history is journaled, every change is appended to `chat_history.journal` &
+# compacted into `chat_history.json` after this many changes
+CHAT_HISTORY_COMPACT_EVERY: int = 500
+CHAT_HISTORY_FSYNC: bool = True  # fsync every journal record (survives power loss)
+
+# Streamed message updates only carry the changes, every this many updates the full message is resent
+MSG_DELTA_RESYNC_EVERY: int = 200
+MSG_UPDATE_RATE: float = 30  # max updates per second sent for a message being generated
+
+MAX_UPLOAD_SIZE: int = 2 * 1024**3  # bytes, 2GB is the Gemini Files API limit
+UPLOAD_TIMEOUT: float = 60  # seconds a message waits for its attachments to finish uploading
+FILE_UPLOAD_WORKERS: int = 4  # attachments uploaded to the Gemini Files API in parallel
+# Uploaded attachments expire after 48h, those of chats active in the last `ACTIVE_CHAT_WINDOW`
+# hours are re-uploaded `ATTACHMENT_REFRESH_LEAD` minutes before they expire
+ACTIVE_CHAT_WINDOW: float = 48
+ATTACHMENT_REFRESH_LEAD: float = 30
+
+# With the model and/or tools on "Auto", selections are reused for similar turns for this many seconds
+SELECTION_CACHE_TTL: float = 600
+# Model chosen for short & simple requests without asking `MODEL_TOOL_SELECTOR`, e.g.
+# `Models.Medium20.name`. None (the default) turns this off: the selector is always asked
+HEURISTIC_MODEL: str | None = None
+# The selector model only sees the last few messages, within this many (estimated) tokens
+SELECTOR_CONTEXT_MESSAGES: int = 6
+SELECTOR_CONTEXT_TOKENS: int = 4000
+
+# Chats longer than `CONTEXT_TOKEN_BUDGET` (estimated) tokens only send their latest messages as is
+# (at least `CONTEXT_MIN_RECENT_MESSAGES`), older ones are replaced by a rolling summary made in the
+# background by `SUMMARY_MODEL`, not yet summarized ones are sent as text within `CONTEXT_TRANSCRIPT_TOKENS`
+CONTEXT_TOKEN_BUDGET: int = 200_000
+CONTEXT_MIN_RECENT_MESSAGES: int = 6
+CONTEXT_TRANSCRIPT_TOKENS: int = 8000
+SUMMARY_MODEL: str = MODEL_TOOL_SELECTOR
+SUMMARY_INPUT_TOKENS: int = 100_000  # transcript summarized per call
+
+# Background jobs (deep research, summaries, mail polling) wait while a chat turn is running,
+# but at most this many seconds
+SCHEDULER_MAX_DEFER: float = 30
+# Scheduler jobs running at once, the rest wait in priority order (the steps of chat
+# turns themselves are not limited)
+SCHEDULER_MAX_WORKERS: int = 16
+
+# Unanswered permission requests of the computer tool are denied after this many seconds
+PERMISSION_TIMEOUT: float = 300
+# Operations of the computer tool approved without asking, `fnmatch` patterns per action.
+# Actions: run_command, run_command_background, create_file, create_folder, delete_file,
+# delete_folder, read_file, write_file, send_stdin, kill_process, send_ctrl_c.
+# Commands with shell metacharacters (; & | $ > ...) & paths outside the sandbox are always asked.
+# e.g. {"read_file": ["*"], "run_command": ["ls", "pwd", "python --version", "pip list"]}
+PERMISSION_ALLOWLIST: dict[str, list[str]] = {}
+
+# Fetched web pages are cached on disk (in `AI_DIR/page_cache`) & reused for this many seconds,
+# then revalidated with the site when it supports it; least recently used pages are evicted
+# once the cache is larger than `PAGE_CACHE_MAX_SIZE` bytes
+PAGE_CACHE_TTL: float = 24 * 60 * 60
+PAGE_CACHE_MAX_SIZE: int = 512 * 1024**2
+
+# DuckDuckGo results are reused for queries with the same words (ignoring case, punctuation & stopwords)
+# for this many seconds, keeping at most `SEARCH_CACHE_SIZE` queries
+SEARCH_CACHE_TTL: float = 6 * 60 * 60
+SEARCH_CACHE_SIZE: int = 1000
+
+# Deep research plans new topics while others are still being fetched, waiting for them at most
+# this many seconds after the first result the planner has not seen yet
+RESEARCH_PLANNER_MAX_STALENESS: float = 10
+
 if "Your-Google-API-Gose-Here" == GOOGLE_API:
     raise AssertionError("Set Your Google API first")
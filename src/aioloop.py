@@ -0,0 +1,66 @@
+# aioloop.py
+import asyncio
+import concurrent.futures
+import contextvars
+import sys
+import threading
+import traceback
+from typing import Any, Callable, Coroutine, Optional, TypeVar
+
+from ratelimit import Priority, current_priority
+from scheduler import scheduler
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+# Blocking steps of coroutines (tools, context assembly, ...) run on the scheduler with the coroutine's priority,
+# not counted as active work again as the awaiting coroutine is, & without waiting for a slot if they are
+# steps of a chat turn
+_lanes = {
+    value: scheduler.executor(
+        sys.maxsize, value, counted=False, capped=value == Priority.BACKGROUND
+    )
+    for value in Priority
+}
+
+
+def loop() -> asyncio.AbstractEventLoop:
+    """The dedicated event loop, started on a daemon thread on first use."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+        return _loop
+
+
+def submit(coro: Coroutine[Any, Any, T]) -> concurrent.futures.Future[T]:
+    """Schedules a coroutine on the event loop from any thread."""
+    return asyncio.run_coroutine_threadsafe(coro, loop())
+
+
+def run(coro: Coroutine[Any, Any, T]) -> T:
+    """Runs a coroutine on the event loop & blocks the calling (non loop) thread until it is done."""
+    return submit(coro).result()
+
+
+def spawn(coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+    """Schedules a coroutine nobody waits for, printing its exception if it fails."""
+
+    def report(future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is not None:
+            traceback.print_exception(future.exception())
+
+    future = submit(coro)
+    future.add_done_callback(report)
+    return future
+
+
+async def offload(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking function on the scheduler with the calling task's priority & context."""
+    ctx = contextvars.copy_context()
+    return await asyncio.wrap_future(
+        _lanes[current_priority()].submit(ctx.run, fn, *args, **kwargs)
+    )
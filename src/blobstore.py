@@ -0,0 +1,93 @@
+# blobstore.py
+import hashlib
+import mmap
+import os
+import pathlib
+import tempfile
+import config
+
+
+class BlobStore:
+    """
+    Content-addressed, write-once store for attachment bytes.
+
+    Blobs are keyed by the SHA-256 of their content, so the same file attached in
+    multiple messages (or branches of the chat tree) is stored only once.
+
+    Attributes:
+        root (pathlib.Path): Directory holding the blobs as `<root>/<hash[:2]>/<hash>`.
+    """
+
+    root: pathlib.Path
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+
+    @staticmethod
+    def is_valid_hash(digest: str) -> bool:
+        return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest)
+
+    def path(self, digest: str) -> pathlib.Path:
+        if not self.is_valid_hash(digest):
+            raise ValueError(f"Invalid blob hash `{digest}`")
+        return self.root / digest[:2] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def put(self, content: bytes) -> str:
+        """Stores `content` if not already present & returns its hash."""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.path(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file first so a crash never leaves a partial blob behind
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def temp_file(self) -> tuple[int, str]:
+        """Creates a temp file inside the store (so `put_file` is a rename), returns (fd, path)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+
+    def put_file(self, tmp_path: str) -> str:
+        """Moves the file at `tmp_path` (from `temp_file`) into the store & returns its hash."""
+        sha256 = hashlib.sha256()
+        with open(tmp_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        path = self.path(digest)
+        if path.exists():
+            os.unlink(tmp_path)
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    def view(self, digest: str) -> memoryview:
+        """
+        Zero-copy, read-only view of a blob backed by a memory map.
+
+        Pages are only read from disk when the view is actually accessed & can be
+        evicted by the OS again, so holding views does not keep the blob resident.
+        """
+        with open(self.path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"")  # empty files can't be mapped
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+blobs = BlobStore(config.AI_DIR / "blobs")
@@ -38,9 +38,44 @@ RETRY_DELAY: int | float = config_module.RETRY_DELAY
 MODEL_TOOL_SELECTOR: str = config_module.MODEL_TOOL_SELECTOR
 Models: Type[enum.Enum] = config_module.Models
 model_RPM_map: dict[str, int] = config_module.model_RPM_map
+model_RPD_map: dict[str, int] = getattr(config_module, "model_RPD_map", {})
+DEFAULT_RPM: Optional[int] = getattr(config_module, "DEFAULT_RPM", None)
 SearchGroundingSuportedModels: list[str] = config_module.SearchGroundingSuportedModels
 ToolSuportedModels: list[str] = config_module.ToolSuportedModels
 DynamicThinkingModels: list[str] = config_module.DynamicThinkingModels
 ModelsSet: list[str] = config_module.ModelsSet
 ABOUT_MODELS: str = config_module.ABOUT_MODELS
 CHAT_AI_TEMP: float = config_module.CHAT_AI_TEMP
+CHAT_HISTORY_COMPACT_EVERY: int = getattr(
+    config_module, "CHAT_HISTORY_COMPACT_EVERY", 500
+)
+CHAT_HISTORY_FSYNC: bool = getattr(config_module, "CHAT_HISTORY_FSYNC", True)
+MSG_DELTA_RESYNC_EVERY: int = getattr(config_module, "MSG_DELTA_RESYNC_EVERY", 200)
+MSG_UPDATE_RATE: float = getattr(config_module, "MSG_UPDATE_RATE", 30)
+MAX_UPLOAD_SIZE: int = getattr(config_module, "MAX_UPLOAD_SIZE", 2 * 1024**3)
+UPLOAD_TIMEOUT: float = getattr(config_module, "UPLOAD_TIMEOUT", 60)
+FILE_UPLOAD_WORKERS: int = getattr(config_module, "FILE_UPLOAD_WORKERS", 4)
+ACTIVE_CHAT_WINDOW: float = getattr(config_module, "ACTIVE_CHAT_WINDOW", 48)
+ATTACHMENT_REFRESH_LEAD: float = getattr(config_module, "ATTACHMENT_REFRESH_LEAD", 30)
+SELECTION_CACHE_TTL: float = getattr(config_module, "SELECTION_CACHE_TTL", 600)
+HEURISTIC_MODEL: Optional[str] = getattr(config_module, "HEURISTIC_MODEL", None)
+SELECTOR_CONTEXT_MESSAGES: int = getattr(config_module, "SELECTOR_CONTEXT_MESSAGES", 6)
+SELECTOR_CONTEXT_TOKENS: int = getattr(config_module, "SELECTOR_CONTEXT_TOKENS", 4000)
+CONTEXT_TOKEN_BUDGET: int = getattr(config_module, "CONTEXT_TOKEN_BUDGET", 200_000)
+CONTEXT_MIN_RECENT_MESSAGES: int = getattr(config_module, "CONTEXT_MIN_RECENT_MESSAGES", 6)
+CONTEXT_TRANSCRIPT_TOKENS: int = getattr(config_module, "CONTEXT_TRANSCRIPT_TOKENS", 8000)
+SUMMARY_MODEL: str = getattr(config_module, "SUMMARY_MODEL", MODEL_TOOL_SELECTOR)
+SUMMARY_INPUT_TOKENS: int = getattr(config_module, "SUMMARY_INPUT_TOKENS", 100_000)
+SCHEDULER_MAX_DEFER: float = getattr(config_module, "SCHEDULER_MAX_DEFER", 30)
+SCHEDULER_MAX_WORKERS: int = getattr(config_module, "SCHEDULER_MAX_WORKERS", 16)
+PERMISSION_TIMEOUT: float = getattr(config_module, "PERMISSION_TIMEOUT", 300)
+PERMISSION_ALLOWLIST: dict[str, list[str]] = getattr(
+    config_module, "PERMISSION_ALLOWLIST", {}
+)
+PAGE_CACHE_TTL: float = getattr(config_module, "PAGE_CACHE_TTL", 24 * 60 * 60)
+PAGE_CACHE_MAX_SIZE: int = getattr(config_module, "PAGE_CACHE_MAX_SIZE", 512 * 1024**2)
+SEARCH_CACHE_TTL: float = getattr(config_module, "SEARCH_CACHE_TTL", 6 * 60 * 60)
+SEARCH_CACHE_SIZE: int = getattr(config_module, "SEARCH_CACHE_SIZE", 1000)
+RESEARCH_PLANNER_MAX_STALENESS: float = getattr(
+    config_module, "RESEARCH_PLANNER_MAX_STALENESS", 10
+)
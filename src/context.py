@@ -0,0 +1,187 @@
+# context.py
+import json
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import tokens
+from ratelimit import Priority
+from scheduler import scheduler
+
+if TYPE_CHECKING:
+    from main import Message
+
+# Background work of the context assembly: exact token counts & summaries
+context_worker = scheduler.executor(2, Priority.BACKGROUND)
+
+
+def estimate_message(msg: "Message") -> int:
+    """Local estimate of the tokens of a message as sent to the model."""
+    total = 0
+    for content in msg.content:
+        if content.text:
+            total += tokens.estimate(content.text)
+        elif content.attachment:
+            total += tokens.estimate_attachment(
+                content.attachment.type, content.attachment.size
+            )
+        elif content.function_call:
+            total += tokens.estimate(json.dumps(content.function_call.args))
+        elif content.function_response:
+            total += tokens.estimate(json.dumps(content.function_response.response))
+            for inline in content.function_response.inline_data:
+                if inline.text:
+                    total += tokens.estimate(inline.text)
+                elif inline.attachment:
+                    total += tokens.estimate_attachment(
+                        inline.attachment.type, inline.attachment.size
+                    )
+    return total
+
+
+class TokenCounter:
+    """
+    Token counts of messages.
+
+    Messages are estimated locally, messages with attachments (which are hard to
+    estimate) get their exact count from `count_exact` (e.g. `count_tokens`) computed in
+    the background & cached until the message changes. The cache holds the messages
+    weakly, so the counts of deleted & replaced messages go with them.
+    """
+
+    def __init__(self, count_exact: Callable[["Message"], int]):
+        self.count_exact = count_exact
+        # msg -> (version, tokens)
+        self._exact: weakref.WeakKeyDictionary["Message", tuple[int, int]] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+
+    def count(self, msg: "Message") -> int:
+        with self._lock:
+            exact = self._exact.get(msg)
+            if exact is not None and exact[0] == msg.version:
+                return exact[1]
+            # only worth an API call when the message has attachments, which have to
+            # be uploaded already so that counting does not trigger uploads
+            attachments = list(msg.attachments())
+            if (
+                not msg.processing
+                and attachments
+                and not any(attachment.needs_upload for attachment in attachments)
+                and msg.id not in self._pending
+            ):
+                self._pending.add(msg.id)
+                context_worker.submit(self._count_exact, msg)
+        return msg.estimate_tokens()
+
+    def _count_exact(self, msg: "Message"):
+        version = msg.version
+        try:
+            count = self.count_exact(msg)
+            with self._lock:
+                self._exact[msg] = (version, count)
+        except Exception as e:
+            print(f"Error counting tokens of message {msg.id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(msg.id)
+
+
+class Summaries:
+    """
+    Rolling summaries of the older part of chats, generated in the background.
+
+    A chat's summary covers its messages up to (including) the `upto` message id, it is
+    extended with newer messages by summarizing the previous summary & those messages.
+
+    Attributes:
+        summarize (Callable[[Optional[str], str], str]): Summarizes a transcript, given the previous summary.
+        max_input_tokens (int): Max (estimated) tokens of transcript summarized at once.
+    """
+
+    summarize: Callable[[Optional[str], str], str]
+    max_input_tokens: int
+
+    def __init__(
+        self, summarize: Callable[[Optional[str], str], str], max_input_tokens: int
+    ):
+        self.summarize = summarize
+        self.max_input_tokens = max_input_tokens
+        self.filepath: Optional[str] = None
+        self._summaries: dict[str, dict[str, str]] = {}  # chat id -> {"upto", "text"}
+        self._in_progress: set[str] = set()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: str) -> Optional[dict[str, str]]:
+        with self._lock:
+            return self._summaries.get(chat_id)
+
+    def extend_async(
+        self,
+        chat_id: str,
+        previous: Optional[dict[str, str]],
+        transcripts: list[tuple[str, str]],
+    ) -> None:
+        """
+        Extends the summary of the chat with `transcripts` in the background.
+
+        Args:
+            previous: The summary the transcripts follow, None to start a new one.
+            transcripts: (message id, text) of the messages to add, in order.
+        """
+        with self._lock:
+            if chat_id in self._in_progress or not transcripts:
+                return
+            self._in_progress.add(chat_id)
+        context_worker.submit(self._extend, chat_id, previous, transcripts)
+
+    def _extend(
+        self,
+        chat_id: str,
+        previous: Optional[dict[str, str]],
+        transcripts: list[tuple[str, str]],
+    ):
+        text = previous["text"] if previous else None
+        try:
+            # summarize in chunks so that a long backlog fits the summary model
+            chunk: list[str] = []
+            chunk_tokens = 0
+            for idx, (msg_id, transcript) in enumerate(transcripts):
+                chunk.append(transcript)
+                chunk_tokens += tokens.estimate(transcript)
+                if chunk_tokens >= self.max_input_tokens or idx == len(transcripts) - 1:
+                    text = self.summarize(
+                        text,
+                        tokens.truncate("\n\n".join(chunk), self.max_input_tokens),
+                    )
+                    with self._lock:
+                        self._summaries[chat_id] = {"upto": msg_id, "text": text}
+                    chunk, chunk_tokens = [], 0
+            if self.filepath:
+                self.save_to_json(self.filepath)
+        except Exception as e:
+            print(f"Error summarizing chat {chat_id}: {e}")
+        finally:
+            with self._lock:
+                self._in_progress.discard(chat_id)
+
+    def save_to_json(self, filepath: str):
+        with self._lock:
+            data = dict(self._summaries)
+        with open(filepath, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def load_from_json(self, filepath: str):
+        """Loads the summaries & keeps saving them to `filepath` as they are updated."""
+        self.filepath = filepath
+        try:
+            with open(filepath, "r") as f:
+                data: dict[str, Any] = json.load(f)
+            with self._lock:
+                self._summaries = data
+        except FileNotFoundError:
+            print("Summaries file not found. Starting without summaries.")
+        except json.JSONDecodeError:
+            print("Error decoding summaries file. Starting without summaries.")
@@ -0,0 +1,206 @@
+# delta.py
+import json
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+def normalize(data: Any) -> Any:
+    """Detached copy of `data` as a JSON receiver sees it (tuples -> lists, ...)."""
+    return json.loads(json.dumps(data))
+
+
+def diff(old: Any, new: Any, path: list[str | int] | None = None) -> list[dict[str, Any]]:
+    """
+    Computes the operations that turn the JSON value `old` into `new`.
+
+    Operations (applied in order, `path` is the list of keys/indexes from the root):
+        `{"op": "set", "path": p, "value": v}`: replace the value at `p` (the root if `p` is empty).
+        `{"op": "del", "path": p}`: remove the key `p[-1]` from the object at `p[:-1]`.
+        `{"op": "append_text", "path": p, "text": t}`: append `t` to the string at `p`.
+        `{"op": "extend", "path": p, "items": l}`: append the items `l` to the list at `p`.
+        `{"op": "truncate", "path": p, "length": n}`: cut the list at `p` down to `n` items.
+    """
+    path = path or []
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: list[dict[str, Any]] = [
+            {"op": "del", "path": path + [key]} for key in old if key not in new
+        ]
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff(old[key], value, path + [key]))
+            else:
+                ops.append({"op": "set", "path": path + [key], "value": value})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        if len(new) < len(old):
+            ops.append({"op": "truncate", "path": path, "length": len(new)})
+        for idx in range(min(len(old), len(new))):
+            ops.extend(diff(old[idx], new[idx], path + [idx]))
+        if len(new) > len(old):
+            ops.append({"op": "extend", "path": path, "items": new[len(old) :]})
+        return ops
+    if isinstance(old, str) and isinstance(new, str) and new.startswith(old):
+        return [{"op": "append_text", "path": path, "text": new[len(old) :]}]
+    return [{"op": "set", "path": path, "value": new}]
+
+
+class DeltaStream:
+    """
+    Streams changes of keyed JSON documents (e.g. messages) as deltas.
+
+    For every key the last sent state is remembered & each `push` emits only the
+    operations from `diff` as `{"id": key, "seq": n, "ops": [...]}`. `seq` increases by
+    one per emitted payload so a receiver can detect a gap & ask for a `resync`, which
+    (like every `resync_every`-th push) emits the whole document as
+    `{"id": key, "seq": n, "snapshot": {...}}`.
+
+    Documents are passed as returned by `normalize`, taken while nothing changes them
+    (e.g. under the lock of their message) & not changed afterwards.
+
+    Only documents that are still changing need to be tracked: a push with `keep=False`
+    (e.g. the last one of a generated message) drops the key's state, & a push of a key
+    that is not tracked sends the whole document.
+
+    Attributes:
+        emit (Callable[[dict[str, Any]], None]): Sends a payload to the receivers.
+        resync_every (int): Number of pushes after which a full snapshot is sent again.
+    """
+
+    emit: Callable[[dict[str, Any]], None]
+    resync_every: int
+
+    def __init__(self, emit: Callable[[dict[str, Any]], None], resync_every: int = 200):
+        self.emit = emit
+        self.resync_every = resync_every
+        self._sent: dict[str, tuple[int, Any]] = {}  # key -> (seq, last sent state)
+        self._lock = threading.Lock()
+
+    def reset(self, key: str, data: Any) -> None:
+        """Records `data` as already known by the receivers (sent in full elsewhere) at seq 0."""
+        with self._lock:
+            self._sent[key] = (0, data)
+
+    def push(self, key: str, data: Any, keep: bool = True) -> None:
+        """
+        Emits the changes of `data` since the last push, nothing if it did not change.
+        Unless `keep` the state of `key` is forgotten afterwards.
+        """
+        with self._lock:
+            if key not in self._sent:
+                self._emit_snapshot(key, 0, data, keep)
+                return
+            seq, old = self._sent[key]
+            seq += 1
+            if seq % self.resync_every == 0:
+                self._emit_snapshot(key, seq, data, keep)
+                return
+            ops = diff(old, data)
+            if not keep:
+                del self._sent[key]
+            if not ops:
+                return
+            if keep:
+                self._sent[key] = (seq, data)
+            self.emit({"id": key, "seq": seq, "ops": ops})
+
+    def resync(self, key: str, data: Any) -> None:
+        """Emits `data` in full, e.g. when a receiver missed a delta."""
+        with self._lock:
+            if key in self._sent:
+                self._emit_snapshot(key, self._sent[key][0] + 1, data, True)
+            else:
+                self._emit_snapshot(key, 0, data, False)
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._sent.pop(key, None)
+
+    def tracked(self) -> int:
+        """Number of keys whose last sent state is kept."""
+        with self._lock:
+            return len(self._sent)
+
+    def _emit_snapshot(self, key: str, seq: int, data: Any, keep: bool) -> None:
+        if keep:
+            self._sent[key] = (seq, data)
+        else:
+            self._sent.pop(key, None)
+        self.emit({"id": key, "seq": seq, "snapshot": data})
+
+
+class Coalescer:
+    """
+    Batches bursts of updates into frames sent at most `rate` times a second.
+
+    `schedule(key, send)` only remembers `send` as the latest update of `key`, a
+    background thread calls the pending `send` of every key once per frame so the
+    updates scheduled in between are coalesced into one. `flush` sends right away.
+
+    Attributes:
+        interval (float): Seconds between two frames.
+        scheduled (int): Number of updates scheduled.
+        sent (int): Number of updates actually sent.
+    """
+
+    interval: float
+    scheduled: int
+    sent: int
+
+    def __init__(self, rate: float = 30):
+        self.interval = 1 / rate
+        self.scheduled = 0
+        self.sent = 0
+        self._pending: dict[str, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # keeps the sends of a key in order
+        self._thread: Optional[threading.Thread] = None
+
+    def stats(self) -> dict[str, int]:
+        """Counters, `coalesced` are the updates superseded by a later one of the same key."""
+        with self._lock:
+            return {
+                "scheduled": self.scheduled,
+                "sent": self.sent,
+                "coalesced": self.scheduled - self.sent - len(self._pending),
+                "pending": len(self._pending),
+            }
+
+    def schedule(self, key: str, send: Callable[[], None]) -> None:
+        with self._lock:
+            self._pending[key] = send
+            self.scheduled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def flush(self, key: Optional[str] = None) -> None:
+        """Sends the pending update of `key` (of every key if None) now."""
+        with self._lock:
+            if key is None:
+                pending = list(self._pending.values())
+                self._pending.clear()
+            elif key in self._pending:
+                pending = [self._pending.pop(key)]
+            else:
+                return
+            self.sent += len(pending)
+        with self._send_lock:
+            for send in pending:
+                try:
+                    send()
+                except Exception as e:
+                    print(f"Error sending coalesced update: {e}")
+
+    def cancel(self, key: str) -> None:
+        """Drops the pending update of `key`, e.g. because it was deleted."""
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
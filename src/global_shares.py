@@ -12,7 +12,7 @@ class Shared(TypedDict):
     socketio: SocketIO
     mail_service: Any
     client: genai.Client
-    take_permision: Callable[[str], bool]
+    take_permision: Callable[..., bool]
     chat_history: "ChatHistory"
     file: type["File"]
     content: type["Content"]
@@ -24,7 +24,7 @@ global_shares: Shared = {
     "socketio": None,
     "mail_service": None,
     "client": None,
-    "take_permision": lambda x: False,
+    "take_permision": lambda *args, **kwargs: False,
     "chat_history": None,
     "file": None,
     "content": None,
@@ -0,0 +1,124 @@
+# journal.py
+import json
+import os
+import threading
+from typing import Any, BinaryIO, Iterator, Optional
+
+
+class Journal:
+    """
+    Append-only write-ahead log with snapshot compaction.
+
+    Every mutation is written as a single JSON line to `journal_path`, so the cost of
+    persisting a change is proportional to the change and not to the whole state.
+    `compact` atomically replaces `snapshot_path` with the full state & truncates the log.
+
+    Attributes:
+        snapshot_path (str): Path of the full-state snapshot.
+        journal_path (str): Path of the append-only log of records since the snapshot.
+        compact_every (int): Number of records after which a compaction is due.
+        fsync (bool): Whether every record is fsync'ed to disk (survives power loss).
+        records (int): Number of records in the log since the last compaction.
+    """
+
+    snapshot_path: str
+    journal_path: str
+    compact_every: int
+    fsync: bool
+    records: int
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        journal_path: str,
+        compact_every: int = 1000,
+        fsync: bool = True,
+    ):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.records = 0
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+
+    def load_snapshot(self) -> Optional[dict[str, Any]]:
+        """Loads the snapshot, None if it does not exist or is corrupted."""
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            print(f"Error decoding snapshot `{self.snapshot_path}`. Ignoring it.")
+            return None
+
+    def replay(self) -> Iterator[dict[str, Any]]:
+        """
+        Yields the records written since the last compaction, in order.
+
+        A torn record at the tail (crash while writing) is dropped & cut off the log so
+        that new records are not appended to a partial line.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        good_offset = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(
+                        f"Dropping torn record at offset {good_offset} of `{self.journal_path}`."
+                    )
+                    break
+                good_offset += len(line)
+                self.records += 1
+                yield record
+        if good_offset != os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_offset)
+
+    def open(self) -> None:
+        """Opens the log for appending, call after `replay`."""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_path, "ab")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, op: str, **data: Any) -> None:
+        """Durably appends one record `{"op": op, **data}` to the log."""
+        line = json.dumps({"op": op, **data}, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if self._file is None:
+                return  # journaling not started (e.g. still replaying)
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records += 1
+
+    @property
+    def compaction_due(self) -> bool:
+        return self.records >= self.compact_every
+
+    def compact(self, snapshot: dict[str, Any]) -> None:
+        """Atomically writes `snapshot` as the new base state & empties the log."""
+        tmp_path = self.snapshot_path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if self._file is not None:
+                self._file.truncate(0)
+                self._file.seek(0)
+            elif os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+            self.records = 0
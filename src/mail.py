@@ -10,6 +10,8 @@ import config
 from rich import print
 import utils
 from global_shares import global_shares
+from ratelimit import Priority
+from scheduler import scheduler
 
 # Gmail API imports
 import google.auth.exceptions
@@ -294,8 +296,10 @@ def start_checking_mail():
     global_shares["mail_service"] = service
     if service:
         last_checked = load_last_mail_checked()
+        # polls run as background jobs so they wait while a chat turn is running
+        mail_lane = scheduler.executor(1, Priority.BACKGROUND)
         while True:
-            check_emails(service, last_checked)
+            mail_lane.submit(check_emails, service, last_checked).result()
             last_checked = datetime.datetime.now()  # Update the last checked timestamp
             save_last_mail_checked(last_checked)
             time.sleep(20)
@@ -2,8 +2,10 @@
 import faulthandler
 
 faulthandler.enable()
+import bisect
+import contextlib
 import os
-from flask import Flask, render_template, redirect, url_for
+from flask import Flask, render_template, redirect, url_for, request, send_file, abort
 from flask_socketio import SocketIO
 
 app = Flask("Friday")
@@ -20,71 +22,143 @@ from google.genai import types
 import prompt
 import config
 import uuid
-from io import BytesIO
-from typing import Any, Literal, Optional, TypedDict, NamedTuple, cast
+from typing import Any, Iterator, Literal, Optional, TypedDict, NamedTuple, cast
 from mail import start_checking_mail
 from global_shares import global_shares
 import notification
 import lschedule
 import json
+import asyncio
+import heapq
+import itertools
 import base64
 import time
 import datetime
 import utils
 import threading
+import concurrent.futures
 import tools
+from journal import Journal
+from blobstore import blobs
+from delta import Coalescer, DeltaStream, normalize
+from refresher import Refresher
+import selector
+from context import Summaries, TokenCounter, estimate_message
+import aioloop
+import ratelimit
+import session
+from scheduler import scheduler
+from pagecache import pages
 
 global_shares["socketio"] = socketio
 
 client = genai.Client(api_key=config.GOOGLE_API)
+ratelimit.limiter.install(client)
 global_shares["client"] = client
 
-model: Optional[str] = None  # None for Auto
-selected_tools: Optional[list[tools.ToolLiteral]] = None  # None for Auto
-thinking_budget: Optional[int] = None  # None for desabling thinking & int for budget
-
-permission: Optional[bool] = None
+# Model, tools & thinking budget are per browser tab, see `session.Settings`
 
 
 @socketio.on("set_permission")
-def set_permission(val: bool):
-    global permission
-    permission = val
+def set_permission(data: dict[str, Any] | bool):
+    """
+    Answers a permission request, `{"id": ..., "value": bool, "remember": bool}` or a bare
+    bool for the oldest one. With `remember` the action is approved for the rest of the session.
+    """
+    if isinstance(data, dict):
+        session.answer_permission(
+            request.sid,  # type: ignore
+            data.get("id"),
+            bool(data.get("value")),
+            bool(data.get("remember")),
+        )
+    else:
+        session.answer_permission(request.sid, None, bool(data))  # type: ignore
 
 
-def take_permission(msg: str) -> bool:
-    socketio.emit("take_permission", msg)
-    global permission
-    while permission is None:
-        time.sleep(0.1)
-    perm = permission
-    permission = None
-    return perm
+def take_permission(
+    msg: str, action: Optional[str] = None, target: Optional[str] = None
+) -> bool:
+    """
+    Asks the tab whose turn is running for a permission & waits for its answer.
+
+    Operations allowlisted in `config.PERMISSION_ALLOWLIST` or already approved in the
+    session are approved right away, unanswered requests are denied after
+    `config.PERMISSION_TIMEOUT` seconds.
+    """
+    if action is not None and session.allowlisted(action, target):
+        return True
+    ctx = session.current()
+    if ctx.sid is None:
+        return False  # not started by a client, nobody to ask
+    if action is not None and session.get(ctx.sid).is_approved(action, target):
+        return True
+    request_id = str(uuid.uuid4())
+    answer = session.request_permission(ctx.sid, request_id, action, target)
+    socketio.emit(
+        "take_permission",
+        {
+            "id": request_id,
+            "msg": msg,
+            "chat_id": ctx.chat_id,
+            "rememberable": action is not None,
+        },
+        to=ctx.sid,
+    )
+    try:
+        return answer.result(timeout=config.PERMISSION_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        session.answer_permission(ctx.sid, request_id, False)
+        socketio.emit("permission_expired", request_id, to=ctx.sid)
+        return False
 
 
 global_shares["take_permision"] = take_permission
 
 
+# Uploads of attachments to the Files API run in the background so they overlap each other
+file_uploads = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.FILE_UPLOAD_WORKERS, thread_name_prefix="file-upload"
+)
+
+
 class File:
     type: str = ""  # mime types
-    content: bytes = b""
+    hash: str = ""  # sha256 of the content, key in the blob store
+    size: int = 0  # size of the content in bytes
     filename: str = ""
     id: str = ""
     cloud_uri: Optional[types.File] = None  # None if not uploded yet
 
     def __init__(
         self,
-        content: bytes,
+        content: Optional[bytes],
         type: str,
         filename: str,
         cloud_uri: Optional[types.File] = None,
         id: Optional[str] = None,
+        hash: Optional[str] = None,
+        size: Optional[int] = None,
     ):
-        self.content = content
+        if content is not None:
+            self.hash = blobs.put(content)
+            self.size = len(content)
+        elif hash is not None:
+            self.hash = hash
+            self.size = size if size is not None else blobs.path(hash).stat().st_size
+        else:
+            raise ValueError("Either content or hash of the file is required")
         self.type = type
         self.filename = filename
         self.id = str(uuid.uuid4()) if id is None else id
         self.cloud_uri = cloud_uri
+        self._upload: Optional[concurrent.futures.Future[None]] = None
+        self._upload_lock = threading.Lock()
+
+    @property
+    def content(self) -> memoryview:
+        """Memory-mapped view of the bytes, paged in from the blob store only when read."""
+        return blobs.view(self.hash)
 
     def delete(self):
         if (
@@ -110,25 +184,62 @@ class File:
 
         return expiration_time >= ten_minutes_from_now
 
+    @property
+    def is_supported(self) -> bool:
+        """Whether the file type can be given to the AI."""
+        return (
+            self.type.startswith(("text/", "image/", "video/"))
+            or self.type == "application/pdf"
+        )
+
+    @property
+    def needs_upload(self) -> bool:
+        return not self.cloud_uri or not self.is_file_valid(
+            self.cloud_uri.expiration_time
+        )
+
     @utils.retry(
         exceptions=utils.network_errors + (ValueError,),
         ignore_exceptions=utils.ignore_network_error,
     )
     def upload_file(self):
+        # the SDK streams the blob from disk with a resumable upload
         self.cloud_uri = client.files.upload(
-            file=BytesIO(self.content),
+            file=str(blobs.path(self.hash)),
             config=types.UploadFileConfig(
                 display_name=self.filename, mime_type=self.type
             ),
         )
+        delay = 0.3
         while self.cloud_uri.state == types.FileState.PROCESSING:
-            time.sleep(0.3)
+            time.sleep(delay)
+            delay = min(delay * 2, 5)  # large videos take minutes to process
             if self.cloud_uri.name:
                 self.cloud_uri = client.files.get(name=self.cloud_uri.name)
             else:
                 raise ValueError("Failed to Upload File")
         if self.cloud_uri.state == types.FileState.FAILED:
             raise ValueError(self.cloud_uri.state.name)
+        attachment_refresher.track(self)
+
+    def prefetch(self, force: bool = False) -> Optional[concurrent.futures.Future[None]]:
+        """
+        Starts uploading the file to the Files API in the background if needed.
+
+        Args:
+            force (bool): Upload again even if the current `cloud_uri` is still valid.
+
+        Returns:
+            Optional[concurrent.futures.Future[None]]: The upload in progress, None if the
+                file is unsupported or already has a valid `cloud_uri`.
+        """
+        with self._upload_lock:
+            if self._upload is not None and not self._upload.done():
+                return self._upload
+            if not self.is_supported or not (force or self.needs_upload):
+                return None
+            self._upload = file_uploads.submit(self.upload_file)
+            return self._upload
 
     def for_ai(
         self, imagen_selected: bool, msg: Optional["Message"] = None
@@ -149,14 +260,9 @@ class File:
             Exception: If file upload fails or file URI/MIME type are not available.
         """
         # Check if the file type is supported
-        if (
-            self.type.startswith(("text/", "image/", "video/"))
-            or self.type == "application/pdf"
-        ):
+        if self.is_supported:
             # Check if the file needs to be uploaded to the cloud
-            if not self.cloud_uri or not self.is_file_valid(
-                self.cloud_uri.expiration_time
-            ):
+            if upload := self.prefetch():
                 # Determine the processing prefix based on the file type
                 if self.type.startswith("image/"):
                     prefix = "Processing Image:"
@@ -169,16 +275,19 @@ class File:
 
                 # Update the UI to indicate that the file is being processed
                 if msg:
-                    msg.content.append(Content(text=f"{prefix} {self.filename}"))
+                    with msg.lock:
+                        msg.content.append(Content(text=f"{prefix} {self.filename}"))
                     emit_msg_update(msg)
 
-                # Upload the file to the cloud
-                self.upload_file()
-
-                # Remove the processing message from the UI
-                if msg:
-                    msg.content.pop()
-                    emit_msg_update(msg)
+                # Wait for the (possibly already running) upload to the cloud
+                try:
+                    upload.result()
+                finally:
+                    # Remove the processing message from the UI
+                    if msg:
+                        with msg.lock:
+                            msg.content.pop()
+                        emit_msg_update(msg)
 
             # Check if the file was successfully uploaded or not
             if not self.cloud_uri:
@@ -204,16 +313,17 @@ class File:
         return {
             "type": self.type,
             "filename": self.filename,
-            "content": base64.b64encode(self.content).decode("utf-8", errors="ignore"),
+            "hash": self.hash,
+            "size": self.size,
             "id": self.id,
             "cloud_uri": self.cloud_uri.to_json_dict() if self.cloud_uri else None,
         }
 
     @staticmethod
     def from_jsonify(data: dict):
-        content = base64.b64decode(data["content"])
         return File(
-            content=content,
+            # histories saved before the blob store inline the base64 content
+            content=base64.b64decode(data["content"]) if "content" in data else None,
             type=data["type"],
             filename=data["filename"],
             cloud_uri=(
@@ -222,6 +332,8 @@ class File:
                 else None
             ),
             id=data["id"],
+            hash=data.get("hash"),
+            size=data.get("size"),
         )
 
 
@@ -510,6 +622,9 @@ class Message:
     id: str
     processing: bool
     chat_id: str
+    version: int  # bumped on every in place mutation, invalidates `_ai_cache`
+    # held while the message is changed during its generation & while it is snapshotted
+    lock: threading.RLock
 
     def __init__(
         self,
@@ -526,14 +641,39 @@ class Message:
         self.id = str(uuid.uuid4()) if id is None else id
         self.processing = processing
         self.chat_id = chat_id
-
-    def is_member(self, chat: Chat, chats: dict[str, Chat]) -> bool:
-        if self.chat_id == chat.id:
-            return True
-        for child in chats.values():
-            if child.parent_id == chat.id and self.is_member(child, chats):
-                return True
-        return False
+        self.version = 0
+        self.lock = threading.RLock()
+        # (support_tools, imagen_selected) -> (version, attachments expiry, contents)
+        self._ai_cache: dict[
+            tuple[bool, bool],
+            tuple[int, Optional[datetime.datetime], list[types.Content]],
+        ] = {}
+        # (version, tokens) of `estimate_tokens`
+        self._token_estimate: Optional[tuple[int, int]] = None
+
+    def touch(self) -> None:
+        """Marks the message as mutated so that its cached `for_ai` output is rebuilt."""
+        self.version += 1
+
+    def estimate_tokens(self) -> int:
+        """Local token estimate of the message, cached like `for_ai` until it changes."""
+        # the message being generated changes on every streamed part so it is never cached
+        if self.processing:
+            return estimate_message(self)
+        cached = self._token_estimate
+        if cached is None or cached[0] != self.version:
+            cached = self._token_estimate = (self.version, estimate_message(self))
+        return cached[1]
+
+    def attachments(self) -> Iterator[File]:
+        """All the files of the message, including the inline data of function responses."""
+        for item in self.content:
+            if item.attachment:
+                yield item.attachment
+            elif item.function_response:
+                for content in item.function_response.inline_data:
+                    if content.attachment:
+                        yield content.attachment
 
     def delete(self) -> None:
         for item in self.content:
@@ -553,6 +693,7 @@ class Message:
                 if item.attachment.id == ID:
                     item.attachment.delete()
                     del self.content[idx]
+                    self.touch()
                     return
 
     def get_func_call(self, ID: str) -> FunctionCall:
@@ -569,6 +710,7 @@ class Message:
             if item.function_call:
                 if item.function_call.id == ID:
                     del self.content[idx]
+                    self.touch()
                     return
 
     def get_func_responce(self, ID: str) -> FunctionResponce:
@@ -585,6 +727,7 @@ class Message:
             if item.function_response:
                 if item.function_response.id == ID:
                     del self.content[idx]
+                    self.touch()
                     return
 
     def for_ai(
@@ -596,6 +739,18 @@ class Message:
         if msg is None:
             raise ValueError("msg parameter is required.")
 
+        # the message being generated changes on every streamed part so it is never cached
+        cacheable = not self.processing and self is not msg
+        key = (support_tools, imagen_selected)
+        if cacheable and (cached := self._ai_cache.get(key)):
+            version, expiry, ai_contents = cached
+            if version == self.version and File.is_file_valid(expiry):
+                return ai_contents
+
+        # upload all the attachments in parallel, the conversion below joins on each
+        for attachment in self.attachments():
+            attachment.prefetch()
+
         ai_contents: list[types.Content] = []
         parts_buffer = []
 
@@ -619,6 +774,19 @@ class Message:
 
         if parts_buffer:
             ai_contents.append(types.Content(parts=parts_buffer, role=self.role))
+
+        if cacheable:
+            # the contents refer to uploaded files by uri, so they are only as valid
+            # as the first of those uploads to expire
+            expiry = min(
+                (
+                    attachment.cloud_uri.expiration_time
+                    for attachment in self.attachments()
+                    if attachment.cloud_uri and attachment.cloud_uri.expiration_time
+                ),
+                default=None,
+            )
+            self._ai_cache[key] = (self.version, expiry, ai_contents)
         return ai_contents
 
     def jsonify(self) -> dict[str, Any]:
@@ -631,6 +799,11 @@ class Message:
             "processing": self.processing,
         }
 
+    def snapshot(self) -> dict[str, Any]:
+        """`jsonify` detached from the message, taken under `lock` for the clients."""
+        with self.lock:
+            return normalize(self.jsonify())
+
     @staticmethod
     def from_jsonify(data: dict):
         return Message(
@@ -643,8 +816,23 @@ class Message:
 
 
 class ChatHistory:
-    _messages: list[Message] = []
+    _messages: dict[str, Message] = {}  # message id -> message, in chronological order
     _chats: dict[str, Chat] = {"main": Chat("Main Chat", "main")}
+    _journal: Optional[Journal] = None
+    _lock: threading.RLock = threading.RLock()
+
+    # Indexes kept in sync with `_messages` & `_chats` on every mutation
+    _chat_messages: dict[str, dict[str, Message]]  # chat id -> its own messages in order
+    _order: dict[str, int]  # message id -> position in the global message order
+    _next_order: int
+    _ancestors: dict[str, set[str]]  # chat id -> the chat & all of its ancestors
+    _descendants: dict[str, set[str]]  # chat id -> the chat & all of its descendants
+    _attachments: dict[str, File]  # file id -> file, including function response inline data
+    _attachment_chats: dict[str, str]  # file id -> id of the chat of its message
+    _chat_activity: dict[str, datetime.datetime]  # chat id -> time of its latest message
+
+    def __init__(self):
+        self._reindex()
 
     def add_chat(self, chat: Chat):
         """Adds a new chat definition."""
@@ -652,7 +840,10 @@ class ChatHistory:
             print(f"Warning: Chat with ID {chat.id} already exists. Overwriting.")
         if chat.parent_id and chat.parent_id not in self._chats:
             raise ValueError(f"Parent chat with ID {chat.parent_id} does not exist.")
-        self._chats[chat.id] = chat
+        with self._lock:
+            self._chats[chat.id] = chat
+            self._link_chat(chat.id)
+            self._record("add_chat", chat=chat.jsonify())
 
     def get_chat(self, chat_id: str) -> Chat:
         """Gets chat metadata."""
@@ -660,75 +851,198 @@ class ChatHistory:
             raise ValueError(f"Chat with ID {chat_id} not found.")
         return self._chats[chat_id]
 
+    def is_member(self, msg: Message, chat_id: str) -> bool:
+        """Whether `msg` belongs to the chat or one of its descendants."""
+        return msg.chat_id in self._descendants.get(chat_id, ())
+
+    def chat_messages(self, chat_id: str) -> Iterator[Message]:
+        """Messages of the chat & its descendants in chronological order."""
+        with self._lock:
+            # (position, message) of these messages only, taken while consistent
+            per_chat = [
+                [
+                    (self._order[msg.id], msg)
+                    for msg in self._chat_messages[descendant].values()
+                ]
+                for descendant in self._descendants[chat_id]
+                if self._chat_messages.get(descendant)
+            ]
+        if len(per_chat) == 1:
+            return (msg for _, msg in per_chat[0])
+        return (msg for _, msg in heapq.merge(*per_chat, key=lambda entry: entry[0]))
+
+    def recent_messages(self, chat_id: str, n: int) -> list[Message]:
+        """The last `n` messages of the chat & its descendants in chronological order."""
+        with self._lock:
+            candidates = [
+                msg
+                for descendant in self._descendants[chat_id]
+                for msg in itertools.islice(
+                    reversed(self._chat_messages.get(descendant, {}).values()), n
+                )
+            ]
+            candidates.sort(key=lambda msg: self._order[msg.id])
+        return candidates[-n:]
+
     def append(self, msg: Message):
-        self._messages.append(msg)
-        socketio.emit("add_message", msg.jsonify())
+        with self._lock:
+            self._insert(msg)
+            self._record("append", msg=msg.jsonify())
+        data = msg.snapshot()
+        if msg.processing:
+            # only messages still being generated are streamed as deltas
+            msg_deltas.reset(msg.id, data)
+        socketio.emit("add_message", data)
 
     def delete_message(self, msg_id):
-        self._messages = [msg for msg in self._messages if msg.id != msg_id]
+        with self._lock:
+            self._remove({msg_id})
+            self._record("delete", ids=[msg_id])
         emit_msg_del(msg_id)
 
     def __len__(self):
         return len(self._messages)
 
-    def __getitem__(self, idx: int):
-        return self._messages[idx]
-
     def getImage(self, ID: str) -> tuple[types.Part, types.Part] | types.Part:
-        for msg in self._messages:
-            for content in msg.content:
-                if content.attachment and content.attachment.id == ID:
-                    return content.attachment.for_ai(True)
-                elif (
-                    content.function_response and content.function_response.inline_data
-                ):
-                    for content in content.function_response.inline_data:
-                        if content.attachment and content.attachment.id == ID:
-                            return content.attachment.for_ai(True)
+        if attachment := self._attachments.get(ID):
+            return attachment.for_ai(True)
+        # files generated during the current turn are only indexed once the message
+        # being generated is stored with `setMsg`, it is the latest message of its chat
+        with self._lock:
+            generating = [
+                msg
+                for chat_msgs in self._chat_messages.values()
+                if chat_msgs and (msg := chat_msgs[next(reversed(chat_msgs))]).processing
+            ]
+        for msg in generating:
+            for attachment in msg.attachments():
+                if attachment.id == ID:
+                    return attachment.for_ai(True)
         raise ValueError(f"Image with ID: `{ID}` not found")
 
+    def attachments(self) -> Iterator[File]:
+        """All the files in the history, including function response inline data."""
+        with self._lock:
+            return iter(list(self._attachments.values()))
+
+    def is_attachment_hot(self, attachment: File) -> bool:
+        """
+        Whether the attachment is in the context of a recently active chat.
+
+        A chat's messages are in the context of the chat & all of its ancestors, so the
+        attachment is hot if any of them got a message in the last
+        `config.ACTIVE_CHAT_WINDOW` hours.
+        """
+        chat_id = self._attachment_chats.get(attachment.id)
+        if chat_id is None:
+            return False  # deleted
+        since = datetime.datetime.now() - datetime.timedelta(
+            hours=config.ACTIVE_CHAT_WINDOW
+        )
+        return any(
+            self._chat_activity.get(ancestor, datetime.datetime.min) >= since
+            for ancestor in self._ancestors.get(chat_id, ())
+        )
+
     def getMsg(self, ID: str) -> Message:
-        for msg in self._messages:
-            if msg.id == ID:
-                return msg
+        if msg := self._messages.get(ID):
+            return msg
         raise ValueError(f"Message of ID: `{ID}` not found")
 
     def setMsg(self, ID: str, new_msg: Message):
-        for msg in self._messages:
-            if msg.id == ID:
-                msg = new_msg
-                emit_msg_update(msg)
+        with self._lock:
+            if ID == new_msg.id and self._replace(new_msg):
+                self._record("set", msg=new_msg.jsonify())
+                emit_msg_update(new_msg)
                 return
         raise ValueError(f"Message of ID: `{ID}` not found")
 
     def trip_after(self, msg_id: str, chat_id: str) -> None:
-        chat = self._chats[chat_id]
-        msg_index = {msg.id: i for i, msg in enumerate(self._messages)}
-        idx = msg_index.get(msg_id, -1)
-        if idx == -1:
-            return  # Message not found, exit early
-        ids_to_del = {
-            msg.id
-            for msg in self._messages[idx + 1 :]
-            if msg.is_member(chat, self._chats)
-        }
+        with self._lock:
+            if msg_id not in self._order:
+                return  # Message not found, exit early
+            after = self._order[msg_id]
+            ids_to_del = {
+                msg.id
+                for msg in self.chat_messages(chat_id)
+                if self._order[msg.id] > after
+            }
+            self._remove(ids_to_del)
+            self._record("delete", ids=list(ids_to_del))
         for msg_id in ids_to_del:
             emit_msg_del(msg_id)
-        self._messages = list(
-            filter(lambda msg: msg.id not in ids_to_del, self._messages)
-        )
 
     def for_ai(
         self, ai_msg: Message, support_tools: bool, imagen_selected: bool, chat_id: str
     ) -> list[types.Content]:
+        """
+        Builds the model's context for the chat within `config.CONTEXT_TOKEN_BUDGET`.
+
+        The latest messages that fit the budget (at least
+        `config.CONTEXT_MIN_RECENT_MESSAGES`) are sent as is, the older ones are replaced
+        by the chat's rolling summary. Older messages not covered by the summary yet are
+        sent as text only transcripts, & summarized in the background for later turns.
+        """
+        messages = list(self.chat_messages(chat_id))
+        verbatim_start = len(messages)
+        used = 0
+        for idx in range(len(messages) - 1, -1, -1):
+            cost = token_counter.count(messages[idx])
+            if (
+                used + cost > config.CONTEXT_TOKEN_BUDGET
+                and len(messages) - idx > config.CONTEXT_MIN_RECENT_MESSAGES
+            ):
+                break
+            used += cost
+            verbatim_start = idx
+
+        covered = 0  # messages covered by the summary
+        if summary := summaries.get(chat_id):
+            covered = next(
+                (idx + 1 for idx, msg in enumerate(messages) if msg.id == summary["upto"]),
+                0,
+            )
+            if not covered:
+                summary = None  # summary of deleted messages, start over
+        # the summary may reach into the window (e.g. once a large message got deleted),
+        # it then stands in for the messages it covers but the most recent ones
+        verbatim_start = max(
+            verbatim_start,
+            min(covered, len(messages) - config.CONTEXT_MIN_RECENT_MESSAGES),
+        )
+
         result: list[types.Content] = []
-        for msg in self._messages:
-            if msg.is_member(self._chats[chat_id], self._chats):
-                result.extend(msg.for_ai(support_tools, imagen_selected, ai_msg))
+        if verbatim_start:
+            if summary:
+                result.append(
+                    types.Content(
+                        parts=[
+                            types.Part(
+                                text=f"Summary of the earlier conversation:\n{summary['text']}"
+                            )
+                        ],
+                        role="user",
+                    )
+                )
+            if gap := messages[covered:verbatim_start]:
+                result.extend(
+                    selector.build_context(gap, config.CONTEXT_TRANSCRIPT_TOKENS)
+                )
+                summaries.extend_async(
+                    chat_id,
+                    summary,
+                    [
+                        (msg.id, f"{msg.role}: {selector.message_summary(msg)}")
+                        for msg in gap
+                    ],
+                )
+
+        for msg in messages[verbatim_start:]:
+            result.extend(msg.for_ai(support_tools, imagen_selected, ai_msg))
         return result
 
     def jsonify(self):
-        data = [msg.jsonify() for msg in self._messages]
+        data = [msg.jsonify() for msg in self._messages.values()]
         return {"messages": data, "chats": [_.jsonify() for _ in self._chats.values()]}
 
     def save_to_json(self, filepath: str):
@@ -740,37 +1054,184 @@ class ChatHistory:
         """Loads the chat history from a JSON file."""
         try:
             with open(filepath, "r") as f:
-                data = json.load(f)
-                self._messages = []
-                for msg_data in data.get("messages", ()):
-                    msg = Message.from_jsonify(msg_data)
-                    self._messages.append(msg)
-                for chat in data.get("chats", ()):
-                    self._chats[chat["id"]] = Chat.from_json(chat)
-                if "main" not in self._chats.keys():
-                    print(
-                        "Creating default 'main' chat as it was not found in the loaded data."
-                    )
-                    self._chats["main"] = Chat(name="Main Chat", id="main")
+                self._load(json.load(f))
         except FileNotFoundError:
             print("Chat history file not found. Starting with an empty chat.")
         except json.JSONDecodeError:
             print("Error decoding chat history. Starting with an empty chat.")
 
+    def _load(self, data: dict[str, Any]):
+        self._messages = {}
+        for msg_data in data.get("messages", ()):
+            msg = Message.from_jsonify(msg_data)
+            self._messages[msg.id] = msg
+        for chat in data.get("chats", ()):
+            self._chats[chat["id"]] = Chat.from_json(chat)
+        if "main" not in self._chats.keys():
+            print(
+                "Creating default 'main' chat as it was not found in the loaded data."
+            )
+            self._chats["main"] = Chat(name="Main Chat", id="main")
+        self._reindex()
+
+    def _reindex(self):
+        """Rebuilds the message index & the chat tree closure from scratch."""
+        self._chat_messages = {chat_id: {} for chat_id in self._chats}
+        self._order = {}
+        self._next_order = 0
+        self._attachments = {}
+        self._attachment_chats = {}
+        self._chat_activity = {}
+        for msg in self._messages.values():
+            self._index_message(msg)
+
+        self._ancestors = {}
+        self._descendants = {chat_id: {chat_id} for chat_id in self._chats}
+        for chat_id in self._chats:
+            ancestors: set[str] = set()
+            current: Optional[str] = chat_id
+            while current and current in self._chats and current not in ancestors:
+                ancestors.add(current)
+                current = self._chats[current].parent_id
+            self._ancestors[chat_id] = ancestors
+            for ancestor in ancestors:
+                self._descendants[ancestor].add(chat_id)
+
+    def _index_message(self, msg: Message):
+        self._order[msg.id] = self._next_order
+        self._next_order += 1
+        self._chat_messages.setdefault(msg.chat_id, {})[msg.id] = msg
+        self._index_attachments(msg)
+        if msg.time_stamp > self._chat_activity.get(msg.chat_id, datetime.datetime.min):
+            self._chat_activity[msg.chat_id] = msg.time_stamp
+
+    def _index_attachments(self, msg: Message):
+        for attachment in msg.attachments():
+            self._attachments[attachment.id] = attachment
+            self._attachment_chats[attachment.id] = msg.chat_id
+
+    def _unindex_attachments(self, msg: Message):
+        for attachment in msg.attachments():
+            self._attachments.pop(attachment.id, None)
+            self._attachment_chats.pop(attachment.id, None)
+
+    def _insert(self, msg: Message):
+        self._messages[msg.id] = msg
+        self._index_message(msg)
+
+    def _replace(self, new_msg: Message) -> bool:
+        """Replaces the message with the same id in place, False if it is not present."""
+        msg = self._messages.get(new_msg.id)
+        if msg is None:
+            return False
+        self._messages[new_msg.id] = new_msg
+        self._unindex_attachments(msg)
+        self._index_attachments(new_msg)
+        if msg.chat_id == new_msg.chat_id:
+            self._chat_messages[msg.chat_id][msg.id] = new_msg
+        else:
+            del self._chat_messages[msg.chat_id][msg.id]
+            chat_msgs = self._chat_messages.setdefault(new_msg.chat_id, {})
+            chat_msgs[new_msg.id] = new_msg
+            self._chat_messages[new_msg.chat_id] = dict(
+                sorted(chat_msgs.items(), key=lambda kv: self._order[kv[0]])
+            )
+        return True
+
+    def _remove(self, ids: set[str]):
+        for msg_id in ids:
+            msg = self._messages.pop(msg_id, None)
+            if msg is None:
+                continue
+            self._chat_messages[msg.chat_id].pop(msg.id, None)
+            self._order.pop(msg.id, None)
+            self._unindex_attachments(msg)
+
+    def _link_chat(self, chat_id: str):
+        """Updates the chat tree closure after `chat_id` was added or re-parented."""
+        self._chat_messages.setdefault(chat_id, {})
+        subtree = self._descendants.setdefault(chat_id, {chat_id})
+        old_ancestors = self._ancestors.get(chat_id, {chat_id}) - {chat_id}
+        parent_id = self._chats[chat_id].parent_id
+        new_ancestors = set(self._ancestors.get(parent_id, ())) if parent_id else set()
+        for ancestor in old_ancestors:
+            self._descendants[ancestor] -= subtree
+        for ancestor in new_ancestors:
+            self._descendants[ancestor] |= subtree
+        for descendant in subtree:
+            self._ancestors[descendant] = (
+                self._ancestors.get(descendant, {descendant}) - old_ancestors
+            ) | new_ancestors
+
+    def open_journal(self, snapshot_path: str, journal_path: str):
+        """
+        Loads the history from the snapshot + the journal tail & starts journaling.
+
+        After this every mutation (`append`, `setMsg`, `delete_message`, `trip_after`,
+        chat changes) is durably appended to the journal as it happens, & the journal
+        is compacted into the snapshot every `config.CHAT_HISTORY_COMPACT_EVERY` records.
+        """
+        with self._lock:
+            self._journal = Journal(
+                snapshot_path,
+                journal_path,
+                config.CHAT_HISTORY_COMPACT_EVERY,
+                config.CHAT_HISTORY_FSYNC,
+            )
+            snapshot = self._journal.load_snapshot()
+            if snapshot is not None:
+                self._load(snapshot)
+            else:
+                print("Chat history snapshot not found. Starting with an empty chat.")
+            for record in self._journal.replay():
+                self._apply(record)
+            self._journal.open()
+
+    def close_journal(self):
+        """Compacts & closes the journal, history is fully in the snapshot after this."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.compact(self.jsonify())
+                self._journal.close()
+                self._journal = None
+
+    def _record(self, op: str, **data: Any):
+        """Journals a mutation, compacting the journal when due."""
+        if self._journal is None:
+            return
+        self._journal.record(op, **data)
+        if self._journal.compaction_due:
+            self._journal.compact(self.jsonify())
+
+    def _apply(self, record: dict[str, Any]):
+        """Re-applies a journaled mutation without emitting or journaling it again."""
+        op = record["op"]
+        if op == "append":
+            self._insert(Message.from_jsonify(record["msg"]))
+        elif op == "set":
+            new_msg = Message.from_jsonify(record["msg"])
+            if not self._replace(new_msg):
+                self._insert(new_msg)
+        elif op == "delete":
+            self._remove(set(record["ids"]))
+        elif op == "add_chat":
+            self._chats[record["chat"]["id"]] = Chat.from_json(record["chat"])
+            self._link_chat(record["chat"]["id"])
+        elif op == "update_chat_parent":
+            if record["chat_id"] in self._chats:
+                self._chats[record["chat_id"]].parent_id = record["parent_id"]
+                self._link_chat(record["chat_id"])
+        elif op == "delete_chat":
+            if record["chat_id"] in self._chats:
+                self._delete_chat(record["chat_id"])
+        else:
+            print(f"Unknown chat history journal record `{op}`. Skipping.")
+
     def _is_descendant(self, potential_child_id: str, potential_parent_id: str) -> bool:
         """Checks if potential_child_id is a descendant of potential_parent_id."""
         if not potential_parent_id or potential_child_id == potential_parent_id:
             return False  # Cannot be a descendant of null or itself
-
-        current_id = potential_child_id
-        while current_id:
-            chat = self._chats.get(current_id)
-            if not chat:
-                return False  # Should not happen if data is consistent
-            if chat.parent_id == potential_parent_id:
-                return True  # Found the potential parent in the ancestry
-            current_id = chat.parent_id  # Move up the chain
-        return False  # Reached the root without finding the parent
+        return potential_child_id in self._descendants.get(potential_parent_id, ())
 
     def update_chat_parent(self, chat_id: str, new_parent_id: Optional[str]) -> bool:
         """Updates the parent of a chat, preventing circular dependencies."""
@@ -797,16 +1258,21 @@ class ChatHistory:
             return False
 
         # Update the parent ID
-        chat_to_update = self._chats[chat_id]
-        old_parent_id = chat_to_update.parent_id
-        chat_to_update.parent_id = new_parent_id
+        with self._lock:
+            chat_to_update = self._chats[chat_id]
+            old_parent_id = chat_to_update.parent_id
+            chat_to_update.parent_id = new_parent_id
+            self._link_chat(chat_id)
+            self._record(
+                "update_chat_parent", chat_id=chat_id, parent_id=new_parent_id
+            )
         print(
             f"Updated parent of chat '{chat_id}' from '{old_parent_id}' to '{new_parent_id}'"
         )
         return True
 
     def delete_chat(self, chat_id_to_delete: str):
-        """Deletes a chat and reparents its children."""
+        """Deletes a chat along with all of its descendant chats & their messages."""
         if chat_id_to_delete == "main":
             raise Exception("Error: Cannot delete the 'main' chat.")
 
@@ -815,43 +1281,88 @@ class ChatHistory:
                 f"Error: Chat with ID {chat_id_to_delete} not found for deletion."
             )
 
-        messages_to_del = []
-
-        for idx, msg in enumerate(self._messages):
-            if msg.is_member(self._chats[chat_id_to_delete], self._chats):
-                messages_to_del.append(msg)
-
-        for msg in messages_to_del:
-            self._messages.remove(msg)
+        with self._lock:
+            self._delete_chat(chat_id_to_delete)
+            self._record("delete_chat", chat_id=chat_id_to_delete)
+
+    def _delete_chat(self, chat_id_to_delete: str):
+        subtree = set(self._descendants[chat_id_to_delete])
+        self._remove(
+            {
+                msg_id
+                for chat_id in subtree
+                for msg_id in self._chat_messages.get(chat_id, ())
+            }
+        )
+        for ancestor in self._ancestors[chat_id_to_delete] - {chat_id_to_delete}:
+            self._descendants[ancestor] -= subtree
+        for chat_id in subtree:
+            del self._chats[chat_id]
+            self._chat_messages.pop(chat_id, None)
+            self._ancestors.pop(chat_id, None)
+            self._descendants.pop(chat_id, None)
+
+
+@utils.retry(
+    exceptions=utils.network_errors, ignore_exceptions=utils.ignore_network_error
+)
+def count_message_tokens(msg: Message) -> int:
+    return (
+        client.models.count_tokens(
+            model=config.SUMMARY_MODEL, contents=msg.for_ai(True, False, msg)  # type: ignore
+        ).total_tokens
+        or 0
+    )
 
-        # Iterate over a copy of keys because we might modify the dict size implicitly if we delete the chat first
-        for chat_id in list(self._chats.keys()):
-            # Check if the chat exists (might have been deleted in a recursive call if we change strategy later)
-            chat = self._chats.get(chat_id)
-            if chat and chat.parent_id == chat_id_to_delete:
-                self.delete_chat(chat.id)
-                break
 
-        # Delete the chat
-        del self._chats[chat_id_to_delete]
+@utils.retry(
+    exceptions=utils.network_errors, ignore_exceptions=utils.ignore_network_error
+)
+def summarize_conversation(previous_summary: Optional[str], transcript: str) -> str:
+    response = client.models.generate_content(
+        model=config.SUMMARY_MODEL,
+        contents=prompt.SUMMARIZE_CHAT_USR_INSTR.format(
+            previous_summary=previous_summary or "(none)", transcript=transcript
+        ),
+        config=types.GenerateContentConfig(
+            system_instruction=prompt.SUMMARIZE_CHAT_SYS_INSTR, temperature=0.2
+        ),
+    )
+    if not response.text:
+        raise ValueError("Empty summary")
+    return response.text
 
 
+token_counter = TokenCounter(count_message_tokens)
+summaries = Summaries(summarize_conversation, config.SUMMARY_INPUT_TOKENS)
 chat_history: ChatHistory = ChatHistory()
 
+# Re-uploads the attachments of recently active chats before their Files API uploads expire
+attachment_refresher: Refresher[File] = Refresher(
+    expires_at=lambda file: file.cloud_uri.expiration_time if file.cloud_uri else None,
+    is_hot=chat_history.is_attachment_hot,
+    refresh=lambda file: file.prefetch(force=True),
+    lead=datetime.timedelta(minutes=config.ATTACHMENT_REFRESH_LEAD),
+)
+
 global_shares["chat_history"] = chat_history
 
 
-def complete_chat(message: str, chat_id: str, files: Optional[list[File]] = None):
+async def complete_chat(
+    message: str, chat_id: str, files: Optional[list[File]] = None
+):
     """
     Appends user message to chat history, gets AI response, and handles grounding metadata.
     """
-    # Append user message if there's content
-    if message or files:
-        append_user_message(message, chat_id, files or [])
+    with ratelimit.priority(ratelimit.Priority.INTERACTIVE, origin=chat_id):
+        # History writes may fsync or compact the journal, so they run off the event loop
+        # Append user message if there's content
+        if message or files:
+            await aioloop.offload(append_user_message, message, chat_id, files or [])
 
-    # Get AI response and update chat history
-    ai_response = get_ai_response(chat_id)
-    emit_msg_update(ai_response)
+        # Get AI response and update chat history
+        ai_response = await get_ai_response(chat_id)
+        await aioloop.offload(chat_history.setMsg, ai_response.id, ai_response)
 
 
 def append_user_message(message: str, chat_id: str, files: list[File]):
@@ -866,35 +1377,56 @@ def append_user_message(message: str, chat_id: str, files: list[File]):
     )
 
 
-def get_ai_response(chat_id: str) -> Message:
+async def get_ai_response(chat_id: str) -> Message:
     """
     Gets the AI's response from the Gemini model, handling retries and token limits.
     """
     # Append a placeholder for the AI reply
-    chat_history.append(Message([], "model", chat_id))
-    msg = chat_history[len(chat_history) - 1]
+    msg = Message([], "model", chat_id)
+    await aioloop.offload(chat_history.append, msg)
+    start = time.monotonic()
     try:
-        return generate_content(msg, chat_id)
+        return await generate_content(msg, chat_id)
     except Exception as e:
         handle_generation_failure(msg, e)
         return msg
+    finally:
+        scheduler.record_latency("chat_turn", time.monotonic() - start)
 
 
-def emit_msg_update(msg: Message):
+# Message updates are sent as `msg_delta` events holding only what changed since the last update
+msg_deltas = DeltaStream(
+    lambda payload: socketio.emit("msg_delta", payload), config.MSG_DELTA_RESYNC_EVERY
+)
+# Updates of a message being generated are batched into frames of `config.MSG_UPDATE_RATE` per second
+msg_updates = Coalescer(config.MSG_UPDATE_RATE)
+
+
+def emit_msg_update(msg: Message, flush: bool = False):
     """
-    emits the updated message.
+    emits the changes of the updated message.
+
+    While the message is being generated the update is coalesced with the other
+    updates of the same frame, otherwise (or if `flush`) it is sent right away &
+    `msg_deltas` stops tracking the message.
     """
-    socketio.emit("updated_msg", msg.jsonify())
+    msg_updates.schedule(
+        msg.id, lambda: msg_deltas.push(msg.id, msg.snapshot(), keep=msg.processing)
+    )
+    if flush or not msg.processing:
+        msg_updates.flush(msg.id)
 
 
 def emit_msg_del(msg_id: str):
     """
     emits the delete message.
     """
+    msg_updates.cancel(msg_id)
+    msg_deltas.forget(msg_id)
     socketio.emit("delete_message", msg_id)
 
 
-def generate_content(msg: Message, chat_id: str) -> Message:
+async def generate_content(msg: Message, chat_id: str) -> Message:
     """
     Generates content from Gemini, retrying on token limits or other errors.
 
@@ -906,7 +1438,9 @@ def generate_content(msg: Message, chat_id: str) -> Message:
     """
 
     # Helper function to handle streaming content parts
-    def handle_part(part: types.Part):
+    def handle_part(
+        part: types.Part, pending: list[tuple[asyncio.Task[Content], bool]]
+    ):
         if part.text:
             # Create initial content if none exists
             if not msg.content:
@@ -926,10 +1460,34 @@ def generate_content(msg: Message, chat_id: str) -> Message:
 
         # Handle function calls
         elif part.function_call:
-            handle_function_call(part.function_call)
+            dispatch_function_call(part.function_call, pending)
 
-    # Helper function to handle function calls and responses
-    def handle_function_call(func_call: types.FunctionCall):
+    def dispatch_function_call(
+        func_call: types.FunctionCall,
+        pending: list[tuple[asyncio.Task[Content], bool]],
+    ):
+        """
+        Starts a function call of the streamed response concurrently with its earlier calls.
+
+        Calls of `tools.ParallelSafeTools` only wait for the earlier calls with side
+        effects, the others wait for every earlier call, so dependent calls (e.g. create
+        then write a file) still run in order. `pending` collects (task, parallel safe).
+        """
+        fc = add_function_call(func_call)
+        safe = func_call.name in tools.ParallelSafeTools
+        before = [task for task, task_safe in pending if not (safe and task_safe)]
+
+        async def run() -> Content:
+            if before:
+                await asyncio.wait(before)
+            # tools block, they run on the scheduler while the event loop serves other chats
+            with ratelimit.priority(ratelimit.Priority.TOOL):
+                return await aioloop.offload(handle_function_call, func_call, fc)
+
+        pending.append((asyncio.create_task(run()), safe))
+
+    # Helper functions to handle function calls and responses
+    def add_function_call(func_call: types.FunctionCall) -> FunctionCall:
         # Add function call to message content
         msg.content.append(
             Content(
@@ -938,9 +1496,12 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                 )
             )
         )
-        fc: FunctionCall = msg.content[-1].function_call  # type: ignore
-        id: str = msg.content[-1].function_call.id  # type: ignore
         emit_msg_update(msg)
+        return msg.content[-1].function_call  # type: ignore
+
+    def handle_function_call(func_call: types.FunctionCall, fc: FunctionCall) -> Content:
+        """Runs a function call added with `add_function_call`, returns its response content."""
+        id: str = fc.id
 
         try:
             # Validate function name
@@ -949,14 +1510,10 @@ def generate_content(msg: Message, chat_id: str) -> Message:
             if func_call.name == "DeepResearch":
                 if func_call.args:
 
-                    def research_callback(
-                        update_data: Optional[dict[str, Any]],
-                    ) -> None:
-                        # print(update_data)
-                        if not update_data:
-                            # No specific update, maybe just a state check internally
-                            return
-
+                    def record_research_update(
+                        update_data: dict[str, Any],
+                    ) -> dict[str, Any]:
+                        """Records a research update in `fc`, returns its `research_update` payload."""
                         # Prepare data for the frontend event
                         event_payload = {
                             "function_id": id,  # Pass the function call ID
@@ -1048,6 +1605,18 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                                     del fc.extra_data["steps"][idx]
                                     break
 
+                        return event_payload
+
+                    def research_callback(
+                        update_data: Optional[dict[str, Any]],
+                    ) -> None:
+                        # print(update_data)
+                        if not update_data:
+                            # No specific update, maybe just a state check internally
+                            return
+                        # called from the research's worker threads at once
+                        with msg.lock:
+                            event_payload = record_research_update(update_data)
                         socketio.emit("research_update", event_payload)
                         emit_msg_update(
                             msg
@@ -1058,21 +1627,20 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                         call_back=research_callback,  # Use the new callback
                     )
                     # Store initial state in extra_data (no change here)
-                    fc.extra_data["topic"] = researcher.topic.jsonify()
-                    fc.extra_data["steps"] = []  # Steps will be added via events
-                    fc.extra_data["max_topics"] = researcher.max_topics
-                    fc.extra_data["max_search_queries"] = researcher.max_search_queries
-                    fc.extra_data["max_search_results"] = researcher.max_search_results
-                    fc.extra_data["tree_depth_limit"] = researcher.tree_depth_limit
-                    fc.extra_data["branch_width_limit"] = researcher.branch_width_limit
-                    fc.extra_data["semantic_drift_limit"] = (
-                        researcher.semantic_drift_limit
-                    )
-                    fc.extra_data["research_detail_level"] = (
-                        researcher.research_detail_level
-                    )
-                    fc.extra_data["stop"] = False
-                    fc.extra_data["status"] = "running"  # Add initial status
+                    with msg.lock:
+                        fc.extra_data.update(
+                            topic=researcher.topic.jsonify(),
+                            steps=[],  # Steps will be added via events
+                            max_topics=researcher.max_topics,
+                            max_search_queries=researcher.max_search_queries,
+                            max_search_results=researcher.max_search_results,
+                            tree_depth_limit=researcher.tree_depth_limit,
+                            branch_width_limit=researcher.branch_width_limit,
+                            semantic_drift_limit=researcher.semantic_drift_limit,
+                            research_detail_level=researcher.research_detail_level,
+                            stop=False,
+                            status="running",  # Add initial status
+                        )
 
                     # --- Modify Config Update Handlers ---
                     def update_max_topics(max_topics: Optional[int]):
@@ -1174,8 +1742,9 @@ def generate_content(msg: Message, chat_id: str) -> Message:
 
                     def stop_research():
                         researcher.stop = True
-                        fc.extra_data["stop"] = True
-                        fc.extra_data["status"] = "stopping"
+                        with msg.lock:
+                            fc.extra_data["stop"] = True
+                            fc.extra_data["status"] = "stopping"
                         socketio.emit(
                             "research_update",
                             {
@@ -1225,7 +1794,8 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                     emit_msg_update(msg)
                     researched_data = []
                     try:
-                        researched_data = researcher.research()
+                        with ratelimit.priority(ratelimit.Priority.BACKGROUND):
+                            researched_data = researcher.research()
                         report = ""
                         for content in researched_data:
                             if content.text and not content.thought:
@@ -1233,20 +1803,19 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                         response_payload = {"output": report}
                     except Exception:
                         response_payload = {"error": traceback.format_exc()}
-                    fc.extra_data["status"] = "finished"
+                    with msg.lock:
+                        fc.extra_data["status"] = "finished"
 
-                    # Add the final response/error to the message *content*
-                    msg.content.append(
-                        Content(
-                            function_response=FunctionResponce(
-                                id=id,
-                                name=func_call.name,
-                                response=response_payload,
-                                inline_data=researched_data,
-                            )
+                    # The final response/error, added to the message *content* in call order
+                    response = Content(
+                        function_response=FunctionResponce(
+                            id=id,
+                            name=func_call.name,
+                            response=response_payload,
+                            inline_data=researched_data,
                         )
                     )
-                    # Emit the final message update to include the response box
+                    # Emit the final message update to show the finished state
                     emit_msg_update(msg)
 
                     # Emit a final status update event
@@ -1266,8 +1835,7 @@ def generate_content(msg: Message, chat_id: str) -> Message:
 
                     # Return from handle_function_call (important!)
                     # Since research runs synchronously here, we don't return early.
-                    # The final message update happens after research completes.
-                    return  # Explicitly return after handling
+                    return response
 
                 else:
                     raise ValueError("DeepResearch call without args")
@@ -1278,54 +1846,43 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                 else:
                     func_response = getattr(tools, func_call.name)()
             if func_call.name == "Imagen":
-                msg.content.append(
-                    Content(
-                        function_response=FunctionResponce(
-                            id=id,
-                            name=func_call.name,
-                            response={"output": "Images are Linked Below"},
-                            inline_data=func_response,
-                        )
+                return Content(
+                    function_response=FunctionResponce(
+                        id=id,
+                        name=func_call.name,
+                        response={"output": "Images are Linked Below"},
+                        inline_data=func_response,
                     )
                 )
-                return
             elif func_call.name == "LinkAttachment":
-                msg.content.append(
-                    Content(
-                        function_response=FunctionResponce(
-                            id=id,
-                            name=func_call.name,
-                            response={"output": "Files are Linked Below"},
-                            inline_data=func_response,
-                        )
-                    )
-                )
-                return
-
-            # Add successful function response
-            msg.content.append(
-                Content(
+                return Content(
                     function_response=FunctionResponce(
                         id=id,
                         name=func_call.name,
-                        response={"output": func_response},
+                        response={"output": "Files are Linked Below"},
+                        inline_data=func_response,
                     )
                 )
+
+            # Successful function response
+            return Content(
+                function_response=FunctionResponce(
+                    id=id,
+                    name=func_call.name,
+                    response={"output": func_response},
+                )
             )
 
         except Exception as e:
-            # Add error response with detailed exception info
+            # Error response with detailed exception info
             error_msg = f"Error executing {func_call.name}: {str(e)}"
-            msg.content.append(
-                Content(
-                    function_response=FunctionResponce(
-                        id=id,
-                        name=func_call.name or "unknown_function",
-                        response={"error": error_msg},
-                    )
+            return Content(
+                function_response=FunctionResponce(
+                    id=id,
+                    name=func_call.name or "unknown_function",
+                    response={"error": error_msg},
                 )
             )
-        emit_msg_update(msg)
 
     @utils.retry(
         exceptions=utils.network_errors, ignore_exceptions=utils.ignore_network_error
@@ -1342,11 +1899,12 @@ def generate_content(msg: Message, chat_id: str) -> Message:
         Raises:
             Exception: If selection fails after multiple attempts
         """
-        chat = chat_history.for_ai(
-            msg, support_tools=True, imagen_selected=False, chat_id=chat_id
+        settings = session.current().settings
+        model, selected_tools, thinking_budget = (
+            settings.model,
+            settings.selected_tools,
+            settings.thinking_budget,
         )
-        global model, selected_tools, thinking_budget
-        allowed_function_names: Optional[list[str]] = None
 
         # Case 1: Both model and tools already selected
         if model is not None and selected_tools is not None:
@@ -1366,8 +1924,108 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                 ),
             )
 
+        # Case 2 without tool support: nothing to select
+        if (
+            model is not None
+            and model not in config.SearchGroundingSuportedModels
+            and model not in config.ToolSuportedModels
+        ):
+            return (
+                config.Models[model].value,
+                True,
+                [],
+                (
+                    types.ThinkingConfig(
+                        include_thoughts=bool(thinking_budget),
+                        thinking_budget=thinking_budget,
+                    )
+                    if model in config.DynamicThinkingModels
+                    else None
+                ),
+            )
+
+        # Reuse the selection of a similar recent turn, or decide locally if the request is clear
+        last_user_msg = next(
+            (
+                recent
+                for recent in reversed(chat_history.recent_messages(chat_id, 4))
+                if recent.role == "user"
+            ),
+            None,
+        )
+        text, mime_types = "", []
+        if last_user_msg:
+            text = "".join(content.text or "" for content in last_user_msg.content)
+            mime_types = [attachment.type for attachment in last_user_msg.attachments()]
+        features = selector.extract_features(text, mime_types)
+        key = selector.selection_cache.fingerprint(
+            chat_id, model, selected_tools, thinking_budget, features
+        )
+        if (cached := selector.selection_cache.get(key)) is not None:
+            return cached
+        if (selection := select_heuristically(settings, features)) is not None:
+            selector.selection_cache.put(key, selection, heuristic=True)
+        else:
+            selection = select_with_selector_model(settings)
+            selector.selection_cache.put(key, selection, heuristic=False)
+        return selection
+
+    def select_heuristically(
+        settings: session.Settings,
+        features: selector.Features,
+    ) -> Optional[tuple[str, bool, list[types.Tool], Optional[types.ThinkingConfig]]]:
+        """Selects model and/or tools without the selector model, None if unsure."""
+        model, selected_tools, thinking_budget = (
+            settings.model,
+            settings.selected_tools,
+            settings.thinking_budget,
+        )
+        tool_names = (
+            selected_tools
+            if selected_tools is not None
+            else selector.heuristic_tools(features)
+        )
+        if tool_names is None:
+            return None
+        model_name = (
+            model if model is not None else selector.heuristic_model(features, tool_names)
+        )
+        if model_name is None:
+            return None
+        if tools.Tools.SearchGrounding.name in tool_names and (
+            len(tool_names) > 1
+            or model_name not in config.SearchGroundingSuportedModels
+        ):
+            return None  # incompatible model & tools, let the selector model decide
+        return tools.ModelAndToolSelector(
+            model_name,  # type: ignore
+            tool_names,  # type: ignore
+            thinking_budget if model_name in config.DynamicThinkingModels else None,
+        )
+
+    def select_with_selector_model(settings: session.Settings) -> (
+        tuple[str, bool, list[types.Tool], Optional[types.ThinkingConfig]]
+    ):
+        model, selected_tools, thinking_budget = (
+            settings.model,
+            settings.selected_tools,
+            settings.thinking_budget,
+        )
+        # only the latest turns with attachments as placeholders, the selector only picks a model
+        chat = selector.build_context(
+            [
+                recent
+                for recent in chat_history.recent_messages(
+                    chat_id, config.SELECTOR_CONTEXT_MESSAGES + 1
+                )
+                if recent is not msg
+            ][-config.SELECTOR_CONTEXT_MESSAGES :],
+            config.SELECTOR_CONTEXT_TOKENS,
+        )
+        allowed_function_names: Optional[list[str]] = None
+
         # Case 2: Model is known, select tools
-        elif model is not None:
+        if model is not None:
             # Prepare the tool selection prompt
             if model in config.SearchGroundingSuportedModels:
                 chat.append(
@@ -1382,7 +2040,7 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                         role="user",
                     )
                 )
-            elif model in config.ToolSuportedModels:
+            else:
                 chat.append(
                     types.Content(
                         parts=[
@@ -1394,20 +2052,6 @@ def generate_content(msg: Message, chat_id: str) -> Message:
                         role="user",
                     )
                 )
-            else:
-                return (
-                    config.Models[model].value,
-                    True,
-                    [],
-                    (
-                        types.ThinkingConfig(
-                            include_thoughts=bool(thinking_budget),
-                            thinking_budget=thinking_budget,
-                        )
-                        if model in config.DynamicThinkingModels
-                        else None
-                    ),
-                )
 
             # Assign tool selector and function call permission
             tools_list = [
@@ -1617,7 +2261,7 @@ def generate_content(msg: Message, chat_id: str) -> Message:
     emit_msg_update(msg)
     # Get model and tools
     selected_model, suports_tools, selected_tools_list, thinking_budget = (
-        get_model_and_tools()
+        await aioloop.offload(get_model_and_tools)
     )
     print("Selected model:", selected_model)
     print("Supports tools:", suports_tools)
@@ -1628,13 +2272,20 @@ def generate_content(msg: Message, chat_id: str) -> Message:
     @utils.retry(
         exceptions=utils.network_errors, ignore_exceptions=utils.ignore_network_error
     )
-    def generate_content_with_retry():
+    async def generate_content_with_retry():
         while True:
-            start_time = time.time()  # Record start time before request
+            # Assembling the context may wait for attachment uploads
+            contents = await aioloop.offload(
+                chat_history.for_ai,
+                msg,
+                suports_tools,
+                tools.ImagenTool in selected_tools_list,
+                chat_id,
+            )
             # Generate streaming content
-            response = client.models.generate_content_stream(
+            response = await client.aio.models.generate_content_stream(
                 model=selected_model,
-                contents=chat_history.for_ai(msg, suports_tools, tools.ImagenTool in selected_tools_list, chat_id),  # type: ignore
+                contents=contents,  # type: ignore
                 config=types.GenerateContentConfig(
                     system_instruction=prompt.SYSTEM_INSTUNCTION.format(
                         reminders=(
@@ -1660,49 +2311,47 @@ def generate_content(msg: Message, chat_id: str) -> Message:
             # Process the streaming response
             function_call_occurred = False
             finish_region: types.FinishReason | None = None
-            for content in response:
-                if (
-                    content.candidates
-                    and content.candidates[0].content
-                    and content.candidates[0].content.parts
-                ):
-                    for part in content.candidates[0].content.parts:
-                        handle_part(part)
-                        if part.function_call:
-                            function_call_occurred = True
-                if content.candidates and content.candidates[0].finish_reason:
-                    finish_region = content.candidates[0].finish_reason
-
-                # Process additional metadata
-                process_grounding_metadata(msg, content)
-                emit_msg_update(msg)
-
-            # sleep for some time if needed
-            end_time = time.time()  # Record end time after response processing
-            elapsed_time = end_time - start_time  # Calculate elapsed time
+            pending: list[tuple[asyncio.Task[Content], bool]] = []
+            try:
+                async for content in response:
+                    # the tool threads & the update sender see the whole chunk or none of it
+                    with msg.lock:
+                        if (
+                            content.candidates
+                            and content.candidates[0].content
+                            and content.candidates[0].content.parts
+                        ):
+                            for part in content.candidates[0].content.parts:
+                                handle_part(part, pending)
+                                if part.function_call:
+                                    function_call_occurred = True
+                        if content.candidates and content.candidates[0].finish_reason:
+                            finish_region = content.candidates[0].finish_reason
+
+                        # Process additional metadata
+                        process_grounding_metadata(msg, content)
+                    emit_msg_update(msg)
+            finally:
+                # Responses are added in call order, even if the stream broke off
+                for task, _ in pending:
+                    response_content = await task
+                    with msg.lock:
+                        msg.content.append(response_content)
+                    emit_msg_update(msg)
 
+            # the rate limiter spaces out the follow up requests
             if function_call_occurred or finish_region == types.FinishReason.MAX_TOKENS:
-                rpm_limit = config.model_RPM_map.get(
-                    selected_model, 1
-                )  # Get RPM limit, default to 1 if not found
-                target_delay_per_request_sec = (
-                    60.0 / rpm_limit
-                )  # Calculate target delay in seconds
-                sleep_duration = max(
-                    0, target_delay_per_request_sec - elapsed_time
-                )  # Calculate sleep duration, ensure it's not negative
-                if sleep_duration > 0:
-                    time.sleep(sleep_duration)  # Sleep to respect RPM limit
                 continue
 
             # Otherwise break the loop
             break
 
-    generate_content_with_retry()
+    await generate_content_with_retry()
 
     # Set timestamp and return message
     msg.time_stamp = datetime.datetime.now()
     msg.processing = False
+    msg.touch()  # the content was streamed into it in place
     return msg
 
 
@@ -1787,38 +2436,200 @@ def handle_generation_failure(msg: Message, error: Exception):
     import traceback
 
     error_message = f"Failed to generate response after multiple retries: {str(error)}\n\nTraceback:\n```\n{traceback.format_exc()}\n```"
-    if not msg.content or msg.content[-1].text is None:
-        msg.content.append(Content(text=error_message))
-    else:
-        msg.content[-1].text = error_message
-    emit_msg_update(msg)
+    with msg.lock:
+        if not msg.content or msg.content[-1].text is None:
+            msg.content.append(Content(text=error_message))
+        else:
+            msg.content[-1].text = error_message
+    # the cached `for_ai` output & token estimate are only used once it stops processing
+    msg.processing = False
+    msg.touch()
+    emit_msg_update(msg, flush=True)
+
+
+class Upload:
+    """
+    A file being uploaded from the browser in binary chunks.
+
+    Chunks are written at their offset straight into a temp file preallocated in the
+    blob store. Once every byte arrived `finish` (on `upload_lane`) moves the file into
+    the blob store & starts uploading it to the Files API, then resolves `future` with
+    the file (or None if the upload failed). An upload that is dropped before that must
+    be `close`d to free its temp file.
+    """
 
+    sid: str
+    size: int
+    type: str
+    filename: str
+    received: int  # distinct bytes received, resent chunks are counted once
+    error: Optional[str]
+    file: Optional[File]
+    future: concurrent.futures.Future[Optional[File]]
+    fd: int  # -1 once closed
+    path: str
+    updated: float  # monotonic time of the last chunk
+
+    def __init__(self, sid: str, size: int, type: str, filename: str):
+        self.sid = sid
+        self.size = size
+        self.type = type
+        self.filename = filename
+        self.received = 0
+        self.error = None
+        self.file = None
+        self.future = concurrent.futures.Future()
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._ranges: list[tuple[int, int]] = []  # sorted disjoint [start, end) received
+        self.fd, self.path = blobs.temp_file()
+        try:
+            os.ftruncate(self.fd, size)
+        except OSError:
+            self.close()
+            raise
+
+    def write(self, offset: int, chunk: bytes):
+        if offset < 0 or offset + len(chunk) > self.size:
+            raise ValueError(f"Chunk at {offset} of {len(chunk)} bytes overflows the file")
+        # under the lock so `close` can not hand the fd number to another file meanwhile
+        with self._lock:
+            if self.fd == -1:
+                raise ValueError("Upload was closed")
+            os.pwrite(self.fd, chunk, offset)
+            self.received += self._cover(offset, offset + len(chunk))
+            self.updated = time.monotonic()
+
+    def _cover(self, start: int, end: int) -> int:
+        """Adds [start, end) to the received ranges & returns how many bytes are new."""
+        if start == end:
+            return 0
+        ranges = self._ranges
+        first = bisect.bisect_left(ranges, (start,))
+        if first and ranges[first - 1][1] >= start:
+            first -= 1  # the previous range overlaps or touches it
+        last = first
+        merged_start, merged_end, seen = start, end, 0
+        while last < len(ranges) and ranges[last][0] <= end:
+            range_start, range_end = ranges[last]
+            seen += max(0, min(range_end, end) - max(range_start, start))
+            merged_start = min(merged_start, range_start)
+            merged_end = max(merged_end, range_end)
+            last += 1
+        ranges[first:last] = [(merged_start, merged_end)]
+        return end - start - seen
+
+    def close(self):
+        """Closes the temp file & removes it unless it was moved into the blob store."""
+        with self._lock:
+            if self.fd != -1:
+                os.close(self.fd)
+                self.fd = -1
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+    def finish(self):
+        with self._lock:
+            if self.fd == -1:
+                return  # already finishing, or dropped
+            os.close(self.fd)
+            self.fd = -1
+        try:
+            if self.received != self.size:
+                self.error = f"Received {self.received} of {self.size} bytes"
+                return
+            self.file = File(
+                None,
+                self.type,
+                self.filename,
+                None,
+                File._generate_valid_file_id(),
+                hash=blobs.put_file(self.path),
+                size=self.size,
+            )
+            # the Files API upload overlaps with the user finishing the message
+            self.file.prefetch()
+        except OSError as e:
+            self.error = str(e)
+        finally:
+            self.close()  # only left behind if it was not moved into the blob store
+            if self.file is None and self.error is None:
+                self.error = "Upload failed"
+            self.future.set_result(self.file)
 
-# ID & [its chuncks with their idx & is fully uploded (true if video is fully uploded otherwise false)]
-class UploadFileParts(NamedTuple):
-    data: dict[int, str]  # data part idx  # b64 data part
-    done: bool  # whether file is complitly uploded or not
 
+# hashing & storing a finished upload, off the Socket.IO handler threads
+upload_lane = scheduler.executor(2, ratelimit.Priority.INTERACTIVE)
 
-files: dict[str, UploadFileParts] = {}
+
+uploads: dict[str, Upload] = {}
+
+
+def drop_uploads(sid: Optional[str] = None):
+    """
+    Closes & forgets the uploads of a disconnected session (if `sid`), along with
+    unfinished uploads of any session that got no chunk for `config.UPLOAD_TIMEOUT`.
+    """
+    now = time.monotonic()
+    for id, upload in list(uploads.items()):
+        if upload.sid == sid or (
+            not upload.future.done() and now - upload.updated > config.UPLOAD_TIMEOUT
+        ):
+            if uploads.pop(id, None) is not None:
+                upload.close()
 
 
 @socketio.on("start_upload_file")
-def start_upload_file(id: str):
-    files[id] = UploadFileParts({}, False)
+def start_upload_file(data: dict) -> dict[str, Any]:
+    drop_uploads()
+    id: str = data["id"]
+    size = data["size"]
+    if not isinstance(size, int) or not 0 <= size <= config.MAX_UPLOAD_SIZE:
+        return {
+            "error": f"File size must be between 0 and the max upload size of {config.MAX_UPLOAD_SIZE} bytes"
+        }
+    try:
+        upload = Upload(request.sid, size, data["type"], data["filename"])  # type: ignore
+    except OSError as e:
+        return {"error": str(e)}
+    previous = uploads.pop(id, None)
+    if previous is not None:
+        previous.close()
+    uploads[id] = upload
+    return {"ok": True}
 
 
 @socketio.on("upload_file_chunck")
-def upload_file_chunck(data: dict):
-    id: str = data["id"]
-    chunck: str = data["chunck"]
-    idx: int = data["idx"]
-    files[id].data[idx] = chunck
+def upload_file_chunck(data: dict) -> dict[str, Any]:
+    # the returned ack lets the client keep only a few chunks in flight (back-pressure)
+    upload = uploads.get(data["id"])
+    if upload is None:
+        return {"error": "Unknown upload"}
+    try:
+        upload.write(data["offset"], data["chunck"])
+    except (ValueError, OSError) as e:
+        return {"error": str(e)}
+    return {"ok": True}
 
 
 @socketio.on("end_upload_file")
-def end_upload_file(id: str):
-    files[id] = UploadFileParts(files[id].data, True)
+def end_upload_file(id: str) -> dict[str, Any]:
+    """
+    Starts finishing an upload & acks at once, the client is sent `upload_done` with
+    the upload's id & error (None if it succeeded) once the file is stored.
+    """
+    upload = uploads.get(id)
+    if upload is None:
+        return {"error": "Unknown upload"}
+
+    def done(future: concurrent.futures.Future[Optional[File]]):
+        if future.result() is None and uploads.get(id) is upload:
+            uploads.pop(id, None)
+        socketio.emit("upload_done", {"id": id, "error": upload.error}, to=upload.sid)
+
+    upload.future.add_done_callback(done)
+    upload_lane.submit(upload.finish)
+    return {"ok": True}
 
 
 @socketio.on("get_notifications")
@@ -1845,40 +2656,67 @@ def handle_mark_read(data):
         print("Error: notification_id not provided for mark_read")
 
 
+async def wait_for_uploads(pending: list[tuple[str, Upload]]) -> list[File]:
+    """Waits up to `config.UPLOAD_TIMEOUT` for each upload, returning the stored files."""
+    files = []
+    for filename, upload in pending:
+        # not wait_for: timing out must not cancel the upload's future
+        done, _ = await asyncio.wait(
+            {asyncio.wrap_future(upload.future)}, timeout=config.UPLOAD_TIMEOUT
+        )
+        if not done:
+            upload.close()
+            print(f"Upload of {filename} did not complete. Skipping it.")
+        elif upload.file is None:
+            print(f"Upload of {filename} failed: {upload.error}")
+        else:
+            files.append(upload.file)
+    return files
+
+
+async def complete_chat_with_uploads(
+    message: str, chat_id: str, pending: list[tuple[str, Upload]]
+):
+    await complete_chat(message, chat_id, await wait_for_uploads(pending))
+
+
 @socketio.on("send_message")
 def handle_send_message(data):
     message = data.get("message", "")
-    file_attachments = []
+    pending: list[tuple[str, Upload]] = []
     file_data_list = data.get("files", [])
 
     for file_data in file_data_list:
-        file_type: str = file_data.get("type")
         filename: str = file_data.get("filename")
 
         id: str = file_data.get("id")
-        while not files.get(id):
-            time.sleep(0.1)
-        while not files[id][1]:
-            time.sleep(0.2)
-        vid = files[id][0]
-        x = 0
-        content: str = ""
-        while vid.get(x) is not None:
-            content += vid[x]
-            x += 1
-        decoded_content = base64.b64decode(content)
-        file_attachments.append(
-            File(
-                decoded_content,
-                file_type,
-                filename,
-                None,
-                File._generate_valid_file_id(),
-            )
+        upload = uploads.pop(id, None)
+        if upload is None:
+            print(f"Upload of {filename} is unknown. Skipping it.")
+            continue
+        pending.append((filename, upload))
+
+    # the turn (& waiting for unfinished uploads) runs on the chat's worker on the event
+    # loop, the handler thread is free again
+    chat_id = data.get("chat_id", "main")
+    aioloop.spawn(
+        session.chat_workers.run(
+            session.GenerationContext.for_session(chat_id, request.sid),  # type: ignore
+            complete_chat_with_uploads(message, chat_id, pending),
         )
-        del files[id]
+    )
+
 
-    complete_chat(message, data.get("chat_id", "main"), file_attachments)
+@socketio.on("resync_msg")
+def handle_resync_message(msg_id: str):
+    """
+    Sends the full message to a client that missed one of its deltas.
+    """
+    try:
+        msg = chat_history.getMsg(msg_id)
+    except ValueError:
+        return
+    msg_deltas.resync(msg.id, msg.snapshot())
 
 
 @socketio.on("retry_msg")
@@ -1889,11 +2727,15 @@ def handle_retry_message(data: dict[str, str]):
     """
     try:
         chat_history.trip_after(data["msg_id"], data["chat_id"])
-        ai_response = get_ai_response(data["chat_id"])
-        if ai_response:
-            emit_msg_update(ai_response)
     except ValueError as e:
         print(f"Error retrying message: {e}")
+        return
+    aioloop.spawn(
+        session.chat_workers.run(
+            session.GenerationContext.for_session(data["chat_id"], request.sid),  # type: ignore
+            complete_chat("", data["chat_id"]),
+        )
+    )
 
 
 @app.route("/get_models")
@@ -1901,21 +2743,29 @@ def get_models() -> list[str]:
     return config.ModelsSet
 
 
+@socketio.on("connect")
+def handle_connect(auth=None):
+    session.get(request.sid)  # type: ignore
+
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    session.drop(request.sid)  # type: ignore
+    drop_uploads(request.sid)  # type: ignore
+
+
 @socketio.on("set_models")
 def set_models(lmodel: Optional[str] = None):
-    global model
-    model = lmodel
+    session.get(request.sid).settings.model = lmodel  # type: ignore
 
 
 @socketio.on("set_tools")
 def set_tools(ltools: Optional[list[tools.ToolLiteral]] = None) -> None:
-    global selected_tools
-    selected_tools = ltools
+    session.get(request.sid).settings.selected_tools = ltools  # type: ignore
 
 
 @socketio.on("set_thinking_budget")
 def set_thinking_budget(budget: Optional[int] = None) -> None:
-    global thinking_budget
     if budget is not None and not isinstance(budget, int):
         try:
             budget = int(budget)
@@ -1929,7 +2779,37 @@ def set_thinking_budget(budget: Optional[int] = None) -> None:
     elif budget is not None and budget > 24576:
         budget = 24576
 
-    thinking_budget = budget
+    session.get(request.sid).settings.thinking_budget = budget  # type: ignore
+
+
+@app.route("/get_selector_stats")
+def get_selector_stats() -> dict[str, float]:
+    return selector.selection_cache.stats()
+
+
+@app.route("/get_scheduler_stats")
+def get_scheduler_stats() -> dict[str, Any]:
+    return scheduler.stats()
+
+
+@app.route("/get_rate_limit_stats")
+def get_rate_limit_stats() -> dict[str, dict[str, Any]]:
+    return ratelimit.limiter.stats()
+
+
+@app.route("/get_page_cache_stats")
+def get_page_cache_stats() -> dict[str, Any]:
+    return pages.stats()
+
+
+@app.route("/get_search_cache_stats")
+def get_search_cache_stats() -> dict[str, int]:
+    return utils.searcher.stats()
+
+
+@app.route("/get_emit_stats")
+def get_emit_stats() -> dict[str, int]:
+    return {**msg_updates.stats(), "tracked": msg_deltas.tracked()}
 
 
 @app.route("/get_tools")
@@ -1967,7 +2847,6 @@ def handle_create_chat(data):
             f"Created new chat: ID={new_chat.id}, Name='{new_name}', Parent={parent_id}"
         )
         socketio.emit("chat_update", chat_history.jsonify())
-        chat_history.save_to_json(os.path.join(config.AI_DIR, "chat_history.json"))
     except Exception as e:
         print(f"Error creating chat: {e}")
         traceback.print_exc()
@@ -1986,7 +2865,6 @@ def handle_update_chat_parent(data):
     try:
         success = chat_history.update_chat_parent(chat_id, new_parent_id)
         if success:
-            chat_history.save_to_json(os.path.join(config.AI_DIR, "chat_history.json"))
             socketio.emit("chat_update", chat_history.jsonify())
     except Exception as e:
         print(f"Error updating chat parent: {e}")
@@ -2008,7 +2886,6 @@ def handle_delete_chat(data):
 
     try:
         chat_history.delete_chat(chat_id)
-        chat_history.save_to_json(os.path.join(config.AI_DIR, "chat_history.json"))
         socketio.emit("chat_update", chat_history.jsonify())
     except Exception as e:
         print(f"Error deleting chat: {e}")
@@ -2121,6 +2998,19 @@ def cancel_reminder_manual(data: dict[str, Any]):
         socketio.emit("reminders_error", str(e))
 
 
+@app.route("/attachment/<digest>")
+def attachment(digest: str):
+    """Serves attachment bytes from the blob store, content addressed so cacheable forever."""
+    if not blobs.is_valid_hash(digest) or not blobs.exists(digest):
+        abort(404)
+    return send_file(
+        blobs.path(digest),
+        mimetype=request.args.get("type", "application/octet-stream"),
+        conditional=True,
+        max_age=365 * 24 * 60 * 60,
+    )
+
+
 @app.route("/favicon.ico")
 def favicon():
     return redirect(url_for("static", filename="favicon.ico"), code=302)
@@ -2132,8 +3022,11 @@ def root():
 
 
 if __name__ == "__main__":
-    chat_history_file = os.path.join(config.AI_DIR, "chat_history.json")
-    chat_history.load_from_json(chat_history_file)
+    chat_history.open_journal(
+        os.path.join(config.AI_DIR, "chat_history.json"),
+        os.path.join(config.AI_DIR, "chat_history.journal"),
+    )
+    summaries.load_from_json(os.path.join(config.AI_DIR, "summaries.json"))
     notification_file = os.path.join(config.AI_DIR, "notifications.json")
     notification.notifications.load_from_json(notification_file)
     lschedule.schedule = lschedule.Schedule.load_from_json(
@@ -2143,10 +3036,14 @@ if __name__ == "__main__":
     mail_checker.start()
     reminder_runer = threading.Thread(target=tools.run_reminders, daemon=True)
     reminder_runer.start()
+    for att in chat_history.attachments():
+        attachment_refresher.track(att)
+    refresher_runer = threading.Thread(target=attachment_refresher.run, daemon=True)
+    refresher_runer.start()
     try:
         socketio.run(app, host="127.0.0.1", port=5000, debug=True)
     finally:
-        chat_history.save_to_json(chat_history_file)  # type: ignore
+        chat_history.close_journal()
         notification.notifications.save_to_json(notification_file)  # type: ignore
         lschedule.schedule.save_to_json(config.AI_DIR / "schedule.json")
         tools.save_jobs()
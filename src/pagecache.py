@@ -0,0 +1,275 @@
+# pagecache.py
+import collections
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Any, Optional
+
+import requests
+
+import config
+from ratelimit import Priority
+from scheduler import scheduler
+
+# Query parameters that only track where a visit came from, not what the page shows
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "ref_src")
+# Scrape params that do not change the result
+_IGNORED_PARAMS = frozenset(("timeout",))
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of `url` for caching.
+
+    Lowercases the scheme & host, drops default ports, fragments & tracking parameters
+    and sorts the query, so trivially different links to a page share one entry.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(_TRACKING_PARAMS)
+    )
+    return urllib.parse.urlunsplit(
+        (scheme, host, parts.path or "/", urllib.parse.urlencode(query), "")
+    )
+
+
+class PageCache:
+    """
+    On-disk cache of scraped pages (markdown, links & metadata), shared across sessions.
+
+    Entries are keyed by the normalized URL & the scrape params & stored gzip compressed
+    JSON as `<root>/<key[:2]>/<key>.json.gz`. An entry older than `ttl` is revalidated
+    with a conditional HEAD request if the site sent an ETag or Last-Modified header,
+    else it is fetched again. The least recently used entries are evicted once the cache
+    is larger than `max_bytes`, recency is kept in the files' modification times.
+
+    Attributes:
+        root (pathlib.Path): Directory of the cache.
+        ttl (float): Seconds an entry is used without revalidation.
+        max_bytes (int): Size of the cache on disk above which entries are evicted.
+        hits (int): Lookups answered from the cache (including revalidated ones).
+        revalidated (int): Hits on stale entries confirmed unchanged by the site.
+        misses (int): Lookups that needed a fetch.
+        evictions (int): Entries evicted to stay under `max_bytes`.
+    """
+
+    root: pathlib.Path
+    ttl: float
+    max_bytes: int
+    hits: int
+    revalidated: int
+    misses: int
+    evictions: int
+
+    REVALIDATE_TIMEOUT = 5  # seconds
+
+    def __init__(self, root: pathlib.Path, ttl: float, max_bytes: int):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> size on disk, least recently used first
+        self._index: Optional[collections.OrderedDict[str, int]] = None
+        self._size = 0
+        self._lock = threading.Lock()
+        # entries are written off the fetching thread
+        self._writer = scheduler.executor(1, Priority.BACKGROUND)
+
+    @staticmethod
+    def key(url: str, params: dict[str, Any]) -> str:
+        params = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+        return hashlib.sha256(
+            json.dumps([normalize_url(url), params], sort_keys=True).encode()
+        ).hexdigest()
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / f"{key}.json.gz"
+
+    def get(self, url: str, params: dict[str, Any]) -> Optional[dict[str, Any]]:
+        """The cached scrape of `url` with `params`, None if not cached or outdated."""
+        key = self.key(url, params)
+        with self._lock:
+            cached = key in self._load_index()
+        entry = self._read(key) if cached else None
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        revalidated = False
+        if time.time() - entry["validated_at"] > self.ttl:
+            if not self._revalidate(entry):
+                self._remove(key)
+                with self._lock:
+                    self.misses += 1
+                return None
+            entry["validated_at"] = time.time()
+            self._writer.submit(self._write, key, entry)
+            revalidated = True
+
+        with self._lock:
+            self.hits += 1
+            self.revalidated += revalidated
+            index = self._load_index()
+            if key in index:
+                index.move_to_end(key)
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return entry["data"]
+
+    def put(self, url: str, params: dict[str, Any], data: dict[str, Any]) -> None:
+        """Caches a successful scrape of `url` with `params`, written in the background."""
+        status = (data.get("metadata") or {}).get("statusCode")
+        if status is not None and status >= 400:
+            return
+        # copied as the caller may still add to it while it is written
+        self._writer.submit(self._store, self.key(url, params), url, dict(data))
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            index = self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(index),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _load_index(self) -> collections.OrderedDict[str, int]:
+        """Index of the entries on disk, scanned on first use, called with `_lock` held."""
+        if self._index is None:
+            files = []
+            if self.root.exists():
+                for path in self.root.glob("*/*.json.gz"):
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+                    key = path.name.removesuffix(".json.gz")
+                    files.append((stat.st_mtime, key, stat.st_size))
+            files.sort()
+            self._index = collections.OrderedDict((key, size) for _, key, size in files)
+            self._size = sum(self._index.values())
+        return self._index
+
+    def _read(self, key: str) -> Optional[dict[str, Any]]:
+        try:
+            with gzip.open(self.path(key), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            self._remove(key)  # unreadable, fetch again
+            return None
+
+    def _write(self, key: str, entry: dict[str, Any]) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file first so a crash never leaves a partial entry behind
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(json.dumps(entry).encode(), compresslevel=6))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        size = path.stat().st_size
+        with self._lock:
+            index = self._load_index()
+            self._size += size - index.pop(key, 0)
+            index[key] = size
+            evicted = []
+            while self._size > self.max_bytes and len(index) > 1:
+                old_key, old_size = index.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            self.path(old_key).unlink(missing_ok=True)
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._load_index().pop(key, 0)
+        self.path(key).unlink(missing_ok=True)
+
+    def _store(self, key: str, url: str, data: dict[str, Any]) -> None:
+        now = time.time()
+        response = self._head(url, {})
+        self._write(
+            key,
+            {
+                "url": url,
+                "stored_at": now,
+                "validated_at": now,
+                "validators": (
+                    self._validators(response)
+                    if response is not None and response.status_code < 400
+                    else {}
+                ),
+                "data": data,
+            },
+        )
+
+    def _head(self, url: str, headers: dict[str, str]) -> Optional[requests.Response]:
+        try:
+            return requests.head(
+                url, headers=headers, timeout=self.REVALIDATE_TIMEOUT, allow_redirects=True
+            )
+        except requests.exceptions.RequestException:
+            return None
+
+    @staticmethod
+    def _validators(response: requests.Response) -> dict[str, str]:
+        """ETag & Last-Modified the site sent for the page, if any."""
+        validators = {}
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+        return validators
+
+    def _revalidate(self, entry: dict[str, Any]) -> bool:
+        """Whether the page of a stale entry is unchanged according to the site."""
+        validators = entry.get("validators") or {}
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        if not headers:
+            return False
+        response = self._head(entry["url"], headers)
+        if response is None or response.status_code >= 400:
+            return False
+        if response.status_code == 304:
+            return True
+        # some sites ignore conditional requests but still send the same validators
+        current = self._validators(response)
+        return bool(current) and current == validators
+
+
+pages = PageCache(
+    config.AI_DIR / "page_cache", config.PAGE_CACHE_TTL, config.PAGE_CACHE_MAX_SIZE
+)
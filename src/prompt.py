@@ -467,3 +467,23 @@ Do not restate data unless it adds synthesis value.
 
 Start your summary now.
 """
+
+SUMMARIZE_CHAT_USR_INSTR = """\
+Summary of the conversation so far:
+{previous_summary}
+
+New messages to fold into the summary:
+{transcript}
+"""
+
+SUMMARIZE_CHAT_SYS_INSTR = """\
+You maintain a running summary of a long conversation between a user and an AI assistant, it replaces the older messages in the assistant's context.
+
+Rewrite the summary so that it also covers the new messages:
+- Keep every fact, decision, preference, name, number, file & code detail the assistant may need later.
+- Keep open questions & unfinished tasks.
+- Drop greetings, filler & repetition.
+- Write in the third person ("The user asked ...", "The assistant ..."), as dense bullet points grouped by topic.
+
+Return ONLY the updated summary.
+"""
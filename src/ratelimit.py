@@ -0,0 +1,305 @@
+# ratelimit.py
+import asyncio
+import collections
+import contextlib
+import contextvars
+import datetime
+import enum
+import functools
+import heapq
+import itertools
+import re
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from google import genai
+
+import config
+
+
+class Priority(enum.IntEnum):
+    """Priority classes of work, lower values are served first."""
+
+    INTERACTIVE = 0  # the user is waiting on it (chat turns)
+    TOOL = 1  # tools called during a chat turn
+    BACKGROUND = 2  # research, summaries, ...
+
+
+# (priority, owner, origin) of the innermost `priority` block, a context variable so
+# that asyncio tasks each have their own priority too, the owner is the task/thread that
+# counted it & the origin the chat it is done for
+_priority: contextvars.ContextVar[Optional[tuple[Priority, Any, Optional[str]]]] = (
+    contextvars.ContextVar("priority", default=None)
+)
+# work per priority & origin
+_active: dict[Priority, collections.Counter[Optional[str]]] = {
+    value: collections.Counter() for value in Priority
+}
+_active_lock = threading.Lock()
+
+
+def _adjust(value: Priority, origin: Optional[str], delta: int) -> None:
+    """Changes the count of work of `value` done for `origin`, called with `_active_lock` held."""
+    counts = _active[value]
+    counts[origin] += delta
+    if not counts[origin]:
+        del counts[origin]  # not to keep an entry for every chat ever seen
+
+
+def _owner() -> Any:
+    """The running asyncio task, or the thread's id outside of one."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:  # no running event loop
+        task = None
+    return task if task is not None else threading.get_ident()
+
+
+def current_priority() -> Priority:
+    """Priority of the work running on this thread/task, `Priority.BACKGROUND` by default."""
+    value = _priority.get()
+    return Priority.BACKGROUND if value is None else value[0]
+
+
+def current_origin() -> Optional[str]:
+    """The chat the work running on this thread/task is done for, if any."""
+    value = _priority.get()
+    return None if value is None else value[2]
+
+
+def active(value: Priority, excluding: Optional[str] = None) -> int:
+    """
+    Number of threads/tasks currently running work of the given priority (set with
+    `priority`), not counting the work done for the chat `excluding`.
+    """
+    with _active_lock:
+        counts = _active[value]
+        return counts.total() - (counts[excluding] if excluding is not None else 0)
+
+
+@contextlib.contextmanager
+def priority(
+    value: Priority, count: bool = True, origin: Optional[str] = None
+) -> Iterator[None]:
+    """
+    Runs the block (on this thread/task) with the given priority.
+
+    Each thread/task counts in `active` at the priority of its innermost block, a nested
+    block of the same thread/task moves its count, one of a new task or thread (e.g.
+    parallel tool calls of a chat turn) adds its own & leaves the outer one counted. The
+    block is not counted if `count` is False (it is part of work that is counted
+    already). It is done for the chat `origin`, the outer block's if None.
+    """
+    outer = _priority.get()
+    owner = _owner()
+    if origin is None and outer is not None:
+        origin = outer[2]
+    # the count of the outer block this block takes over, if it is this thread/task's
+    previous = outer if outer is not None and outer[1] == owner else None
+    if count:
+        with _active_lock:
+            if previous is not None:
+                _adjust(previous[0], previous[2], -1)
+            _adjust(value, origin, 1)
+    # an uncounted block leaves the counting to the outer block's owner
+    token = _priority.set(
+        (value, owner if count else (outer[1] if outer else None), origin)
+    )
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+        if count:
+            with _active_lock:
+                _adjust(value, origin, -1)
+                if previous is not None:
+                    _adjust(previous[0], previous[2], 1)
+
+
+# version suffix of model names, `gemini-2.0-flash` is an alias of `gemini-2.0-flash-001`
+_VERSION_SUFFIX = re.compile(r"-(\d{3}|latest)$")
+
+
+class DailyLimitExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Requests per minute & per day allowance of one model.
+
+    The bucket holds at most one request & refills at `rpm / 60` requests per second,
+    so requests are spaced evenly & never exceed the RPM in any minute (no limit if
+    `rpm` is None). Waiting requests are served strictly by (priority, arrival).
+    """
+
+    def __init__(self, rpm: Optional[float], rpd: Optional[int]):
+        self.rpm = rpm
+        self.rpd = rpd
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.day = datetime.date.today()
+        self.day_count = 0
+        self.waiters: list[tuple[int, int]] = []  # heap of (priority, arrival)
+        self.cond = threading.Condition()
+        # metrics
+        self.requests = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.wait_by_priority: dict[str, float] = {}
+
+    def _take(self) -> float:
+        """Takes a request if available, else returns the seconds until one is."""
+        if self.rpm is None:
+            return 0
+        now = time.monotonic()
+        self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rpm / 60)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) * 60 / self.rpm
+
+    def acquire(self, prio: Priority, seq: int) -> float:
+        """Blocks until the request may be sent, returns the seconds waited."""
+        start = time.monotonic()
+        ticket = (int(prio), seq)
+        with self.cond:
+            today = datetime.date.today()
+            if today != self.day:
+                self.day, self.day_count = today, 0
+            if self.rpd is not None and self.day_count >= self.rpd:
+                raise DailyLimitExceeded(f"Daily limit of {self.rpd} requests reached")
+            self.day_count += 1
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    if self.waiters[0] == ticket:
+                        wait = self._take()
+                        if wait == 0:
+                            break
+                        self.cond.wait(wait)
+                    else:
+                        self.cond.wait()
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.cond.notify_all()
+            waited = time.monotonic() - start
+            self.requests += 1
+            if waited > 0.001:
+                self.waited += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.wait_by_priority[prio.name] = (
+                self.wait_by_priority.get(prio.name, 0.0) + waited
+            )
+            return waited
+
+    def stats(self) -> dict[str, Any]:
+        with self.cond:
+            return {
+                "rpm": self.rpm,
+                "rpd": self.rpd,
+                "requests_today": self.day_count,
+                "requests": self.requests,
+                "waited": self.waited,
+                "queued": len(self.waiters),
+                "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+                "max_wait": self.max_wait,
+                "wait_by_priority": dict(self.wait_by_priority),
+            }
+
+
+class RateLimiter:
+    """
+    Process wide rate limiter with one `TokenBucket` per model.
+
+    RPM comes from `config.model_RPM_map` (`config.DEFAULT_RPM` for unlisted models)
+    & requests per day from `config.model_RPD_map`. Aliases of a listed model share
+    its bucket.
+    """
+
+    def __init__(self):
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._arrivals = itertools.count()
+
+    def bucket(self, model: str) -> TokenBucket:
+        model = self._listed(model.removeprefix("models/"))
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(
+                    config.model_RPM_map.get(model, config.DEFAULT_RPM),
+                    config.model_RPD_map.get(model),
+                )
+            return self._buckets[model]
+
+    @staticmethod
+    def _listed(model: str) -> str:
+        """The `config.model_RPM_map` entry `model` is an alias of, `model` itself if none."""
+        if model in config.model_RPM_map:
+            return model
+        base = _VERSION_SUFFIX.sub("", model)
+        for listed in config.model_RPM_map:
+            if _VERSION_SUFFIX.sub("", listed) == base:
+                return listed
+        return model
+
+    def acquire(self, model: str) -> float:
+        """
+        Blocks until a request to `model` may be sent, by this thread's priority.
+
+        A scheduler job gives its slot to other jobs while it waits.
+        """
+        from scheduler import scheduler  # imports this module
+
+        with scheduler.waiting():
+            return self.bucket(model).acquire(current_priority(), next(self._arrivals))
+
+    def limit(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps a `client.models` method taking a `model` keyword argument."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.acquire(kwargs["model"])
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def limit_async(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps a `client.aio.models` method, waiting for the bucket off the event loop."""
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            await asyncio.to_thread(
+                self.bucket(kwargs["model"]).acquire,
+                current_priority(),
+                next(self._arrivals),
+            )
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    def install(self, client: genai.Client) -> None:
+        """Makes every generation request of the client go through the limiter."""
+        client.models.generate_content = self.limit(client.models.generate_content)  # type: ignore
+        client.models.generate_content_stream = self.limit(  # type: ignore
+            client.models.generate_content_stream
+        )
+        client.aio.models.generate_content = self.limit_async(  # type: ignore
+            client.aio.models.generate_content
+        )
+        client.aio.models.generate_content_stream = self.limit_async(  # type: ignore
+            client.aio.models.generate_content_stream
+        )
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {model: bucket.stats() for model, bucket in buckets.items()}
+
+
+limiter = RateLimiter()
@@ -0,0 +1,87 @@
+# refresher.py
+import datetime
+import heapq
+import itertools
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Refresher(Generic[T]):
+    """
+    Refreshes expiring items (e.g. Files API uploads) shortly before they expire.
+
+    Tracked items are kept in a min-heap on their expiration time, a background thread
+    sleeps until the earliest one is `lead` away from expiring & then refreshes it if it
+    is still hot, otherwise lets it lapse. Refreshed items have to be `track`ed again
+    with their new expiration time (e.g. by the upload itself).
+
+    Attributes:
+        expires_at (Callable[[T], Optional[datetime.datetime]]): Current expiration time of an item.
+        is_hot (Callable[[T], bool]): Whether an item is worth refreshing.
+        refresh (Callable[[T], None]): Refreshes an item, may run in the background.
+        lead (datetime.timedelta): How long before the expiration an item is refreshed.
+        refreshed (int): Number of items refreshed.
+        lapsed (int): Number of cold items let expire.
+    """
+
+    expires_at: Callable[[T], Optional[datetime.datetime]]
+    is_hot: Callable[[T], bool]
+    refresh: Callable[[T], None]
+    lead: datetime.timedelta
+    refreshed: int
+    lapsed: int
+
+    def __init__(
+        self,
+        expires_at: Callable[[T], Optional[datetime.datetime]],
+        is_hot: Callable[[T], bool],
+        refresh: Callable[[T], None],
+        lead: datetime.timedelta,
+    ):
+        self.expires_at = expires_at
+        self.is_hot = is_hot
+        self.refresh = refresh
+        self.lead = lead
+        self.refreshed = 0
+        self.lapsed = 0
+        self._heap: list[tuple[datetime.datetime, int, T]] = []
+        self._counter = itertools.count()  # tie breaker, items are not comparable
+        self._cond = threading.Condition()
+
+    def track(self, item: T) -> None:
+        expires_at = self.expires_at(item)
+        if expires_at is None:
+            return  # never expires
+        with self._cond:
+            heapq.heappush(self._heap, (expires_at, next(self._counter), item))
+            if self._heap[0][2] is item:
+                self._cond.notify()  # the thread sleeps until a later item
+
+    def run(self) -> None:
+        """Refreshes items forever, run it in a daemon thread."""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    now = datetime.datetime.now(datetime.timezone.utc)
+                    due = self._heap[0][0] - self.lead
+                    if due <= now:
+                        expires_at, _, item = heapq.heappop(self._heap)
+                        break
+                    self._cond.wait((due - now).total_seconds())
+            if self.expires_at(item) != expires_at:
+                continue  # refreshed in the meantime, tracked again with the new time
+            if expires_at <= datetime.datetime.now(datetime.timezone.utc):
+                continue  # already expired, refreshed lazily when used again
+            if not self.is_hot(item):
+                self.lapsed += 1
+                continue
+            try:
+                self.refresh(item)
+                self.refreshed += 1
+            except Exception as e:
+                print(f"Error refreshing {item}: {e}")
@@ -0,0 +1,346 @@
+# scheduler.py
+import collections
+import concurrent.futures
+import contextlib
+import heapq
+import itertools
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import config
+from ratelimit import Priority, active, current_origin, current_priority, priority
+
+
+def percentiles(samples: Iterable[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0, "p50": 0.0, "p95": 0.0}
+    return {
+        "count": len(ordered),
+        "p50": ordered[(len(ordered) - 1) * 50 // 100],
+        "p95": ordered[(len(ordered) - 1) * 95 // 100],
+    }
+
+
+class _Job:
+    __slots__ = (
+        "lane",
+        "priority",
+        "origin",
+        "fn",
+        "args",
+        "kwargs",
+        "future",
+        "queued_at",
+        "deferred",
+    )
+
+    def __init__(
+        self,
+        lane: "Lane",
+        prio: Priority,
+        origin: Optional[str],
+        fn: Callable[..., Any],
+        args: tuple,
+        kwargs: dict[str, Any],
+    ):
+        self.lane = lane
+        self.priority = prio
+        self.origin = origin
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.queued_at = time.monotonic()
+        self.deferred = False
+
+
+class Lane(concurrent.futures.Executor):
+    """
+    Executor view of the `Scheduler` running at most `max_workers` of its jobs at once.
+
+    A drop-in for `ThreadPoolExecutor`: jobs are queued in the scheduler with `priority`
+    (the submitting thread's priority if None) & run on the scheduler's threads.
+
+    Jobs of a lane without a fixed priority, or whose jobs are not `counted`, are part
+    of the submitter's work & done for its chat (see `ratelimit.current_origin`), they
+    are not held back for that chat's own interactive & tool work, which waits on them.
+
+    Attributes:
+        max_workers (int): Maximum number of jobs of this lane running at once.
+        priority (Optional[Priority]): Priority of the jobs, None for the submitter's.
+        counted (bool): Whether running jobs count as active work of their priority,
+            False if the submitter waits on them & is counted already.
+        capped (bool): Whether the jobs take one of the scheduler's `max_workers` slots,
+            False only for the steps of a chat turn itself.
+        running (int): Number of jobs of this lane running.
+    """
+
+    max_workers: int
+    priority: Optional[Priority]
+    counted: bool
+    capped: bool
+    running: int
+
+    def __init__(
+        self,
+        scheduler: "Scheduler",
+        max_workers: int,
+        priority: Optional[Priority] = None,
+        counted: bool = True,
+        capped: bool = True,
+    ):
+        self.max_workers = max_workers
+        self.priority = priority
+        self.counted = counted
+        self.capped = capped
+        self.running = 0
+        self._scheduler = scheduler
+        self._futures: set[concurrent.futures.Future] = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn: Callable[..., Any], /, *args, **kwargs) -> concurrent.futures.Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = self._scheduler._enqueue(
+                _Job(
+                    self,
+                    self.priority if self.priority is not None else current_priority(),
+                    (
+                        current_origin()
+                        if self.priority is None or not self.counted
+                        else None
+                    ),
+                    fn,
+                    args,
+                    kwargs,
+                )
+            )
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            futures = list(self._futures)
+        if cancel_futures:
+            for future in futures:
+                future.cancel()
+        if wait:
+            concurrent.futures.wait(futures)
+
+
+class Scheduler:
+    """
+    Central priority scheduler of the work running besides the chat turns themselves.
+
+    Jobs (research fetches & summaries, mail polling, ...) are queued by (priority,
+    arrival) & at most `max_workers` of them run at once, so the queue order decides
+    which job runs next. Jobs of uncapped lanes (the steps of chat turns) & jobs
+    waiting on other jobs (see `waiting`) do not take a slot. They run on a shared pool
+    of threads that grows as needed & shrinks when idle. A job runs with its priority
+    set (see `ratelimit.priority`) so its Gemini requests are rate limited accordingly.
+    While interactive or tool work of a chat is running, queued background jobs not
+    done for that chat are held back (preempted) until it is done or they waited
+    `max_defer` seconds.
+
+    Attributes:
+        max_defer (float): Longest a background job is held back for interactive work.
+        max_workers (int): Maximum number of capped jobs running at once.
+        idle_timeout (float): Seconds after which an idle thread exits.
+        preempted (int): Number of background jobs held back at least once.
+    """
+
+    max_defer: float
+    max_workers: int
+    idle_timeout: float
+    preempted: int
+
+    POLL_INTERVAL = 0.05  # re-check held back jobs this often
+    SAMPLES = 1000  # latency samples kept per metric
+
+    def __init__(self, max_defer: float, max_workers: int, idle_timeout: float = 60):
+        self.max_defer = max_defer
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self.preempted = 0
+        self._queue: list[tuple[int, int, _Job]] = []  # heap of (priority, arrival, job)
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = 0
+        self._busy = 0  # threads running a job
+        self._running = 0  # capped jobs running & not waiting on other jobs
+        self._local = threading.local()  # the job running on the thread
+        self._submitted: dict[str, int] = {value.name: 0 for value in Priority}
+        self._waits: dict[str, collections.deque[float]] = {
+            value.name: collections.deque(maxlen=self.SAMPLES) for value in Priority
+        }
+        self._latencies: dict[str, collections.deque[float]] = {}
+        self._default = Lane(self, sys.maxsize)
+
+    def executor(
+        self,
+        max_workers: int,
+        priority: Optional[Priority] = None,
+        counted: bool = True,
+        capped: bool = True,
+    ) -> Lane:
+        """New lane running at most `max_workers` jobs at once, usable like a `ThreadPoolExecutor`."""
+        return Lane(self, max_workers, priority, counted, capped)
+
+    def submit(self, fn: Callable[..., Any], /, *args, **kwargs) -> concurrent.futures.Future:
+        """Queues a job with the submitting thread's priority & no concurrency limit."""
+        return self._default.submit(fn, *args, **kwargs)
+
+    @contextlib.contextmanager
+    def waiting(self) -> Iterator[None]:
+        """
+        Gives the running job's slot back while the block waits on other jobs.
+
+        Jobs that wait on jobs of nested lanes must do so in this block, otherwise they
+        could take every slot & wait forever on jobs that never get one.
+        """
+        job: Optional[_Job] = getattr(self._local, "job", None)
+        if job is None or not job.lane.capped:
+            yield
+            return
+        with self._cond:
+            self._running -= 1
+            self._wake()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running += 1  # may exceed `max_workers` for a moment
+
+    def record_latency(self, name: str, seconds: float) -> None:
+        """Records a latency sample (e.g. of a chat turn) reported by `stats`."""
+        with self._cond:
+            if name not in self._latencies:
+                self._latencies[name] = collections.deque(maxlen=self.SAMPLES)
+            self._latencies[name].append(seconds)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            queued = {value.name: 0 for value in Priority}
+            for _, _, job in self._queue:
+                queued[job.priority.name] += 1
+            return {
+                "threads": self._threads,
+                "busy": self._busy,
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "queued": queued,
+                "submitted": dict(self._submitted),
+                "preempted": self.preempted,
+                "queue_wait": {
+                    name: percentiles(waits) for name, waits in self._waits.items()
+                },
+                "latency": {
+                    name: percentiles(samples)
+                    for name, samples in self._latencies.items()
+                },
+            }
+
+    def _enqueue(self, job: _Job) -> concurrent.futures.Future:
+        with self._cond:
+            heapq.heappush(self._queue, (int(job.priority), next(self._arrivals), job))
+            self._submitted[job.priority.name] += 1
+            self._wake()
+        return job.future
+
+    def _wake(self) -> None:
+        """Gets a thread to look at the queue, called with `_cond` held."""
+        if self._threads == self._busy:
+            self._spawn()
+        else:
+            self._cond.notify()
+
+    def _spawn(self) -> None:
+        self._threads += 1
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def _take(self) -> Optional[_Job]:
+        """Pops the first job allowed to run now, called with `_cond` held."""
+        now = time.monotonic()
+        skipped = []
+        job = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            candidate = entry[2]
+            if candidate.lane.running >= candidate.lane.max_workers or (
+                candidate.lane.capped and self._running >= self.max_workers
+            ):
+                skipped.append(entry)
+                continue
+            if (
+                candidate.priority == Priority.BACKGROUND
+                and now - candidate.queued_at < self.max_defer
+                and active(Priority.INTERACTIVE, candidate.origin)
+                + active(Priority.TOOL, candidate.origin)
+                > 0
+            ):
+                if not candidate.deferred:
+                    candidate.deferred = True
+                    self.preempted += 1
+                skipped.append(entry)
+                continue
+            job = candidate
+            break
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        if job is not None:
+            job.lane.running += 1
+            self._running += job.lane.capped
+            self._busy += 1
+            self._waits[job.priority.name].append(now - job.queued_at)
+            if self._queue and self._threads == self._busy:
+                self._spawn()  # grow one thread at a time while there is work
+        return job
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                idle_since = time.monotonic()
+                job = self._take()
+                while job is None:
+                    if time.monotonic() - idle_since > self.idle_timeout:
+                        self._threads -= 1
+                        return
+                    self._cond.wait(
+                        self.POLL_INTERVAL if self._queue else self.idle_timeout
+                    )
+                    job = self._take()
+            self._run(job)
+
+    def _run(self, job: _Job) -> None:
+        try:
+            if not job.future.set_running_or_notify_cancel():
+                return
+            self._local.job = job
+            try:
+                with priority(job.priority, job.lane.counted, job.origin):
+                    result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+        finally:
+            self._local.job = None
+            with self._cond:
+                job.lane.running -= 1
+                self._running -= job.lane.capped
+                self._busy -= 1
+                self._cond.notify_all()
+
+
+scheduler = Scheduler(config.SCHEDULER_MAX_DEFER, config.SCHEDULER_MAX_WORKERS)
@@ -0,0 +1,219 @@
+# selector.py
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
+
+from google.genai import types
+
+import config
+import tokens
+
+if TYPE_CHECKING:
+    from main import Message
+
+# Keywords hinting that a tool is needed, checked against the lower cased user message
+TOOL_HINTS: dict[str, re.Pattern[str]] = {
+    "FetchWebsite": re.compile(r"https?://|www\.|\b(website|web ?page|url|link|article)\b"),
+    "Reminder": re.compile(
+        r"\b(remind|reminder|alarm|schedule|todo|to-do|task|deadline|tomorrow|tonight)\b"
+    ),
+    "SearchGrounding": re.compile(
+        r"\b(search|google|latest|news|today|current|weather|price|score|who won|recent)\b"
+    ),
+    "ComputerTool": re.compile(
+        r"\b(run|execute|install|script|terminal|shell|command|compile|folder|directory|pip|npm)\b"
+    ),
+    "Imagen": re.compile(
+        r"\b(draw|paint|sketch|illustrat\w*|generate (an? )?(image|picture|photo|logo)|edit (the |this )?(image|photo))\b"
+    ),
+}
+# Keywords hinting that the request needs more than a fast, small model
+REASONING_HINTS = re.compile(
+    r"\b(why|explain|prove|proof|derive|analy[sz]e|compare|design|architect\w*|plan|"
+    r"debug|refactor|optimi[sz]e|step by step|reason\w*|research|essay|detailed)\b"
+)
+
+
+class Features(NamedTuple):
+    """Compact description of the latest user turn, used as the selection cache key."""
+
+    tool_hints: frozenset[str]
+    reasoning: bool
+    length_bucket: int  # 0: short, 1: medium, 2: long
+    code: bool
+    mime_types: tuple[str, ...]
+
+
+def extract_features(text: str, mime_types: list[str]) -> Features:
+    lowered = text.lower()
+    return Features(
+        tool_hints=frozenset(
+            name for name, pattern in TOOL_HINTS.items() if pattern.search(lowered)
+        ),
+        reasoning=bool(REASONING_HINTS.search(lowered)),
+        length_bucket=0 if len(text) < 200 else 1 if len(text) < 1000 else 2,
+        code="```" in text,
+        mime_types=tuple(sorted(set(mime_types))),
+    )
+
+
+def heuristic_tools(features: Features) -> Optional[list[str]]:
+    """
+    Picks the tools locally, None if the request is too ambiguous to decide without the selector model.
+    """
+    if len(features.tool_hints) > 1 or features.code or features.length_bucket == 2:
+        return None
+    if any(mime.startswith("video/") for mime in features.mime_types):
+        return None  # video questions are often about things on the web too
+    return sorted(features.tool_hints)
+
+
+def heuristic_model(features: Features, tools: list[str]) -> Optional[str]:
+    """
+    Picks `config.HEURISTIC_MODEL` for simple requests it supports, None otherwise.
+    """
+    model = config.HEURISTIC_MODEL
+    if model is None or features.reasoning or features.length_bucket != 0:
+        return None
+    if "SearchGrounding" in tools and model not in config.SearchGroundingSuportedModels:
+        return None
+    if tools and model not in config.ToolSuportedModels:
+        return None
+    return model
+
+
+def message_summary(msg: "Message") -> str:
+    """
+    Text only rendering of a message for the selector model.
+
+    Attachments, function calls & responses are replaced by short placeholders so that
+    nothing has to be uploaded just to pick a model.
+    """
+    lines: list[str] = []
+    for content in msg.content:
+        if content.thought:
+            continue
+        if content.text:
+            lines.append(content.text)
+        elif content.attachment:
+            lines.append(
+                f"[Attachment: {content.attachment.type} `{content.attachment.filename}`]"
+            )
+        elif content.function_call:
+            lines.append(f"[Called tool `{content.function_call.name}`]")
+        elif content.function_response:
+            lines.append(f"[Tool `{content.function_response.name}` responded]")
+            for inline in content.function_response.inline_data:
+                if inline.attachment:
+                    lines.append(f"[Attachment: {inline.attachment.type}]")
+    return "\n".join(lines)
+
+
+def build_context(messages: list["Message"], max_tokens: int) -> list[types.Content]:
+    """
+    Builds the selector model's context from the latest messages within `max_tokens`.
+
+    Messages are added from the newest backwards until the budget is used up, the one
+    crossing the budget is truncated.
+    """
+    contents: list[types.Content] = []
+    budget = max_tokens
+    for msg in reversed(messages):
+        text = message_summary(msg)
+        if not text:
+            continue
+        cost = tokens.estimate(text)
+        if cost > budget:
+            text = tokens.truncate(text, budget)
+            budget = 0
+        else:
+            budget -= cost
+        contents.append(types.Content(parts=[types.Part(text=text)], role=msg.role))
+        if budget <= 0:
+            break
+    contents.reverse()
+    return contents
+
+
+class SelectionCache:
+    """
+    TTL cache of model/tool selections keyed on the conversation fingerprint.
+
+    Attributes:
+        ttl (float): Seconds a selection stays valid.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that were not in the cache.
+        heuristic (int): Selections made by the local heuristic.
+        escalated (int): Selections that needed the selector model.
+    """
+
+    ttl: float
+    hits: int
+    misses: int
+    heuristic: int
+    escalated: int
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.heuristic = 0
+        self.escalated = 0
+        self._entries: dict[tuple, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(
+        chat_id: str,
+        model: Optional[str],
+        selected_tools: Optional[list[str]],
+        thinking_budget: Optional[int],
+        features: Features,
+    ) -> tuple:
+        return (
+            chat_id,
+            model,
+            tuple(sorted(selected_tools)) if selected_tools is not None else None,
+            thinking_budget,
+            features,
+        )
+
+    def get(self, key: tuple) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, selection: Any, heuristic: bool) -> None:
+        """Caches a selection made by the local heuristic or (if not `heuristic`) the selector model."""
+        now = time.monotonic()
+        with self._lock:
+            if heuristic:
+                self.heuristic += 1
+            else:
+                self.escalated += 1
+            # drop expired entries so the cache does not grow forever
+            for stale in [k for k, (expiry, _) in self._entries.items() if expiry < now]:
+                del self._entries[stale]
+            self._entries[key] = (now + self.ttl, selection)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "heuristic": self.heuristic,
+                "escalated": self.escalated,
+                "entries": len(self._entries),
+            }
+
+
+selection_cache = SelectionCache(config.SELECTION_CACHE_TTL)
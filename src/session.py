@@ -0,0 +1,270 @@
+# session.py
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import fnmatch
+import re
+import threading
+from typing import Any, Coroutine, Iterator, Optional
+
+import config
+from tools.space import space_path
+
+
+class Settings:
+    """
+    Model, tools & thinking budget chosen in a browser tab, None for "Auto".
+
+    Attributes:
+        model (Optional[str]): Name of the `config.Models` member.
+        selected_tools (Optional[list[str]]): Names of the `tools.Tools` members.
+        thinking_budget (Optional[int]): Thinking budget in tokens, None to disable thinking.
+    """
+
+    model: Optional[str]
+    selected_tools: Optional[list[str]]
+    thinking_budget: Optional[int]
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        selected_tools: Optional[list[str]] = None,
+        thinking_budget: Optional[int] = None,
+    ):
+        self.model = model
+        self.selected_tools = selected_tools
+        self.thinking_budget = thinking_budget
+
+    def copy(self) -> "Settings":
+        return Settings(
+            self.model,
+            list(self.selected_tools) if self.selected_tools is not None else None,
+            self.thinking_budget,
+        )
+
+
+class PermissionRequest:
+    """
+    A permission asked to a session, answered through `future`.
+
+    Attributes:
+        future (concurrent.futures.Future[bool]): Resolved with the answer.
+        action (Optional[str]): Kind of operation (e.g. "read_file"), None if it can't be remembered.
+        target (Optional[str]): What the operation is on, e.g. the command or relative path.
+    """
+
+    future: concurrent.futures.Future[bool]
+    action: Optional[str]
+    target: Optional[str]
+
+    def __init__(self, action: Optional[str], target: Optional[str]):
+        self.future = concurrent.futures.Future()
+        self.action = action
+        self.target = target
+
+
+class Session:
+    """
+    A connected browser tab (Socket.IO sid) with its own settings & permission requests.
+
+    Attributes:
+        sid (str): Socket.IO session id.
+        settings (Settings): Current settings, snapshotted by every turn it starts.
+        permissions (dict[str, PermissionRequest]): Pending permission requests by id.
+        approved (set[tuple[str, Optional[str]]]): Approved (action, target)s, target None for the whole action.
+    """
+
+    sid: str
+    settings: Settings
+    permissions: dict[str, PermissionRequest]
+    approved: set[tuple[str, Optional[str]]]
+
+    def __init__(self, sid: str):
+        self.sid = sid
+        self.settings = Settings()
+        self.permissions = {}
+        self.approved = set()
+
+    def is_approved(self, action: str, target: Optional[str]) -> bool:
+        """Whether the user already approved the operation (or all of its kind) in this session."""
+        with _lock:
+            return (action, None) in self.approved or (action, target) in self.approved
+
+
+_sessions: dict[str, Session] = {}
+_lock = threading.Lock()
+
+# Commands are only allowlisted if they do not chain or redirect into other commands
+_SHELL_METACHARACTERS = re.compile(r"[;&|`$<>\n\\(){}]")
+# Actions whose target is a path relative to the sandbox
+PATH_ACTIONS = (
+    "create_file",
+    "create_folder",
+    "delete_file",
+    "delete_folder",
+    "read_file",
+    "write_file",
+)
+
+
+def allowlisted(action: str, target: Optional[str]) -> bool:
+    """
+    Whether the operation is auto-approved by `config.PERMISSION_ALLOWLIST`.
+
+    Targets are matched against the action's `fnmatch` patterns, commands must not
+    contain shell metacharacters & paths must resolve (symlinks included) inside the
+    sandbox, they are matched relative to it.
+    """
+    patterns = config.PERMISSION_ALLOWLIST.get(action)
+    if not patterns or target is None:
+        return False
+    if action in ("run_command", "run_command_background"):
+        if _SHELL_METACHARACTERS.search(target):
+            return False
+    elif action in PATH_ACTIONS:
+        sandbox = space_path.resolve()
+        resolved = (space_path / target).resolve()
+        if not resolved.is_relative_to(sandbox):
+            return False
+        target = resolved.relative_to(sandbox).as_posix()
+    return any(fnmatch.fnmatchcase(target, pattern) for pattern in patterns)
+
+
+def get(sid: str) -> Session:
+    """Session of the sid, created on connect or first use."""
+    with _lock:
+        if sid not in _sessions:
+            _sessions[sid] = Session(sid)
+        return _sessions[sid]
+
+
+def drop(sid: str) -> None:
+    """Forgets a disconnected session, denying its pending permission requests."""
+    with _lock:
+        session = _sessions.pop(sid, None)
+    if session is not None:
+        for request in list(session.permissions.values()):
+            with contextlib.suppress(concurrent.futures.InvalidStateError):
+                request.future.set_result(False)
+
+
+def request_permission(
+    sid: str, request_id: str, action: Optional[str] = None, target: Optional[str] = None
+) -> concurrent.futures.Future[bool]:
+    """Registers a permission request of the session, answered with `answer_permission`."""
+    request = PermissionRequest(action, target)
+    with _lock:
+        session = _sessions.get(sid)
+        if session is None:
+            request.future.set_result(False)  # disconnected
+            return request.future
+        session.permissions[request_id] = request
+    request.future.add_done_callback(lambda _: session.permissions.pop(request_id, None))
+    return request.future
+
+
+def answer_permission(
+    sid: str, request_id: Optional[str], value: bool, remember: bool = False
+) -> None:
+    """
+    Resolves a pending permission request of the session, the oldest one if `request_id` is None.
+
+    Approvals are remembered for the session, for every operation of the same action
+    if `remember`, otherwise only for the same action & target.
+    """
+    session = get(sid)
+    with _lock:
+        if request_id is None:
+            request_id = next(iter(session.permissions), None)
+        request = session.permissions.get(request_id) if request_id else None
+        if request is not None and value and request.action is not None:
+            session.approved.add((request.action, None if remember else request.target))
+    if request is not None:
+        with contextlib.suppress(concurrent.futures.InvalidStateError):
+            request.future.set_result(bool(value))
+
+
+class GenerationContext:
+    """
+    What a chat turn needs to know about who asked for it.
+
+    Attributes:
+        chat_id (str): Chat the turn belongs to.
+        sid (Optional[str]): Session that started the turn, None if not started by a client.
+        settings (Settings): Snapshot of the session's settings when the turn started.
+    """
+
+    chat_id: str
+    sid: Optional[str]
+    settings: Settings
+
+    def __init__(self, chat_id: str, sid: Optional[str], settings: Settings):
+        self.chat_id = chat_id
+        self.sid = sid
+        self.settings = settings
+
+    @classmethod
+    def for_session(cls, chat_id: str, sid: str) -> "GenerationContext":
+        return cls(chat_id, sid, get(sid).settings.copy())
+
+
+_current: contextvars.ContextVar[Optional[GenerationContext]] = contextvars.ContextVar(
+    "generation_context", default=None
+)
+
+
+def current() -> GenerationContext:
+    """Context of the turn running on this task/thread, "Auto" settings outside of a turn."""
+    ctx = _current.get()
+    return ctx if ctx is not None else GenerationContext("main", None, Settings())
+
+
+@contextlib.contextmanager
+def generation(ctx: GenerationContext) -> Iterator[None]:
+    token = _current.set(ctx)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class ChatWorkers:
+    """
+    One worker task per chat with pending turns, on the event loop.
+
+    Turns of one chat run one after another in the order they were sent, turns of
+    different chats run concurrently. A worker exits once its chat has no pending turn.
+    """
+
+    def __init__(self):
+        # only touched on the event loop
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._tasks: set[asyncio.Task] = set()  # the loop only keeps weak references
+
+    async def run(self, ctx: GenerationContext, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Queues the turn `coro` on the worker of `ctx.chat_id` & waits for its result."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(ctx.chat_id)
+        if queue is None:
+            queue = self._queues[ctx.chat_id] = asyncio.Queue()
+            task = asyncio.create_task(self._work(ctx.chat_id, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        queue.put_nowait((ctx, coro, future))
+        return await future
+
+    async def _work(self, chat_id: str, queue: asyncio.Queue):
+        while not queue.empty():
+            ctx, coro, future = queue.get_nowait()
+            try:
+                with generation(ctx):
+                    result = await coro
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        del self._queues[chat_id]
+
+
+chat_workers = ChatWorkers()
@@ -0,0 +1,105 @@
+# tokens.py
+import threading
+from typing import Callable, Iterable
+
+# Average number of characters per token of Gemini models for English text & code
+CHARS_PER_TOKEN = 4
+
+
+def estimate(text: str) -> int:
+    """Cheap local estimate of the number of tokens in `text`, no API call."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Cuts `text` down to about `max_tokens` tokens."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + " …[truncated]"
+
+
+def estimate_attachment(mime_type: str, size: int) -> int:
+    """
+    Rough number of tokens the model uses for an attachment, from its type & size in bytes.
+
+    Images are a fixed 258 tokens, videos ~300 tokens per second (taken as ~1MB/s), PDFs
+    258 tokens per page (taken as ~50KB/page) & text files are read as text.
+    """
+    if mime_type.startswith("image/"):
+        return 258
+    if mime_type.startswith("video/"):
+        return max(300, size * 300 // 1_000_000)
+    if mime_type == "application/pdf":
+        return max(258, size * 258 // 50_000)
+    return -(-size // CHARS_PER_TOKEN)
+
+
+class Counter:
+    """
+    Local token counts calibrated against the exact counts of the API.
+
+    Counts are estimated from the number of characters with the characters per token
+    ratio seen so far. Until enough was counted exactly the ratio is a conservative
+    `UNCALIBRATED_CHARS_PER_TOKEN`, so dense text (URLs, markdown tables, code) is not
+    undercounted far from a threshold & left unchecked. Only when an estimate is within
+    `MARGIN` of a threshold the caller compares it against, the exact count is asked
+    for (its request is sent only then) & used to refine the ratio.
+
+    Attributes:
+        chars (int): Characters of the texts counted exactly so far.
+        tokens (int): Exact tokens of these texts.
+        estimated (int): Number of counts answered locally.
+        counted (int): Number of counts that needed the exact count.
+    """
+
+    chars: int
+    tokens: int
+    estimated: int
+    counted: int
+
+    MARGIN = 0.15  # relative distance to a threshold under which the exact count is needed
+    UNCALIBRATED_CHARS_PER_TOKEN = 2.5  # overestimates most text until calibrated
+
+    def __init__(self):
+        self.chars = 0
+        self.tokens = 0
+        self.estimated = 0
+        self.counted = 0
+        self._lock = threading.Lock()
+
+    @property
+    def chars_per_token(self) -> float:
+        with self._lock:
+            if self.tokens < 1000:  # not enough samples yet
+                return self.UNCALIBRATED_CHARS_PER_TOKEN
+            return self.chars / self.tokens
+
+    def estimate(self, chars: int) -> int:
+        """Calibrated estimate of the tokens of a text of `chars` characters."""
+        return int(-(-chars // self.chars_per_token))
+
+    def count(
+        self, chars: int, exact: Callable[[], int], thresholds: Iterable[int] = ()
+    ) -> tuple[int, bool]:
+        """
+        Tokens of a text of `chars` characters & whether it is the exact count.
+
+        `exact` returns the exact count (e.g. with `client.models.count_tokens`) & is only
+        called if the estimate is too close to one of `thresholds` to decide on it.
+        """
+        estimate = self.estimate(chars)
+        if not any(abs(estimate - limit) <= limit * self.MARGIN for limit in thresholds):
+            with self._lock:
+                self.estimated += 1
+            return estimate, False
+        count = exact()
+        with self._lock:
+            self.counted += 1
+            if count > 0:
+                self.chars += chars
+                self.tokens += count
+        return count, True
+
+
+counter = Counter()
@@ -33,6 +33,18 @@ WriteFile = CodeExecutionEnvironment.WriteFile
 SendControlC = CodeExecutionEnvironment.SendControlC
 LinkAttachment = CodeExecutionEnvironment.LinkAttachment
 
+# Functions without side effects later calls of the same response could depend on,
+# they run concurrently with each other
+ParallelSafeTools: set[str] = {
+    "FetchWebsite",
+    "DeepResearch",
+    "Imagen",
+    "ReadFile",
+    "GetSTDOut",
+    "IsProcessRunning",
+    "LinkAttachment",
+}
+
 FetchTool = types.Tool(
     function_declarations=[
         types.FunctionDeclaration.from_callable_with_api_option(callable=FetchWebsite),
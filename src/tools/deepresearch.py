@@ -9,9 +9,12 @@ from rich import print
 from typing import Any, Callable, Optional, TYPE_CHECKING, cast
 from google.genai import types
 from global_shares import global_shares
+import config
 import prompt
+from scheduler import scheduler
 import threading
 import time
+import tokens
 import utils
 
 if TYPE_CHECKING:
@@ -26,6 +29,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def exact_token_count(contents: "str | list[types.Content]") -> int:
+    """Exact token count of the contents from the API, see `tokens.counter` for when."""
+    return (
+        utils.retry(
+            exceptions=utils.network_errors,
+            ignore_exceptions=utils.ignore_network_error,
+        )(global_shares["client"].models.count_tokens)(
+            model="gemini-2.0-flash",
+            contents=contents,  # type: ignore
+        ).total_tokens
+        or 0
+    )
+
+
 class Topic:
     topic: str
     id: str
@@ -47,6 +64,19 @@ class Topic:
     researched: bool = False
     _lock: Lock
 
+    # Attributes shown by `for_ai`, assigning one invalidates the cached rendering
+    _RENDERED = frozenset(
+        (
+            "topic",
+            "id",
+            "queries",
+            "researched",
+            "sumarized_fetched_content",
+            "fetched_content",
+            "sub_topics",
+        )
+    )
+
     def __init__(
         self,
         topic: str,
@@ -64,6 +94,15 @@ class Topic:
         fetched_urls: Optional[list[str]] = None,
         failed_fetched_urls: Optional[list[str]] = None,
     ):
+        # `for_ai` caches, keyed on (depth, include_details) with the version they were rendered at
+        self._parent: Optional[Topic] = None
+        self._version = 0  # changes with this topic or any of its subtopics
+        self._own_version = 0  # changes with this topic's own attributes
+        self._rendered: dict[tuple[int, bool], tuple[int, str]] = {}
+        self._own_rendered: dict[tuple[int, bool], tuple[int, str]] = {}
+        # `count_tokens` caches, same keys, of the rendering's length & its exact token count
+        self._chars: dict[tuple[int, bool], tuple[int, int]] = {}
+        self._exact_tokens: dict[tuple[int, bool], tuple[int, int]] = {}
         self.topic = topic
         self.id = id if id else str(uuid.uuid4())
         self.sub_topics = sub_topics if sub_topics else []  # Subtopics
@@ -76,37 +115,133 @@ class Topic:
         self.failed_fetched_urls = failed_fetched_urls if failed_fetched_urls else []
         self._lock = Lock()
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in Topic._RENDERED:
+            if name == "sub_topics":
+                for sub in value:
+                    sub._parent = self
+            self.invalidate()
+
+    def invalidate(self, own: bool = True) -> None:
+        """
+        Marks the rendering of this topic (`own`) or only of its subtopics as changed.
+
+        Needed after in place changes like `fetched_content.extend(...)`, assigning a
+        rendered attribute does it automatically. The ancestors re-render too, but reuse
+        the cached renderings of their other subtopics.
+        """
+        if own:
+            self._own_version += 1
+        node: Optional[Topic] = self
+        while node is not None:
+            node._version += 1
+            node = node._parent
+
     def for_ai(self, depth: int = 0, include_details: bool = True) -> str:
         """Format topic details for AI processing in Markdown format."""
+        key = (depth, include_details)
         with self._lock:
-            header = "#" * (depth + 1)  # Determine heading level
-            details = f"{header} {self.topic}\n\n"
-            if include_details:
-                details += f"{"This is the main Topic/Question Searched by user." if not depth else ""}\n"
-                details += f"**ID:** {self.id}\n"
-                details += f"**Researched:** {'Yes' if self.researched else 'No'}  \n\n"
-
-            if include_details and self.queries:
-                details += f"#{header} Queries Searched online: \n"
-                for query in self.queries:
-                    details += f"- {query}\n"
-                details += "\n"
-
-            if self.sumarized_fetched_content:
-                details += f"#{header} Sumarized Fetched Content:\n"
-
-            if self.fetched_content:
-                details += f"#{header} {"Additional" if self.sumarized_fetched_content else ""} Fetched Content:\n"
-                for url, markdown, links, link_info in self.fetched_content:
-                    details += f"- {url}:\n```md\n{markdown}\nExtracted Linkes in Webpage:\n{"\n".join(links)}```\n\n"
+            version = self._version
+            cached = self._rendered.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
 
+            parts = [self._render_own(depth, include_details)]
             if include_details and self.sub_topics:
-                details += f"#{header} Subtopics:\n"
+                parts.append(f"#{"#" * (depth + 1)} Subtopics:\n")
                 for sub in self.sub_topics:
-                    details += sub.for_ai(depth + 1) + "\n"
-
+                    parts.append(sub.for_ai(depth + 1))
+                    parts.append("\n")
+            details = "".join(parts)
+            self._rendered[key] = (version, details)
             return details
 
+    def char_count(self, depth: int = 0, include_details: bool = True) -> int:
+        """Length of `for_ai(depth, include_details)`, from the cached lengths of the subtopics."""
+        key = (depth, include_details)
+        with self._lock:
+            version = self._version
+            cached = self._chars.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            chars = len(self._render_own(depth, include_details))
+            if include_details and self.sub_topics:
+                chars += len(f"#{"#" * (depth + 1)} Subtopics:\n")
+                for sub in self.sub_topics:
+                    chars += sub.char_count(depth + 1) + 1
+            self._chars[key] = (version, chars)
+            return chars
+
+    def count_tokens(
+        self,
+        exact: Callable[[str], int],
+        thresholds: tuple[int, ...],
+        depth: int = 0,
+        include_details: bool = True,
+    ) -> int:
+        """
+        Tokens of `for_ai(depth, include_details)`, estimated locally with `tokens.counter`.
+
+        The rendering is only built & counted with `exact` when the estimate is too close
+        to one of `thresholds`, that count is cached until the topic changes.
+        """
+        key = (depth, include_details)
+        with self._lock:
+            version = self._version
+            cached = self._exact_tokens.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        count, is_exact = tokens.counter.count(
+            self.char_count(depth, include_details),
+            lambda: exact(self.for_ai(depth, include_details)),
+            thresholds,
+        )
+        if is_exact:
+            with self._lock:
+                self._exact_tokens[key] = (version, count)
+        return count
+
+    def _render_own(self, depth: int, include_details: bool) -> str:
+        """This topic's part of `for_ai` (without the subtopics), called with the lock held."""
+        key = (depth, include_details)
+        version = self._own_version
+        cached = self._own_rendered.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        header = "#" * (depth + 1)  # Determine heading level
+        parts = [f"{header} {self.topic}\n\n"]
+        if include_details:
+            parts.append(
+                f"{"This is the main Topic/Question Searched by user." if not depth else ""}\n"
+            )
+            parts.append(f"**ID:** {self.id}\n")
+            parts.append(f"**Researched:** {'Yes' if self.researched else 'No'}  \n\n")
+
+        if include_details and self.queries:
+            parts.append(f"#{header} Queries Searched online: \n")
+            for query in self.queries:
+                parts.append(f"- {query}\n")
+            parts.append("\n")
+
+        if self.sumarized_fetched_content:
+            parts.append(f"#{header} Sumarized Fetched Content:\n")
+
+        if self.fetched_content:
+            parts.append(
+                f"#{header} {"Additional" if self.sumarized_fetched_content else ""} Fetched Content:\n"
+            )
+            for url, markdown, links, link_info in self.fetched_content:
+                parts.append(
+                    f"- {url}:\n```md\n{markdown}\nExtracted Linkes in Webpage:\n{"\n".join(links)}```\n\n"
+                )
+
+        rendered = "".join(parts)
+        self._own_rendered[key] = (version, rendered)
+        return rendered
+
     def get_unresearched_topic(self) -> list["Topic"]:
         """
         Recursively find all unresearched topics in the topic tree.
@@ -124,6 +259,8 @@ class Topic:
         if self.id == parent_id:
             with self._lock:
                 self.sub_topics.append(topic)
+                topic._parent = self
+                self.invalidate(own=False)
                 return True
         for sub_topic in self.sub_topics:
             if sub_topic.add_topic(parent_id, topic):
@@ -172,7 +309,7 @@ class Topic:
         return Topic(
             topic=data["topic"],
             id=data.get("id"),
-            sub_topics=data.get("sub_topics"),
+            sub_topics=[Topic.from_jsonify(sub) for sub in data.get("sub_topics", [])],
             queries=data.get("queries"),
             searched_queries=data.get("searched_queries"),
             sites=data.get("urls"),
@@ -234,60 +371,9 @@ class DeepResearcher:
         if value:
             self._stop_event.set()
 
-    @utils.retry(
-        exceptions=utils.network_errors,
-        ignore_exceptions=utils.ignore_network_error,
-    )
-    def summarize_sites(self, topic: Topic) -> None:
-        self.call_back({"action": "summarize_sites", "topic": topic.id})
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            # Use an iterative approach with a worklist instead of recursion
-            topics_to_process = [topic]  # Start with the initial topic
-            futures = {}  # Map of topic.id to its future
-
-            # Process all topics in the worklist
-            i = 0
-            while i < len(topics_to_process):
-                current_topic = topics_to_process[i]
-                i += 1
-
-                if self.stop:
-                    break
-
-                # Process current topic content
-                self.call_back({"action": "summarize_sites", "topic": current_topic.id})
-                future = executor.submit(self._summarize_topic_content, current_topic)
-                futures[current_topic.id] = future
-
-                # Add subtopics to the worklist
-                topics_to_process.extend(current_topic.sub_topics)
-
-            # Wait for all futures to complete
-            for topic_id, future in futures.items():
-                if self.stop:
-                    break
-                try:
-                    future.result()  # Get the result to propagate any exceptions
-                    self.call_back(
-                        {"action": "summarize_sites_complete", "topic": topic_id}
-                    )
-                except Exception as e:
-                    print(f"Error summarizing topic content: {e}")
-                    traceback.print_exc()
-
     def _summarize_topic_content(self, topic: Topic) -> None:
         """Helper method to summarize a single topic's content using AI."""
-        tc = (
-            utils.retry(
-                exceptions=utils.network_errors,
-                ignore_exceptions=utils.ignore_network_error,
-            )(global_shares["client"].models.count_tokens)(
-                model="gemini-2.0-flash",
-                contents=types.Part(text=topic.for_ai(0, False)),
-            ).total_tokens
-            or 0
-        )  # type: ignore
+        tc = topic.count_tokens(exact_token_count, (6_00_000,), 0, False)
         if tc > 6_00_000:
             with topic._lock:
                 if topic.fetched_content:
@@ -306,14 +392,13 @@ class DeepResearcher:
                             )
                         ]
 
-                        site_tc = (
-                            utils.retry(
-                                exceptions=utils.network_errors,
-                                ignore_exceptions=utils.ignore_network_error,
-                            )(global_shares["client"].models.count_tokens)(
-                                model="gemini-2.0-flash", contents=site_content  # type: ignore
-                            ).total_tokens
-                            or 0
+                        site_tc, _ = tokens.counter.count(
+                            sum(
+                                len(part.text or "")
+                                for part in site_content[0].parts or []
+                            ),
+                            lambda: exact_token_count(site_content),
+                            (3_00_000, 15_000),
                         )
 
                         if site_tc > 3_00_000:
@@ -891,11 +976,12 @@ class DeepResearcher:
     def _search_and_fetch(
         self, unresearched_topic: Topic, visited_urls: set[str], failed_urls: set[str]
     ):
-        if not unresearched_topic.queries:
+        # a pass for sites the planner added later only fetches those
+        if not unresearched_topic.queries and not unresearched_topic.searched_queries:
+            # generated outside of the lock, the planner may be rendering the tree meanwhile
+            queries = self._generate_queries(unresearched_topic.topic)
             with unresearched_topic._lock:
-                unresearched_topic.queries = self._generate_queries(
-                    unresearched_topic.topic
-                )
+                unresearched_topic.queries = queries
             self.call_back({"action": "topic_updated"})
 
         search_state = {
@@ -905,12 +991,14 @@ class DeepResearcher:
             "topic_name": unresearched_topic.topic,
             "planed_queries": unresearched_topic.queries or [],
             "researched_queries": unresearched_topic.searched_queries or [],
-            "planed_fetchurl": unresearched_topic.urls or [],
+            # a copy, the planner may add sites to the topic while these are fetched
+            "planed_fetchurl": list(unresearched_topic.urls),
             "failed_fetchurl": unresearched_topic.failed_fetched_urls or [],
             "researched_fetchurl": unresearched_topic.fetched_urls or [],
             "urls": [],
             "fetched_urls": [],
             "fetched_failed_urls": [],
+            "cached_urls": [],  # fetched urls answered from the page cache
             "url_metadata": {},
         }
         self.call_back(search_state)
@@ -927,12 +1015,21 @@ class DeepResearcher:
                 if is_not_searched:
                     search_state["researched_fetchurl"].append(url)
                 search_state["fetched_urls"].append(url)
+                if fetch_model.get("cached"):
+                    search_state["cached_urls"].append(url)
                 url_info = fetch_model.get(
                     "url_display_info", {"url": url, "title": "", "favicon": ""}
                 )
                 search_state["url_metadata"][url] = url_info
+                result = (url, fetch_model["markdown"], fetch_model["links"], url_info)
+                # visible to the planner & summaries right away, not once the topic is done
+                with unresearched_topic._lock:
+                    if unresearched_topic.fetched_content is None:
+                        unresearched_topic.fetched_content = []
+                    unresearched_topic.fetched_content.append(result)
+                    unresearched_topic.invalidate()
                 self.call_back(search_state)
-                return (url, fetch_model["markdown"], fetch_model["links"], url_info)
+                return result
             failed_urls.add(url)
             if is_not_searched:
                 search_state["failed_fetchurl"].append(url)
@@ -943,7 +1040,7 @@ class DeepResearcher:
         def process_urls(
             urls: list[str],
             is_not_searched: bool,
-            executor: concurrent.futures.ThreadPoolExecutor,
+            fetch_lane: concurrent.futures.Executor,
             executor_lock: Lock,
         ) -> list[tuple[str, str, list[str], dict]]:
             results = []
@@ -956,7 +1053,7 @@ class DeepResearcher:
                     visited_urls.add(url)
                     # Submit the fetch task to the thread pool
                     with executor_lock:
-                        future = executor.submit(
+                        future = fetch_lane.submit(
                             fetch_with_handling, url, is_not_searched
                         )
                     futures.append(future)
@@ -968,24 +1065,25 @@ class DeepResearcher:
                         search_state["fetched_urls"].append(url)
 
             # Collect results from all futures
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                except Exception as e:
-                    print(f"Error in future execution: {e}")
-                    traceback.print_exc()
+            with scheduler.waiting():
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        result = future.result()
+                        if result:
+                            results.append(result)
+                    except Exception as e:
+                        print(f"Error in future execution: {e}")
+                        traceback.print_exc()
 
             return results
 
         def search_and_fetch_query(
             query: str,
-            executor: concurrent.futures.ThreadPoolExecutor,
+            fetch_lane: concurrent.futures.Executor,
             executor_lock: Lock,
         ):
             urls = self._search_online(query)
-            result = process_urls(urls, False, executor, executor_lock)
+            result = process_urls(urls, False, fetch_lane, executor_lock)
             search_state["planed_queries"].remove(query)
             search_state["researched_queries"].append(query)
             with unresearched_topic._lock:
@@ -995,25 +1093,34 @@ class DeepResearcher:
             self.call_back({"action": "topic_updated"})
             return result
 
-        # Somewhere in your method:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
+        # this job only waits on the nested jobs, it gives its slot to them meanwhile.
+        # The queries wait on the fetches they submit, so these get a lane of their own
+        # that the queries can't fill up
+        with (
+            scheduler.waiting(),
+            scheduler.executor(max_workers=self.max_search_queries + 1) as query_lane,
+            scheduler.executor(max_workers=32) as fetch_lane,
+        ):
             executor_lock = Lock()
             with unresearched_topic._lock:
                 if unresearched_topic.fetched_content is None:
                     unresearched_topic.fetched_content = []
+                # copies, the workers remove what they are done with from the topic's lists
+                queries = list(unresearched_topic.queries)
+                sites = list(unresearched_topic.urls)
                 with executor_lock:
                     futures = [
-                        executor.submit(
-                            search_and_fetch_query, query, executor, executor_lock
+                        query_lane.submit(
+                            search_and_fetch_query, query, fetch_lane, executor_lock
                         )
-                        for query in unresearched_topic.queries
+                        for query in queries
                     ]
                     futures.append(
-                        executor.submit(
+                        query_lane.submit(
                             process_urls,
-                            unresearched_topic.urls,
+                            sites,
                             True,
-                            executor,
+                            fetch_lane,
                             executor_lock,
                         )
                     )
@@ -1037,9 +1144,7 @@ class DeepResearcher:
                         completed.add(future)
 
                         try:
-                            results = future.result()
-                            with unresearched_topic._lock:
-                                unresearched_topic.fetched_content.extend(results)
+                            future.result()
                         except Exception as e:
                             print(f"Error during concurrent execution: {e}")
                             traceback.print_exc()
@@ -1049,110 +1154,146 @@ class DeepResearcher:
         with unresearched_topic._lock:
             unresearched_topic.queries = search_state["planed_queries"]
             unresearched_topic.searched_queries = search_state["researched_queries"]
-            unresearched_topic.urls = search_state["planed_fetchurl"]
             unresearched_topic.failed_fetched_urls = search_state["failed_fetchurl"]
             unresearched_topic.fetched_urls = search_state["researched_fetchurl"]
-            unresearched_topic.researched = True
+            # sites added by the planner meanwhile are kept & fetched in another pass
+            handled = set(sites)
+            unresearched_topic.urls = [
+                url for url in unresearched_topic.urls if url not in handled
+            ]
+            unresearched_topic.researched = not unresearched_topic.urls
         self.call_back({"action": "topic_updated"})
 
     def research(self) -> list["Content"]:
-        current_depth: int = 0
+        """
+        Researches the query & returns the report.
+
+        Runs as a pipeline: every unresearched topic (including ones the planner is adding
+        right now) is searched & fetched as soon as it appears, fetched pages land on their
+        topic one by one & the planner runs on the tree as it is while fetching continues.
+        It waits for topics still being fetched at most
+        `config.RESEARCH_PLANNER_MAX_STALENESS` seconds after the first result it has not
+        seen yet. Once the tree outgrows the token budget its topics are summarized as
+        jobs of the summary lane (the planner waits for those), & from then on every topic
+        as it finishes.
+        """
         visited_urls: set[str] = set()
         failed_urls: set[str] = set()
+        researching: dict[concurrent.futures.Future, Topic] = {}
+        summarizing: dict[concurrent.futures.Future, Topic] = {}
+        given_up: set[str] = set()  # topics whose research failed
+        planner: Optional[concurrent.futures.Future] = None
+        plans = 0  # same budget as the rounds of the former lockstep loop
+        max_plans = (self.max_topics or float("inf")) - 1
+        unplanned_since: Optional[float] = None  # oldest result the planner has not seen
+        compress = False  # the tree outgrew the budget, summarize topics as they finish
+        over_budget = False  # still too large after summarizing, stop growing the tree
         try:
-            while not self.stop:
-                unresearched_topics = self.topic.get_unresearched_topic()
-                if not unresearched_topics:
-                    break
-
-                # Use ThreadPoolExecutor to process multiple unresearched topics in parallel
-                with concurrent.futures.ThreadPoolExecutor(
-                    max_workers=min(6, len(unresearched_topics))
-                ) as executor:
-                    futures = []
-
-                    # Submit tasks for each unresearched topic
-                    for topic in unresearched_topics:
-                        if self.stop:
-                            raise DeepResearcher.StopResearch()
+            with (
+                scheduler.executor(max_workers=6) as topic_lane,
+                scheduler.executor(max_workers=10) as summary_lane,
+                scheduler.executor(max_workers=1) as planner_lane,
+            ):
+                while not self.stop:
+                    busy = {topic.id for topic in researching.values()}
+                    busy.update(topic.id for topic in summarizing.values())
+                    if not over_budget:
+                        for topic in self.topic.get_unresearched_topic():
+                            if topic.id not in busy and topic.id not in given_up:
+                                busy.add(topic.id)
+                                future = topic_lane.submit(
+                                    self._search_and_fetch,
+                                    topic,
+                                    visited_urls,
+                                    failed_urls,
+                                )
+                                researching[future] = topic
 
-                        # Submit the search and fetch task to the thread pool
-                        future = executor.submit(
-                            self._search_and_fetch, topic, visited_urls, failed_urls
-                        )
-                        futures.append(future)
+                    concurrent.futures.wait(
+                        [*researching, *summarizing, *((planner,) if planner else ())],
+                        timeout=0.1,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
 
-                    completed = set()
+                    for future in [f for f in researching if f.done()]:
+                        topic = researching.pop(future)
+                        try:
+                            future.result()
+                        except DeepResearcher.StopResearch:
+                            raise
+                        except Exception:
+                            traceback.print_exc()
+                            given_up.add(topic.id)
+                        if unplanned_since is None:
+                            unplanned_since = time.monotonic()
+                        if compress:
+                            self.call_back(
+                                {"action": "summarize_sites", "topic": topic.id}
+                            )
+                            future = summary_lane.submit(
+                                self._summarize_topic_content, topic
+                            )
+                            summarizing[future] = topic
 
-                    while len(completed) < len(futures):
+                    for future in [f for f in summarizing if f.done()]:
+                        topic = summarizing.pop(future)
                         try:
-                            # Process results as they complete
-                            for future in concurrent.futures.as_completed(
-                                futures, timeout=0.1
-                            ):
-                                if future in completed:
-                                    continue
+                            future.result()
+                            self.call_back(
+                                {"action": "summarize_sites_complete", "topic": topic.id}
+                            )
+                        except Exception:
+                            traceback.print_exc()
 
-                                if self.stop:
-                                    raise DeepResearcher.StopResearch(
-                                        "Research was manually stopped."
-                                    )
+                    if planner is not None and planner.done():
+                        planner.result()  # raises StopResearch & planning errors
+                        planner = None
 
-                                completed.add(future)
-                                try:
-                                    future.result()  # Wait for any exceptions
-                                except Exception:
-                                    traceback.print_exc()
-                        except concurrent.futures.TimeoutError:
-                            # No futures completed during this 0.1s window; check self.stop again
+                    can_plan = not over_budget and plans < max_plans
+                    if planner is None and not summarizing:
+                        if unplanned_since is None or not can_plan:
+                            if not researching:
+                                break  # nothing left to research or plan
+                            continue
+                        if researching and (
+                            time.monotonic() - unplanned_since
+                            < config.RESEARCH_PLANNER_MAX_STALENESS
+                        ):
+                            continue  # give the topics being fetched a moment
+
+                        tc = self.topic.count_tokens(
+                            exact_token_count, (9_00_000, 1_86_000)
+                        )
+                        if tc > 9_00_000 and not compress:  # 0.9 million
+                            # summarized on the summary lane, the planner runs once
+                            # they are done & the topics being fetched meanwhile are
+                            # summarized as they finish
+                            compress = True
+                            busy = {topic.id for topic in researching.values()}
+                            pending = [self.topic]
+                            while pending:
+                                topic = pending.pop()
+                                pending.extend(topic.sub_topics)
+                                if topic.id not in busy:
+                                    self.call_back(
+                                        {"action": "summarize_sites", "topic": topic.id}
+                                    )
+                                    future = summary_lane.submit(
+                                        self._summarize_topic_content, topic
+                                    )
+                                    summarizing[future] = topic
+                            continue
+                        if tc > 9_00_000:  # still, after summarizing
+                            over_budget = True
                             continue
 
-                # Check if we've reached the maximum topic depth
-                current_depth += 1
-                if current_depth >= (self.max_topics or float("inf")):
-                    break
-
-                if self.stop:
-                    raise DeepResearcher.StopResearch()
-
-                # Analyze and add new topics after completing current batch
-                tc = (
-                    utils.retry(
-                        exceptions=utils.network_errors,
-                        ignore_exceptions=utils.ignore_network_error,
-                    )(global_shares["client"].models.count_tokens)(
-                        model="gemini-2.0-flash",
-                        contents=[
-                            types.Content(
-                                role="user",
-                                parts=[types.Part(text=self.topic.for_ai())],
-                            )
-                        ],
-                    ).total_tokens
-                    or 0
-                )
-                if tc > 9_00_000:  # 0.9 million
-                    self.summarize_sites(self.topic)
-                    tc = (
-                        utils.retry(
-                            exceptions=utils.network_errors,
-                            ignore_exceptions=utils.ignore_network_error,
-                        )(global_shares["client"].models.count_tokens)(
-                            model="gemini-2.0-flash",
-                            contents=[
-                                types.Content(
-                                    role="user",
-                                    parts=[types.Part(text=self.topic.for_ai())],
-                                )
-                            ],
-                        ).total_tokens
-                        or 0
-                    )
-                if tc > 9_00_000:
-                    break
-                thinking_id = str(uuid.uuid4())
-                self.call_back({"action": "start_thinking", "id": thinking_id})
-                self.analyse_add_topic(tc < 1_86_000, thinking_id)
+                        plans += 1
+                        unplanned_since = None
+                        thinking_id = str(uuid.uuid4())
+                        self.call_back({"action": "start_thinking", "id": thinking_id})
+                        planner = planner_lane.submit(
+                            self.analyse_add_topic, tc < 1_86_000, thinking_id
+                        )
         except DeepResearcher.StopResearch:
             pass  # Dont care abot how much reacsher has complited
 
@@ -55,7 +55,9 @@ class CodeExecutionEnvironment:
             tuple[str, str, int]: A tuple containing stdout, stderr, and the return code.
         """
         if not global_shares["take_permision"](
-            f"Permission for running following command: `{command}`"
+            f"Permission for running following command: `{command}`",
+            action="run_command",
+            target=command,
         ):
             raise PermisionError("User Declined Permission to run command.")
         result = subprocess.run(
@@ -78,7 +80,9 @@ class CodeExecutionEnvironment:
             content (Optional[str]): The content to write to the file.
         """
         if not global_shares["take_permision"](
-            f"Permission for Creating file: `{relative_path}`"
+            f"Permission for Creating file: `{relative_path}`",
+            action="create_file",
+            target=relative_path,
         ):
             raise PermisionError("User Declined Permission to create file.")
         full_path: pathlib.Path = space_path / relative_path
@@ -94,7 +98,9 @@ class CodeExecutionEnvironment:
             relative_path (str): The relative path to the folder.
         """
         if not global_shares["take_permision"](
-            f"Permission for Creating folder: `{relative_path}`"
+            f"Permission for Creating folder: `{relative_path}`",
+            action="create_folder",
+            target=relative_path,
         ):
             raise PermisionError("User Declined Permission to create folder.")
         full_path: pathlib.Path = space_path / relative_path
@@ -109,7 +115,9 @@ class CodeExecutionEnvironment:
             relative_path (str): The relative path to the file.
         """
         if not global_shares["take_permision"](
-            f"Permission for Deleting file: `{relative_path}`"
+            f"Permission for Deleting file: `{relative_path}`",
+            action="delete_file",
+            target=relative_path,
         ):
             raise PermisionError("User Declined Permission to delete file.")
         full_path: pathlib.Path = space_path / relative_path
@@ -124,7 +132,9 @@ class CodeExecutionEnvironment:
             relative_path (str): The relative path to the folder.
         """
         if not global_shares["take_permision"](
-            f"Permission for Deleting folder: `{relative_path}`"
+            f"Permission for Deleting folder: `{relative_path}`",
+            action="delete_folder",
+            target=relative_path,
         ):
             raise PermisionError("User Declined Permission to delete folder")
         full_path: pathlib.Path = space_path / relative_path
@@ -142,7 +152,9 @@ class CodeExecutionEnvironment:
             str: The process ID.
         """
         if not global_shares["take_permision"](
-            f"Permission for running background command: `{command}`"
+            f"Permission for running background command: `{command}`",
+            action="run_command_background",
+            target=command,
         ):
             raise PermisionError("User Declined Permission to run background command")
         process_id: str = str(uuid.uuid4())
@@ -204,7 +216,9 @@ class CodeExecutionEnvironment:
             input_str (str): The input string to send.
         """
         if not global_shares["take_permision"](
-            f"Permission for sending input to process: `{process_id}`"
+            f"Permission for sending input to process: `{process_id}`",
+            action="send_stdin",
+            target=process_id,
         ):
             raise PermisionError("User Declined Permission to send input")
         if process_id not in CodeExecutionEnvironment.processes:
@@ -265,7 +279,9 @@ class CodeExecutionEnvironment:
             process_id (str): The ID of the process.
         """
         if not global_shares["take_permision"](
-            f"Permission for killing process: `{process_id}`"
+            f"Permission for killing process: `{process_id}`",
+            action="kill_process",
+            target=process_id,
         ):
             raise PermisionError("User Declined Permission to kill process")
         if process_id not in CodeExecutionEnvironment.processes:
@@ -284,7 +300,9 @@ class CodeExecutionEnvironment:
             process_id (str): The ID of the process.
         """
         if not global_shares["take_permision"](
-            f"Permission for sending Ctrl+C to process: `{process_id}`"
+            f"Permission for sending Ctrl+C to process: `{process_id}`",
+            action="send_ctrl_c",
+            target=process_id,
         ):
             raise PermisionError("User Declined Permission to send Ctrl+C")
         if process_id not in CodeExecutionEnvironment.processes:
@@ -308,7 +326,9 @@ class CodeExecutionEnvironment:
             Optional[str]: File content.
         """
         if not global_shares["take_permision"](
-            f"Permission for reading file: `{relative_path}`"
+            f"Permission for reading file: `{relative_path}`",
+            action="read_file",
+            target=relative_path,
         ):
             raise PermisionError("User Declined Permission to read file")
         full_path: pathlib.Path = space_path / relative_path
@@ -326,7 +346,9 @@ class CodeExecutionEnvironment:
             content (str): The content to write to the file.
         """
         if not global_shares["take_permision"](
-            f"Permission for writing file: `{relative_path}`"
+            f"Permission for writing file: `{relative_path}`",
+            action="write_file",
+            target=relative_path,
         ):
             raise PermisionError("User Declined Permission to write file")
         full_path: pathlib.Path = space_path / relative_path
@@ -1,7 +1,5 @@
 # webfetch.py
 import utils
-from firecrawl import FirecrawlApp
-import config
 
 
 def FetchWebsite(url: str) -> str:
@@ -14,10 +12,7 @@ def FetchWebsite(url: str) -> str:
     Returns:
         str: The Markdown format of the website.
     """
-    app = FirecrawlApp(api_key=config.FIRECRAWL_API, api_url=config.FIRECRAWL_ENDPOINT)
-    scrape_result = utils.retry(
-        exceptions=utils.network_errors, ignore_exceptions=utils.ignore_network_error
-    )(utils.FetchLimiter()(app.scrape_url))(
+    scrape_result = utils.scrape_url(
         url,
         params={
             "formats": ["markdown"],
@@ -27,4 +22,6 @@ def FetchWebsite(url: str) -> str:
             "removeBase64Images": True,
         },
     )
+    if not scrape_result:
+        return f"Failed to fetch {url}"
     return scrape_result["markdown"]
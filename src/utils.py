@@ -1,11 +1,25 @@
+import asyncio
+import collections
+import concurrent.futures
 import functools
+import inspect
 import http.client
+import re
 import ssl
 import threading
 import time
 import traceback
 import socket
-from typing import Callable, Optional, ParamSpec, TypeVar, TypedDict, Any
+from typing import (
+    Callable,
+    NotRequired,
+    Optional,
+    ParamSpec,
+    TypeVar,
+    TypedDict,
+    Any,
+    cast,
+)
 from duckduckgo_search import DDGS
 from duckduckgo_search.exceptions import DuckDuckGoSearchException
 import google.auth.exceptions
@@ -17,6 +31,7 @@ import urllib3.connection
 import httpx
 
 import config
+from pagecache import pages
 
 R = TypeVar("R")
 P = ParamSpec("P")
@@ -96,6 +111,7 @@ def retry(
        - Retries up to `max_retries` times for *any* exception, counting each towards the limit.
 
     Uses exponential backoff. The backoff duration increases based on the number of *counted* retry attempts.
+    Coroutine functions are retried the same way, sleeping with `asyncio.sleep`.
     For exceptions specified in the `exceptions` tuple, the backoff time uses the delay associated with the *last counted* attempt.
 
     Args:
@@ -105,6 +121,81 @@ def retry(
     """
 
     def decorator_retry(func: Callable[P, R]) -> Callable[P, R]:
+        def handle_failure(e: Exception, attempt: int, back_off: float) -> tuple[int, float]:
+            """Returns the new number of counted attempts & the backoff, re-raises `e` if out of retries."""
+            should_increment_attempt = False
+            should_ignore_and_retry = False
+
+            if exceptions:  # Specific exceptions provided
+                if isinstance(e, exceptions) and not isinstance(e, ignore_exceptions):
+                    # It's an exception we ignore for counting purposes but still retry
+                    print(
+                        f"Attempt failed with ignored exception {type(e).__name__}: {e}. Retrying (attempt count {attempt} remains unchanged)..."
+                    )
+                    should_ignore_and_retry = True
+                else:
+                    # It's an exception we count
+                    print(
+                        f"Attempt {attempt + 1} failed with counted exception {type(e).__name__}: {e}. Retrying..."
+                    )
+                    should_increment_attempt = True
+            else:  # No specific exceptions, count all
+                print(f"Attempt {attempt + 1} failed: {e}. Retrying...")
+                should_increment_attempt = True
+
+            # Decide on action based on flags
+            if should_increment_attempt:
+                attempt += 1
+                if attempt >= max_retries:
+                    print(
+                        f"Max counted retries ({max_retries}) reached for {func.__name__}. Raising exception."
+                    )
+                    traceback.print_exc()
+                    raise e  # Re-raise the last counted exception
+
+                # Calculate backoff based on *new* counted attempts
+                # Use attempt-1 because attempt was just incremented
+                backoff_time = min(delay * (back_off), 128)
+                print(f"Waiting {backoff_time:.2f} seconds before next attempt...")
+                return attempt, backoff_time
+
+            elif should_ignore_and_retry:
+                # Calculate backoff based on the *current* number of counted attempts (or initial delay if 0)
+                # This prevents rapid retries for ignored exceptions but doesn't escalate delay based on them.
+                backoff_time = min(delay * (back_off), 128)
+                print(
+                    f"Waiting {backoff_time:.2f} seconds before next attempt (ignored exception)..."
+                )
+                return attempt, backoff_time
+            else:
+                # This state should not be reachable given the logic above.
+                # If an exception occurs, either `exceptions` is empty (increment=True),
+                # or `exceptions` is provided and `e` is in it (ignore=True),v
+                # or `exceptions` is provided and `e` is not in it (increment=True).
+                # If reached, raise the original error to avoid silent failure/infinite loop.
+                print(
+                    f"Internal retry logic error for exception {type(e).__name__}. Raising."
+                )
+                traceback.print_exc()
+                raise e
+
+        if inspect.iscoroutinefunction(func):
+            # same retries for coroutines, backing off without blocking the event loop
+            @functools.wraps(func)
+            async def async_wrapper_retry(*args: P.args, **kwargs: P.kwargs):
+                attempt = 0  # Number of *counted* attempts
+                back_off = 0.5
+                while attempt < max_retries:
+                    back_off *= 2
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        attempt, backoff_time = handle_failure(e, attempt, back_off)
+                    await asyncio.sleep(backoff_time)
+                raise RuntimeError("Unreachable code reached")  # just for type checker
+
+            return async_wrapper_retry  # type: ignore
+
         @functools.wraps(func)
         def wrapper_retry(*args: P.args, **kwargs: P.kwargs) -> R:
             attempt = 0  # Number of *counted* attempts
@@ -114,65 +205,8 @@ def retry(
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    should_increment_attempt = False
-                    should_ignore_and_retry = False
-
-                    if exceptions:  # Specific exceptions provided
-                        if isinstance(e, exceptions) and not isinstance(
-                            e, ignore_exceptions
-                        ):
-                            # It's an exception we ignore for counting purposes but still retry
-                            print(
-                                f"Attempt failed with ignored exception {type(e).__name__}: {e}. Retrying (attempt count {attempt} remains unchanged)..."
-                            )
-                            should_ignore_and_retry = True
-                        else:
-                            # It's an exception we count
-                            print(
-                                f"Attempt {attempt + 1} failed with counted exception {type(e).__name__}: {e}. Retrying..."
-                            )
-                            should_increment_attempt = True
-                    else:  # No specific exceptions, count all
-                        print(f"Attempt {attempt + 1} failed: {e}. Retrying...")
-                        should_increment_attempt = True
-
-                    # Decide on action based on flags
-                    if should_increment_attempt:
-                        attempt += 1
-                        if attempt >= max_retries:
-                            print(
-                                f"Max counted retries ({max_retries}) reached for {func.__name__}. Raising exception."
-                            )
-                            traceback.print_exc()
-                            raise e  # Re-raise the last counted exception
-
-                        # Calculate backoff based on *new* counted attempts
-                        # Use attempt-1 because attempt was just incremented
-                        backoff_time = min(delay * (back_off), 128)
-                        print(
-                            f"Waiting {backoff_time:.2f} seconds before next attempt..."
-                        )
-                        time.sleep(backoff_time)
-
-                    elif should_ignore_and_retry:
-                        # Calculate backoff based on the *current* number of counted attempts (or initial delay if 0)
-                        # This prevents rapid retries for ignored exceptions but doesn't escalate delay based on them.
-                        backoff_time = min(delay * (back_off), 128)
-                        print(
-                            f"Waiting {backoff_time:.2f} seconds before next attempt (ignored exception)..."
-                        )
-                        time.sleep(backoff_time)
-                    else:
-                        # This state should not be reachable given the logic above.
-                        # If an exception occurs, either `exceptions` is empty (increment=True),
-                        # or `exceptions` is provided and `e` is in it (ignore=True),v
-                        # or `exceptions` is provided and `e` is not in it (increment=True).
-                        # If reached, raise the original error to avoid silent failure/infinite loop.
-                        print(
-                            f"Internal retry logic error for exception {type(e).__name__}. Raising."
-                        )
-                        traceback.print_exc()
-                        raise e
+                    attempt, backoff_time = handle_failure(e, attempt, back_off)
+                time.sleep(backoff_time)
             # If the loop finishes because attempt >= max_retries, the exception was raised inside.
             # If max_retries is 0, the loop never runs. Function might return None implicitly.
             # If max_retries is inf, the loop only exits via return or an unhandled exception (already raised).
@@ -213,6 +247,7 @@ class ScrapedData(TypedDict):
     warning: Optional[str]
     changeTracking: Optional[dict[str, Any]]
     url_display_info: dict[str, str]
+    cached: NotRequired[bool]  # answered from `pagecache.pages`
 
 
 class FireFetcher:
@@ -277,8 +312,23 @@ class FireFetcher:
         print(response.json())
         raise requests.exceptions.HTTPError(f"HTTP {response.status_code}")
 
+    def __call__(
+        self, url: str, params: dict[str, Any], cache: bool = True
+    ) -> Optional[ScrapedData]:
+        """Scrapes `url` with Firecrawl, reusing the page from `pagecache.pages` if cached."""
+        if cache:
+            cached = pages.get(url, params)
+            if cached is not None:
+                cached["cached"] = True
+                return cast(ScrapedData, cached)
+        # `_make_request` adds the url to the params it is given
+        data = self._scrape(url, dict(params))
+        if data and cache:
+            pages.put(url, params, cast(dict[str, Any], data))
+        return data
+
     @retry(exceptions=(APICreditsOver,))
-    def __call__(self, url: str, params: dict[str, Any]) -> Optional[ScrapedData]:
+    def _scrape(self, url: str, params: dict[str, Any]) -> Optional[ScrapedData]:
         # Select best API based on credits and usage
         api_info = self._get_best_api()
         if not api_info:
@@ -524,6 +574,26 @@ class FireFetcher:
 scrape_url = FireFetcher()
 
 
+# Words left out of search cache keys, "how to use asyncio" & "use asyncio" share results
+_SEARCH_STOPWORDS = frozenset(
+    (
+        "a an and are as at be by for from how i in is it of on or that the this to"
+        " what when where which who why with"
+    ).split()
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key of a search query, insensitive to case, whitespace, punctuation & stopwords.
+
+    Word order & repeated words are kept, they change what the search engine returns.
+    """
+    words = re.findall(r"\w+", query.lower())
+    kept = [word for word in words if word not in _SEARCH_STOPWORDS]
+    return " ".join(kept or words)
+
+
 class DDGSearcher:
     _instance: Optional["DDGSearcher"] = None
     _lock = threading.Lock()
@@ -553,9 +623,85 @@ class DDGSearcher:
             self.last_request_time = 0
             self.min_request_interval = 1.0  # Minimum seconds between requests
 
+            # Results by normalized query & options: (time, max_results, results), oldest first
+            self.cache: collections.OrderedDict[
+                str, tuple[float, int | None, list[dict[str, str]]]
+            ] = collections.OrderedDict()
+            # Searches being made by key, shared by threads asking the same query meanwhile
+            self.in_flight: dict[str, tuple[int | None, concurrent.futures.Future]] = {}
+            self._cache_lock = threading.Lock()
+            self.cache_hits = 0
+            self.coalesced = 0
+            self.searches = 0
+
             self.initialized = True
 
     def __call__(self, query: str, max_results: int | None = 10, **kwargs):
+        """
+        Searches DuckDuckGo, reusing the results of the same (normalized) query if made
+        less than `config.SEARCH_CACHE_TTL` seconds ago or still being made.
+        """
+        key = f"{normalize_query(query)}\0{sorted(kwargs.items())}"
+        with self._cache_lock:
+            cached = self.cache.get(key)
+            if (
+                cached is not None
+                and time.time() - cached[0] < config.SEARCH_CACHE_TTL
+                and self._covers(cached[1], max_results)
+            ):
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached[2][:max_results]
+            in_flight = self.in_flight.get(key)
+            if in_flight is not None and self._covers(in_flight[0], max_results):
+                self.coalesced += 1
+                future = in_flight[1]
+            else:
+                future = concurrent.futures.Future()
+                self.in_flight[key] = (max_results, future)
+                in_flight = None
+        if in_flight is not None:
+            return future.result()[:max_results]
+
+        try:
+            results = self._search(query, max_results, **kwargs)
+        except BaseException as e:
+            with self._cache_lock:
+                self._done(key, future)
+            future.set_exception(e)
+            raise
+        with self._cache_lock:
+            self.searches += 1
+            if results:
+                self.cache[key] = (time.time(), max_results, results)
+                self.cache.move_to_end(key)
+                while len(self.cache) > config.SEARCH_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+            self._done(key, future)
+        future.set_result(results)
+        return results
+
+    def _done(self, key: str, future: concurrent.futures.Future) -> None:
+        """Stops sharing a finished search, called with `_cache_lock` held."""
+        # a search for more results of the same query may have taken its place
+        if key in self.in_flight and self.in_flight[key][1] is future:
+            del self.in_flight[key]
+
+    @staticmethod
+    def _covers(cached: int | None, wanted: int | None) -> bool:
+        """Whether results fetched with `max_results=cached` hold those for `wanted`."""
+        return cached is None or (wanted is not None and wanted <= cached)
+
+    def stats(self) -> dict[str, int]:
+        with self._cache_lock:
+            return {
+                "entries": len(self.cache),
+                "hits": self.cache_hits,
+                "coalesced": self.coalesced,
+                "searches": self.searches,
+            }
+
+    def _search(self, query: str, max_results: int | None, **kwargs):
         with self._request_semaphore:
             # Wait if all backends are rate-limited
             if self._all_backends_limited():
@@ -573,7 +719,7 @@ class DDGSearcher:
 
             # If both are rate-limited, wait and retry once more
             self._wait_for_backends()
-            return self(query, max_results, **kwargs)
+            return self._search(query, max_results, **kwargs)
 
     def _all_backends_limited(self) -> bool:
         """Check if all backends are currently rate-limited."""
@@ -4,6 +4,7 @@
 let fileContents = []; // Global variable to store file information (name and content)
 let fileId = null; // Unique ID for the video being uploaded
 const CHUNK_SIZE = 512 * 1024; // 0.5MB chunks
+const MAX_CHUNKS_IN_FLIGHT = 4; // Unacknowledged chunks allowed before waiting (back-pressure)
 let messages = [];
 let chats = {};
 let current_chat_id = "main";
@@ -369,6 +370,11 @@ function renderStep(stepData, index, container, functionId) {
   } else if (stepData.type === "search") {
     const searchCollapseId = `search-collapse-${functionId}-${stepData.id || index}`;
     stepTitle += ` for Topic: <span class="text-info fst-italic">${stepData.topic_name || "Unknown"}</span>`;
+    const cachedUrlsInStep = new Set(stepData.cached_urls || []);
+    const fetchedCount = (stepData.fetched_urls || []).length;
+    if (cachedUrlsInStep.size > 0 && fetchedCount > 0) {
+      stepTitle += ` <span class="badge bg-secondary ms-1" title="Pages reused from the page cache">${cachedUrlsInStep.size}/${fetchedCount} cached (${Math.round((100 * cachedUrlsInStep.size) / fetchedCount)}%)</span>`;
+    }
     stepTitle += `
           <button class="btn btn-sm btn-outline-secondary ms-2 py-0 px-1" type="button" data-bs-toggle="collapse" data-bs-target="#${searchCollapseId}" aria-expanded="true" aria-controls="${searchCollapseId}">
               <i class="bi bi-arrows-collapse"></i> Details
@@ -404,7 +410,7 @@ function renderStep(stepData, index, container, functionId) {
 
         if (fetchedUrlsInStep.has(item) || fetchedUrlsPreviously.has(item)) {
           statusClass = "fetched";
-          tooltipText = "Fetched";
+          tooltipText = cachedUrlsInStep.has(item) ? "Fetched (cached)" : "Fetched";
         } else if (
           failedUrlsInStep.has(item) ||
           failedUrlsPreviously.has(item)
@@ -1701,21 +1707,17 @@ function deleteNotification(notificationId) {
 // --------------------------------------------------------------------------
 
 /**
- * Reads a file as Base64.
+ * Emits an event & resolves with the server's acknowledgement.
  */
-function readFileAsBase64(file) {
+function emitWithAck(event, data) {
   return new Promise((resolve, reject) => {
-    const reader = new FileReader();
-
-    reader.onload = () => {
-      resolve(reader.result.split(",")[1]);
-    };
-
-    reader.onerror = () => {
-      reject(reader.error);
-    };
-
-    reader.readAsDataURL(file);
+    socket.emit(event, data, (ack) => {
+      if (ack && ack.error) {
+        reject(new Error(ack.error));
+      } else {
+        resolve(ack);
+      }
+    });
   });
 }
 
@@ -1734,28 +1736,59 @@ function generateUUID() {
   });
 }
 
-/**
- * Uploads video in chunks.
- */
-const uploadFileInChunks = async (base64File, filename, fileId) => {
-  const totalChunks = Math.ceil(base64File.length / CHUNK_SIZE);
+// Uploads the server is still storing, by id, settled by its `upload_done` event.
+const pendingUploads = new Map();
 
-  socket.emit("start_upload_file", fileId);
+socket.on("upload_done", ({ id, error }) => {
+  const pending = pendingUploads.get(id);
+  if (!pending) return;
+  pendingUploads.delete(id);
+  if (error) {
+    pending.reject(new Error(error));
+  } else {
+    pending.resolve();
+  }
+});
 
-  for (let i = 0; i < totalChunks; i++) {
-    const start = i * CHUNK_SIZE;
-    const end = Math.min(start + CHUNK_SIZE, base64File.length);
-    const chunk = base64File.substring(start, end);
+/**
+ * Uploads a file in binary chunks, waiting for acks when too many are in flight,
+ * & resolves once the server stored it.
+ */
+const uploadFileInChunks = async (blob, fileId) => {
+  await emitWithAck("start_upload_file", {
+    id: fileId,
+    size: blob.size,
+    type: blob.type,
+    filename: blob.name,
+  });
 
-    socket.emit("upload_file_chunck", {
+  const inFlight = new Set();
+  for (let offset = 0; offset < blob.size; offset += CHUNK_SIZE) {
+    const chunk = await blob.slice(offset, offset + CHUNK_SIZE).arrayBuffer();
+    const ack = emitWithAck("upload_file_chunck", {
       id: fileId,
       chunck: chunk,
-      idx: i,
-      filename: filename,
+      offset: offset,
     });
+    inFlight.add(ack);
+    ack.finally(() => inFlight.delete(ack)).catch(() => {});
+    if (inFlight.size >= MAX_CHUNKS_IN_FLIGHT) {
+      await Promise.race(inFlight);
+    }
   }
+  await Promise.all(inFlight);
 
-  socket.emit("end_upload_file", fileId);
+  // registered before ending the upload, `upload_done` may arrive before its ack
+  const stored = new Promise((resolve, reject) =>
+    pendingUploads.set(fileId, { resolve, reject })
+  );
+  stored.catch(() => {}); // rethrown by the await below
+  try {
+    await emitWithAck("end_upload_file", fileId);
+    await stored;
+  } finally {
+    pendingUploads.delete(fileId);
+  }
 };
 
 // ==========================================================================
@@ -2602,7 +2635,19 @@ function initializeTooltips(element) {
 // --- Attachment Display ---
 // --------------------------------------------------------------------------
 
-function displayAttachmentInRightPanel(file) {
+/**
+ * URL of the attachment bytes served from the content-addressed blob store.
+ */
+function attachmentUrl(file) {
+  if (file.blob) {
+    // Not uploaded yet, preview the local file
+    file.url ??= URL.createObjectURL(file.blob);
+    return file.url;
+  }
+  return `/attachment/${file.hash}?type=${encodeURIComponent(file.type)}`;
+}
+
+async function displayAttachmentInRightPanel(file) {
   const rightPanel = document.querySelector(".right-panel");
   const attachmentDisplayArea = document.getElementById(
     "attachment-display-area",
@@ -2617,7 +2662,7 @@ function displayAttachmentInRightPanel(file) {
   if (file.type.startsWith("image/")) {
     const img = document.createElement("img");
     img.classList.add("img-attachment-panel"); // Add class for styling in right panel
-    img.src = `data:${file.type};base64,${file.content}`;
+    img.src = attachmentUrl(file);
     img.alt = file.filename;
     attachmentDisplayArea.appendChild(img);
 
@@ -2627,7 +2672,7 @@ function displayAttachmentInRightPanel(file) {
     const video = document.createElement("video");
     video.classList.add("vid-attachment-panel"); // Add class for styling in right panel
     video.controls = true; // Enable controls in right panel
-    video.src = `data:${file.type};base64,${file.content}`;
+    video.src = attachmentUrl(file);
     video.type = file.type;
     attachmentDisplayArea.appendChild(video);
 
@@ -2638,7 +2683,7 @@ function displayAttachmentInRightPanel(file) {
     const textContainer = document.createElement("div");
     textContainer.classList.add("text-attachment-panel");
 
-    let textContent = atob(file.content); // Decode base64 to text
+    let textContent = await (await fetch(attachmentUrl(file))).text();
 
     if (file.type != "text/plain" && file.type.startsWith("text")) {
       highlightedCode = null;
@@ -2674,20 +2719,19 @@ function createDownloadButton(file, textContent = null) {
   );
   downloadButton.classList.add("btn", "btn-secondary");
   downloadButton.addEventListener("click", () => {
-    let blob;
+    let url;
     if (textContent !== null) {
-      blob = new Blob([textContent], { type: file.type });
+      url = URL.createObjectURL(new Blob([textContent], { type: file.type }));
     } else {
-      blob = base64ToBlob(file.content, file.type);
+      url = attachmentUrl(file);
     }
-    const url = URL.createObjectURL(blob);
     const a = document.createElement("a");
     a.href = url;
     a.download = file.filename;
     document.body.appendChild(a); // Required for Firefox
     a.click();
     document.body.removeChild(a);
-    URL.revokeObjectURL(url);
+    if (textContent !== null) URL.revokeObjectURL(url);
   });
   return downloadButton;
 }
@@ -2704,21 +2748,6 @@ function createCopyButton(textContent) {
   return copyButton;
 }
 
-function base64ToBlob(base64Data, contentType) {
-  const byteCharacters = atob(base64Data);
-  const byteArrays = [];
-  for (let offset = 0; offset < byteCharacters.length; offset += 512) {
-    const slice = byteCharacters.slice(offset, offset + 512);
-    const byteNumbers = new Array(slice.length);
-    for (let i = 0; i < slice.length; i++) {
-      byteNumbers[i] = slice.charCodeAt(i);
-    }
-    const byteArray = new Uint8Array(byteNumbers);
-    byteArrays.push(byteArray);
-  }
-  return new Blob(byteArrays, { type: contentType });
-}
-
 /**
  * Creates an element to display attachments, now handling all file types
  * with preview for images/videos and icon+name for others.
@@ -2731,7 +2760,7 @@ function createAttachmentElement(file) {
   if (file.type.startsWith("image/")) {
     const img = document.createElement("img");
     img.classList.add("img-attachment");
-    img.src = `data:${file.type};base64,${file.content}`;
+    img.src = attachmentUrl(file);
     img.alt = file.filename;
     fileBoxContent.appendChild(img); // Append image to fileBoxContent
   } else if (file.type.startsWith("video/")) {
@@ -2742,7 +2771,7 @@ function createAttachmentElement(file) {
     video.muted = true;
     video.autoplay = true;
     video.loop = true;
-    video.src = `data:${file.type};base64,${file.content}`;
+    video.src = attachmentUrl(file);
     video.type = file.type;
     fileBoxContent.appendChild(video); // Append video to fileBoxContent
   } else {
@@ -2761,7 +2790,7 @@ function createAttachmentElement(file) {
     const fileInfoSpan = document.createElement("span");
     fileInfoSpan.classList.add("attachment-fileinfo");
     const fileType = file.type.split("/")[0].toUpperCase();
-    const fileSizeKB = ((file.content.length * (3 / 4)) / 1024).toFixed(2);
+    const fileSizeKB = (file.size / 1024).toFixed(2);
     fileInfoSpan.textContent = `${fileType} · ${fileSizeKB} KB`;
 
     fileBoxContent.appendChild(iconFilenameWrapper);
@@ -4188,7 +4217,7 @@ const sendMessage = async () => {
     for (let i = 0; i < fileContents.length; i++) {
       const fileData = fileContents[i];
       fileId = generateUUID(); // Generate a unique ID for this file upload session
-      await uploadFileInChunks(fileData.content, fileData.name, fileId);
+      await uploadFileInChunks(fileData.blob, fileId);
       filesData.push({
         filename: fileData.name,
         type: fileData.type,
@@ -4235,12 +4264,18 @@ const sendMessage = async () => {
 socket.on("connect", () => {
   current_chat_id = localStorage.getItem("current_chat_id") || "main"; // Load last chat ID
   socket.emit("get_chat_history"); // Request history on connect
+  // settings live in the server side session of this connection, send them again
   updateModelSelection();
   updateToolsSelection();
+  const budgetSlider = document.getElementById("thinking-budget-slider");
+  if (budgetSlider) {
+    socket.emit("set_thinking_budget", parseInt(budgetSlider.value, 10));
+  }
 });
 
 socket.on("chat_update", (data) => {
   messages = data.messages || [];
+  msgSeqs = {}; // Messages still streaming are resynced on their next delta
   chats = (data.chats || []).reduce((acc, chat) => {
     acc[chat.id] = chat;
     return acc;
@@ -4263,7 +4298,35 @@ socket.on("chat_update", (data) => {
   updateChatDisplay(messages);
 });
 
-socket.on("updated_msg", (msg) => {
+// Applies the operations of a `msg_delta` (see `src/delta.py`) to a message in place
+function applyDeltaOps(target, ops) {
+  for (const { op, path, ...args } of ops) {
+    if (op === "set" && path.length === 0) {
+      return args.value; // The whole message is replaced
+    }
+    let node = target;
+    for (const key of op === "extend" || op === "truncate"
+      ? path
+      : path.slice(0, -1)) {
+      node = node[key];
+    }
+    const key = path[path.length - 1];
+    if (op === "set") {
+      node[key] = args.value;
+    } else if (op === "del") {
+      delete node[key];
+    } else if (op === "append_text") {
+      node[key] += args.text;
+    } else if (op === "extend") {
+      node.push(...args.items);
+    } else if (op === "truncate") {
+      node.length = args.length;
+    }
+  }
+  return target;
+}
+
+function replaceMessage(msg) {
   // Update the message in the global list
   const index = messages.findIndex((m) => m.id === msg.id);
   if (index !== -1) {
@@ -4274,16 +4337,41 @@ socket.on("updated_msg", (msg) => {
   }
   // Then let updateMessageInChatBox handle rendering if it's relevant
   updateMessageInChatBox(msg);
+}
+
+let msgSeqs = {}; // message id -> seq of the last applied `msg_delta`
+const pendingResyncs = new Set(); // message ids waiting for a full snapshot
+
+socket.on("msg_delta", (delta) => {
+  if (delta.snapshot) {
+    msgSeqs[delta.id] = delta.seq;
+    pendingResyncs.delete(delta.id);
+    replaceMessage(delta.snapshot);
+    return;
+  }
+  const msg = messages.find((m) => m.id === delta.id);
+  if (!msg || msgSeqs[delta.id] !== delta.seq - 1) {
+    // Missed a delta (or joined mid-stream), ask for the full message once
+    if (!pendingResyncs.has(delta.id)) {
+      pendingResyncs.add(delta.id);
+      socket.emit("resync_msg", delta.id);
+    }
+    return;
+  }
+  msgSeqs[delta.id] = delta.seq;
+  replaceMessage(applyDeltaOps(msg, delta.ops));
 });
 socket.on("add_message", (msg) => {
   // Add message to the global list first
   messages.push(msg);
+  msgSeqs[msg.id] = 0; // Deltas of the new message start after this
   // Then let addMessageToChatBox decide whether to render it based on current_chat_id
   addMessageToChatBox(msg);
 });
 socket.on("delete_message", (messageId) => {
   // Remove from the global list
   messages = messages.filter((msg) => msg.id !== messageId);
+  delete msgSeqs[messageId];
   // Remove from the DOM if it exists
   const msgDiv = document.getElementById(messageId);
   if (msgDiv) {
@@ -4305,7 +4393,7 @@ socket.on("delete_notification", (notificationId) => {
   deleteNotification(notificationId);
 });
 
-socket.on("take_permission", (msg) => {
+socket.on("take_permission", (request) => {
   // 1. Find the last message in the chat box
   const chatBox = document.getElementById("chat-box");
   const lastMessageDiv = chatBox.lastElementChild;
@@ -4326,11 +4414,12 @@ socket.on("take_permission", (msg) => {
     "mt-2",
     "p-1" /* Reduced padding */,
   );
+  permissionRequestDiv.dataset.requestId = request.id;
 
   // 3. Create the message text, Agree button, and Deny button
   const messageText =
     document.createElement("span"); /* Use span for inline display */
-  messageText.textContent = msg; // Or msg.content if it's an object
+  messageText.textContent = request.msg;
   messageText.classList.add(
     "me-2",
     "text-muted",
@@ -4345,11 +4434,27 @@ socket.on("take_permission", (msg) => {
     "toggle-button",
   ); /* Use toggle-button style */
   agreeButton.addEventListener("click", () => {
-    socket.emit("set_permission", true);
+    socket.emit("set_permission", { id: request.id, value: true });
     permissionRequestDiv.remove();
   });
   permissionRequestDiv.appendChild(agreeButton);
 
+  if (request.rememberable) {
+    // approves every operation of this kind for the rest of the session
+    const alwaysButton = document.createElement("button");
+    alwaysButton.textContent = "Always";
+    alwaysButton.classList.add("btn", "btn-sm", "toggle-button");
+    alwaysButton.addEventListener("click", () => {
+      socket.emit("set_permission", {
+        id: request.id,
+        value: true,
+        remember: true,
+      });
+      permissionRequestDiv.remove();
+    });
+    permissionRequestDiv.appendChild(alwaysButton);
+  }
+
   const denyButton = document.createElement("button");
   denyButton.textContent = "Deny";
   denyButton.classList.add(
@@ -4358,7 +4463,7 @@ socket.on("take_permission", (msg) => {
     "toggle-button",
   ); /* Use toggle-button style */
   denyButton.addEventListener("click", () => {
-    socket.emit("set_permission", false);
+    socket.emit("set_permission", { id: request.id, value: false });
     permissionRequestDiv.remove();
   });
   permissionRequestDiv.appendChild(denyButton);
@@ -4367,6 +4472,14 @@ socket.on("take_permission", (msg) => {
   lastMessageDiv.appendChild(permissionRequestDiv);
 });
 
+socket.on("permission_expired", (requestId) => {
+  document
+    .querySelectorAll(".permission-request")
+    .forEach((div) => {
+      if (div.dataset.requestId === requestId) div.remove();
+    });
+});
+
 // --------------------------------------------------------------------------
 // --- Right Panel Functions ---
 // --------------------------------------------------------------------------
@@ -4572,23 +4685,13 @@ const handleFileInputChange = async () => {
         supportedVidTypes.includes(file.type) ||
         file.type === "application/pdf"
       ) {
-        try {
-          let content = await readFileAsBase64(file);
-          fileContents.push({
-            name: file.name,
-            filename: file.name,
-            type: file.type,
-            content: content,
-          });
-        } catch (error) {
-          console.error("Error reading file:", error);
-          fileContents.push({
-            name: file.name,
-            filename: file.name,
-            type: file.type,
-            content: `Error reading file: ${error.message}`,
-          });
-        }
+        fileContents.push({
+          name: file.name,
+          filename: file.name,
+          type: file.type,
+          size: file.size,
+          blob: file, // Read in chunks only when uploading
+        });
       } else {
         addMessageToChatBox(document.getElementById("chat-box"), {
           role: "model",
@@ -0,0 +1,212 @@
+# test_concurrent_chats.py
+"""
+Several browser tabs generating at once, through the Socket.IO handlers.
+
+A stub Gemini server streams a reply naming the model it was asked for, so a turn that
+used another tab's settings shows up in its chat.
+
+    python -m unittest discover tests
+"""
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "bench"))
+
+import _env
+
+_env.setup()
+
+import asyncio
+import json
+import threading
+import time
+import unittest
+
+import config
+
+config.model_RPM_map.clear()
+
+from google import genai
+from google.genai import types
+
+import main
+import ratelimit
+import session
+
+TABS = ("Medium20", "Small20", "Medium15", "Small15", "Large15")
+CHUNKS = 10
+CHUNK_DELAY = 0.05
+
+
+class StubServer:
+    """Streams `CHUNKS` parts of "<model> " per request, counting the concurrent requests."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._serve_one, "127.0.0.1", 0)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def _serve_one(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        headers = (await reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+        length = 0
+        for line in headers[1:]:
+            name, _, value = line.partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        await reader.readexactly(length)
+        # POST /v1beta/models/<model>:streamGenerateContent?alt=sse HTTP/1.1
+        model = headers[0].split()[1].split("/models/")[1].split(":")[0]
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n"
+            )
+            for idx in range(CHUNKS):
+                await asyncio.sleep(CHUNK_DELAY)
+                candidate: dict = {
+                    "content": {"parts": [{"text": f"{model} "}], "role": "model"},
+                    "index": 0,
+                }
+                if idx == CHUNKS - 1:
+                    candidate["finishReason"] = "STOP"
+                writer.write(f"data: {json.dumps({'candidates': [candidate]})}\r\n\r\n".encode())
+                await writer.drain()
+        finally:
+            self.active -= 1
+            writer.close()
+
+
+class ConcurrentChatsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer()
+        main.client = genai.Client(
+            api_key="test",
+            http_options=types.HttpOptions(base_url=f"http://127.0.0.1:{cls.server.port}"),
+        )
+        ratelimit.limiter.install(main.client)
+
+    def connect(self, model: str):
+        client = main.socketio.test_client(main.app)
+        self.addCleanup(client.disconnect)
+        client.emit("set_models", model)
+        client.emit("set_tools", [])
+        return client
+
+    def wait_for_replies(self, chat_ids: list[str], timeout: float = 30) -> dict[str, str]:
+        """The text of the finished model reply of every chat."""
+        deadline = time.monotonic() + timeout
+        while True:
+            replies = {}
+            for chat_id in chat_ids:
+                for msg in main.chat_history.chat_messages(chat_id):
+                    if msg.role == "model" and not msg.processing and msg.content:
+                        replies[chat_id] = msg.content[-1].text or ""
+            if len(replies) == len(chat_ids) or time.monotonic() > deadline:
+                return replies
+            time.sleep(0.05)
+
+    def test_simultaneous_send_message(self):
+        clients, chat_ids = [], []
+        for model in TABS:
+            chat = main.Chat(f"tab {model}")
+            main.chat_history.add_chat(chat)
+            clients.append(self.connect(model))
+            chat_ids.append(chat.id)
+        requests = self.server.requests
+
+        barrier = threading.Barrier(len(TABS))
+        handler_times: list[float] = []
+
+        def send(client, chat_id: str):
+            barrier.wait()
+            start = time.monotonic()
+            client.emit("send_message", {"message": "hi", "chat_id": chat_id})
+            handler_times.append(time.monotonic() - start)
+
+        threads = [
+            threading.Thread(target=send, args=args) for args in zip(clients, chat_ids)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        replies = self.wait_for_replies(chat_ids)
+        elapsed = time.monotonic() - start
+
+        # every turn used its own tab's model & landed in its own chat
+        for model, chat_id in zip(TABS, chat_ids):
+            self.assertEqual(replies.get(chat_id), f"{config.Models[model].value} " * CHUNKS)
+        self.assertEqual(self.server.requests - requests, len(TABS))
+        # the handlers return at once & the turns stream at the same time
+        self.assertLess(max(handler_times), 0.5)
+        self.assertEqual(self.server.max_active, len(TABS))
+        self.assertLess(elapsed, 2 * CHUNKS * CHUNK_DELAY + 1)
+
+    def test_turns_of_one_chat_run_in_order(self):
+        chat = main.Chat("one chat")
+        main.chat_history.add_chat(chat)
+        first, second = self.connect("Medium20"), self.connect("Small20")
+        first.emit("send_message", {"message": "first", "chat_id": chat.id})
+        second.emit("send_message", {"message": "second", "chat_id": chat.id})
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            messages = list(main.chat_history.chat_messages(chat.id))
+            if len(messages) == 4 and not messages[-1].processing:
+                break
+            time.sleep(0.05)
+        self.assertEqual(
+            [(msg.role, msg.content[-1].text) for msg in messages],
+            [
+                ("user", "first"),
+                ("model", f"{config.Models.Medium20.value} " * CHUNKS),
+                ("user", "second"),
+                ("model", f"{config.Models.Small20.value} " * CHUNKS),
+            ],
+        )
+
+    def test_permissions_are_per_request(self):
+        tabs = [self.connect("Medium20") for _ in range(3)]
+        sids = [main.socketio.server.manager.sid_from_eio_sid(tab.eio_sid, "/") for tab in tabs]
+        answers: dict[int, bool] = {}
+
+        def ask(idx: int):
+            ctx = session.GenerationContext(f"chat {idx}", sids[idx], session.Settings())
+            with session.generation(ctx):
+                answers[idx] = main.take_permission(f"may tab {idx}?")
+
+        threads = [threading.Thread(target=ask, args=(idx,)) for idx in range(len(tabs))]
+        for thread in threads:
+            thread.start()
+        requests = {}
+        deadline = time.monotonic() + 10
+        while len(requests) < len(tabs) and time.monotonic() < deadline:
+            for idx, tab in enumerate(tabs):
+                for event in tab.get_received():
+                    if event["name"] == "take_permission":
+                        requests[idx] = event["args"][0]
+            time.sleep(0.01)
+        # each tab is only asked its own question
+        self.assertEqual(
+            {idx: request["msg"] for idx, request in requests.items()},
+            {idx: f"may tab {idx}?" for idx in range(len(tabs))},
+        )
+        # answered out of order, each answer only resolves its own request
+        for idx in (2, 0, 1):
+            tabs[idx].emit("set_permission", {"id": requests[idx]["id"], "value": idx != 1})
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(answers, {0: True, 1: False, 2: True})
+
+
+if __name__ == "__main__":
+    unittest.main()